@@ -4,6 +4,7 @@ from fastapi.responses import HTMLResponse, RedirectResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
 from pathlib import Path
 from .routes import (
     stores_router,
@@ -14,12 +15,29 @@ from .routes import (
     sync_router,
     reports_router
 )
+from .routes.sync import stop_writer
 from src.database.database_sqlite import SQLiteDatabase
+from src.sync.sync_engine import AsyncSyncEngine
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # In store mode, sync with the main server in the background of this process
+    engine = AsyncSyncEngine.from_env()
+    app.state.sync_engine = engine
+    if engine is not None:
+        await engine.start()
+    try:
+        yield
+    finally:
+        if engine is not None:
+            await engine.stop()
+        stop_writer()
 
 app = FastAPI(
     title="PharmaHub API",
     description="API for PharmaHub medical store management system",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Configure CORS
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Request, Form, HTTPException, Depends
+from fastapi import APIRouter, Request, Form, HTTPException, Depends, Query
 from fastapi.responses import HTMLResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
 from src.database.database_sqlite import SQLiteDatabase
@@ -24,6 +24,21 @@ async def list_customers(
         "store_id": store_id
     })
 
+@router.get("/lookup")
+async def lookup_customers(
+    store_id: int,
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(10, ge=1, le=50),
+    db: SQLiteDatabase = Depends(get_db)
+):
+    customers = db.lookup_customer(store_id, q, limit=limit)
+    return {
+        "query": q,
+        "store_id": store_id,
+        "count": len(customers),
+        "customers": customers
+    }
+
 @router.post("/add")
 async def add_customer(
     name: str = Form(...),
@@ -1,6 +1,11 @@
-from fastapi import APIRouter, Request, Form, HTTPException, Depends
-from fastapi.responses import HTMLResponse, RedirectResponse
+import json
+import sqlite3
+import zipfile
+
+from fastapi import APIRouter, Request, Form, HTTPException, Depends, Query, UploadFile, File
+from fastapi.responses import HTMLResponse, RedirectResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
+from src.database.catalog_import import DEFAULT_CHUNK_SIZE, catalog_format, import_catalog
 from src.database.database_sqlite import SQLiteDatabase
 from datetime import datetime
 
@@ -25,6 +30,21 @@ async def list_medicines(
         "store_id": store_id
     })
 
+@router.get("/search")
+async def search_medicines(
+    q: str = Query(..., min_length=1, max_length=100),
+    store_id: int = None,
+    limit: int = Query(20, ge=1, le=100),
+    db: SQLiteDatabase = Depends(get_db)
+):
+    results = db.search_medicine(q, store_id=store_id, limit=limit)
+    return {
+        "query": q,
+        "store_id": store_id,
+        "count": len(results),
+        "results": results
+    }
+
 @router.post("/add")
 async def add_medicine(
     name: str = Form(...),
@@ -71,6 +91,38 @@ async def add_batch_medicines(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/import")
+def import_medicines(
+    file: UploadFile = File(...),
+    store_id: int = Form(...),
+    chunk_size: int = Form(DEFAULT_CHUNK_SIZE, gt=0, le=10000),
+    db: SQLiteDatabase = Depends(get_db)
+):
+    """Stream a CSV or XLSX supplier catalog into a store, upserting by barcode.
+
+    The response is newline-delimited JSON: one progress line per chunk
+    with running totals and that chunk's row errors, then a final line with
+    done set.
+    """
+    try:
+        fmt = catalog_format(file.filename)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    def progress():
+        last = {"rows": 0, "inserted": 0, "updated": 0, "failed": 0}
+        try:
+            for last in import_catalog(db.db_path, file.file, store_id, fmt, chunk_size,
+                                       reference=f"import:{file.filename}"):
+                yield json.dumps(last) + "\n"
+            yield json.dumps({"done": True, **{k: last[k] for k in ("rows", "inserted", "updated", "failed")}}) + "\n"
+        except (sqlite3.Error, ValueError, zipfile.BadZipFile) as e:
+            yield json.dumps({"done": False, "error": str(e)}) + "\n"
+        finally:
+            file.file.close()
+
+    return StreamingResponse(progress(), media_type="application/x-ndjson")
+
 @router.post("/{medicine_id}/update")
 async def update_medicine(
     medicine_id: int,
@@ -1,7 +1,8 @@
-from fastapi import APIRouter, Request, Form, HTTPException, Depends
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi import APIRouter, Request, Form, HTTPException, Depends, Query
+from fastapi.responses import HTMLResponse, RedirectResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from src.database.database_sqlite import SQLiteDatabase
+from src.database.purchase_export import EXPORT_FORMATS, export_filename, export_purchases
 from datetime import datetime
 
 router = APIRouter(prefix="/purchases", tags=["purchases"])
@@ -57,49 +58,56 @@ async def add_purchase(
 ):
     try:
         import json
-        items_list = json.loads(items)
-        
-        # Create purchase record
-        purchase_data = {
-            "CustomerID": customer_id,
-            "OperatorID": operator_id,
-            "StoreID": store_id,
-            "DateOfPurchase": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        }
-        
-        purchase_id = db.insert_purchase(purchase_data)
-        if not purchase_id:
+
+        # Stock is taken with conditional decrements in the same transaction as the purchase
+        try:
+            items_list = json.loads(items)
+            result = db.checkout_purchase(
+                store_id,
+                [{"medicine_id": item["medicine_id"], "quantity": item["quantity"]} for item in items_list],
+                customer_id=customer_id,
+                operator_id=operator_id
+            )
+        except (KeyError, TypeError, ValueError) as e:
+            raise HTTPException(status_code=400, detail=f"Invalid items: {e}")
+        if result is None:
             raise HTTPException(status_code=400, detail="Failed to create purchase")
-        
-        # Add purchase items and update stock
-        total_amount = 0
-        for item in items_list:
-            medicine = db.get_medicine({"MedicineID": item["medicine_id"]})
-            if not medicine:
-                raise HTTPException(status_code=404, detail=f"Medicine {item['medicine_id']} not found")
-            
-            medicine = medicine[0]
-            if medicine["StockQuantity"] < item["quantity"]:
-                raise HTTPException(status_code=400, detail=f"Insufficient stock for {medicine['Name']}")
-            
-            # Add purchase item
-            item_data = {
-                "PurchaseID": purchase_id,
-                "MedicineID": item["medicine_id"],
-                "Quantity": item["quantity"]
-            }
-            db.insert_purchase_item(item_data)
-            
-            # Update stock
-            new_quantity = medicine["StockQuantity"] - item["quantity"]
-            db.update_medicine(item["medicine_id"], {"StockQuantity": new_quantity})
-            
-            total_amount += item["quantity"] * medicine["Price"]
-        
+        if result["failed"]:
+            raise HTTPException(
+                status_code=409,
+                detail={"message": "Insufficient stock", "failed": result["failed"]}
+            )
+
         return RedirectResponse(url=f"/purchases?store_id={store_id}", status_code=303)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# Declared before /{purchase_id} so "export" is not taken for a purchase ID
+@router.get("/export")
+def export_purchase_lines(
+    format: str = Query("csv", regex=f"^({'|'.join(EXPORT_FORMATS)})$"),
+    store_id: int = None,
+    date_from: str = Query(None, regex=r"^\d{4}-\d{2}-\d{2}$"),
+    date_to: str = Query(None, regex=r"^\d{4}-\d{2}-\d{2}$"),
+    compress: bool = True,
+    db: SQLiteDatabase = Depends(get_db)
+):
+    """Stream purchases joined with their line items as CSV (gzipped by default) or Parquet."""
+    try:
+        pieces = export_purchases(db.db_path, format, compress, store_id, date_from, date_to)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    filename = export_filename(format, compress, store_id, date_from, date_to)
+    if format == 'parquet':
+        media_type = "application/vnd.apache.parquet"
+    else:
+        media_type = "application/gzip" if compress else "text/csv"
+    return StreamingResponse(pieces, media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
 @router.get("/{purchase_id}", response_class=HTMLResponse)
 async def get_purchase_details(
     request: Request,
@@ -1,7 +1,9 @@
-from fastapi import APIRouter, Request, Form, HTTPException, Depends
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi import APIRouter, Request, Form, HTTPException, Depends, Query
+from fastapi.responses import HTMLResponse, RedirectResponse, Response
 from fastapi.templating import Jinja2Templates
+from starlette.concurrency import run_in_threadpool
 from src.database.database_sqlite import SQLiteDatabase
+from src.utils.qr_codes import QR_BOX_SIZE, store_qr_png
 from datetime import datetime
 
 router = APIRouter(prefix="/stores", tags=["stores"])
@@ -94,6 +96,26 @@ async def get_store_dashboard(
         "recent_activities": recent_purchases
     })
 
+@router.get("/{store_id}/qr.png")
+async def get_store_qr_code(
+    request: Request,
+    store_id: int,
+    size: int = Query(QR_BOX_SIZE, ge=1, le=40),
+    db: SQLiteDatabase = Depends(get_db)
+):
+    store = db.get_store({"StoreID": store_id})
+    if not store:
+        raise HTTPException(status_code=404, detail="Store not found")
+
+    # Rendering is CPU bound, keep it off the event loop
+    base_url = str(request.base_url)
+    png, etag = await run_in_threadpool(store_qr_png, store_id, base_url, size)
+
+    headers = {"Cache-Control": "public, max-age=604800", "ETag": etag}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=png, media_type="image/png", headers=headers)
+
 @router.get("/{store_id}/medicines", response_class=HTMLResponse)
 async def get_store_medicines(
     request: Request,
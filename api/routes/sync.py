@@ -1,8 +1,17 @@
-from fastapi import APIRouter, Request, Form, HTTPException, Depends, Header
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi import APIRouter, Request, Form, HTTPException, Depends, Header, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, HTMLResponse, RedirectResponse, Response
+from starlette.background import BackgroundTask
 from fastapi.templating import Jinja2Templates
 from src.database.database_sqlite import SQLiteDatabase
+from src.database.batch_apply import normalize_changes
+from src.database.sync_writer import SyncWriter, WriterBusyError
+from src.sync import codec
+from src.sync.notifier import ChangeNotifier
+from src.sync.sessions import StoreSessionRegistry
+from src.sync.snapshot import build_snapshot
 from src.utils.loggers import LoggerFactory
+import hmac
 import jwt
 from datetime import datetime, timedelta
 from typing import List, Dict, Optional
@@ -21,10 +30,41 @@ SECRET_KEY = "your-secret-key"  # In production, use environment variable
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# Largest number of changes accepted in one /sync/push request
+MAX_PUSH_CHANGES = 10000
+
+# Longest wait of a /sync/subscribe request in seconds
+MAX_SUBSCRIBE_TIMEOUT = 60
+
 # Dependency to get database instance
 def get_db():
     return SQLiteDatabase('medical_store.db')
 
+_notifier = None
+_writer = None
+
+# Verified tokens and last-seen times of connected stores
+sessions = StoreSessionRegistry(SECRET_KEY, ALGORITHM)
+
+def get_notifier(db: SQLiteDatabase) -> ChangeNotifier:
+    """Return the process-wide ChangeLog notifier."""
+    global _notifier
+    if _notifier is None:
+        _notifier = ChangeNotifier(db.db_path)
+    return _notifier
+
+def get_writer(db: SQLiteDatabase) -> SyncWriter:
+    """Return the process-wide writer that applies every push."""
+    global _writer
+    if _writer is None:
+        _writer = SyncWriter(db.db_path)
+    return _writer
+
+def stop_writer() -> None:
+    """Commit the queued pushes and stop the writer thread (on shutdown)."""
+    if _writer is not None:
+        _writer.stop()
+
 def create_access_token(data: dict):
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -32,11 +72,28 @@ def create_access_token(data: dict):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def encoded_response(request: Request, payload: dict) -> Response:
+    """Encode a sync payload with the most compact encoding the client accepts."""
+    media_type = codec.negotiate(request.headers.get("accept"))
+    body, encoding = codec.encode_body(
+        payload, media_type, compress=codec.accepts_gzip(request.headers.get("accept-encoding"))
+    )
+    headers = {"Vary": "Accept, Accept-Encoding"}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type=media_type, headers=headers)
+
+def outbox_depth(request: Request) -> Optional[int]:
+    """Outbox depth a store reports in the X-Outbox-Depth header, if any."""
+    try:
+        return max(int(request.headers["x-outbox-depth"]), 0)
+    except (KeyError, ValueError):
+        return None
+
 async def verify_token(authorization: str = Header(...)):
     try:
         token = authorization.split(" ")[1]
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
+        return sessions.verify(token)
     except Exception as e:
         raise HTTPException(
             status_code=401,
@@ -51,14 +108,12 @@ async def connect_store(
     db: SQLiteDatabase = Depends(get_db)
 ):
     try:
-        # Verify store credentials
-        store = db.get_store({
-            "StoreID": store_id,
-            "StoreName": store_name,
-            "LicenseNumber": license_number
-        })
-        
-        if not store:
+        # Verify store credentials against the row found by primary key
+        store = db.get_store({"StoreID": store_id})
+        if not store or not (
+            hmac.compare_digest(str(store[0]["StoreName"]).encode(), store_name.encode())
+            and hmac.compare_digest(str(store[0]["LicenseNumber"]).encode(), license_number.encode())
+        ):
             raise HTTPException(status_code=401, detail="Invalid store credentials")
         
         # Generate access token
@@ -68,138 +123,255 @@ async def connect_store(
             "license_number": license_number
         }
         access_token = create_access_token(token_data)
+        sessions.register(store_id, store_name)
         
         return {"access_token": access_token, "token_type": "bearer"}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error connecting store: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/changes")
 async def get_changes(
-    last_sync: str = None,
+    request: Request,
+    cursor: int = Query(0, ge=0),
+    limit: int = Query(1000, ge=1, le=5000),
     token: dict = Depends(verify_token),
     db: SQLiteDatabase = Depends(get_db)
 ):
     try:
         store_id = token["store_id"]
-        changes = {
-            "medicines": [],
-            "customers": [],
-            "operators": [],
-            "purchases": []
-        }
-        
-        # Get changes since last sync
-        if last_sync:
-            last_sync_date = datetime.strptime(last_sync, "%Y-%m-%d %H:%M:%S")
-            
-            # Get medicine changes
-            medicines = db.get_medicine({"StoreID": store_id})
-            for medicine in medicines:
-                if datetime.strptime(medicine["LastModified"], "%Y-%m-%d %H:%M:%S") > last_sync_date:
-                    changes["medicines"].append(medicine)
-            
-            # Get customer changes
-            customers = db.get_customer({"StoreID": store_id})
-            for customer in customers:
-                if datetime.strptime(customer["LastModified"], "%Y-%m-%d %H:%M:%S") > last_sync_date:
-                    changes["customers"].append(customer)
-            
-            # Get operator changes
-            operators = db.get_operator({"StoreID": store_id})
-            for operator in operators:
-                if datetime.strptime(operator["LastModified"], "%Y-%m-%d %H:%M:%S") > last_sync_date:
-                    changes["operators"].append(operator)
-            
-            # Get purchase changes
-            purchases = db.get_purchase({"StoreID": store_id})
-            for purchase in purchases:
-                if datetime.strptime(purchase["DateOfPurchase"], "%Y-%m-%d %H:%M:%S") > last_sync_date:
-                    changes["purchases"].append(purchase)
-        
-        return changes
+        result = db.get_changes(store_id, cursor=cursor, limit=limit)
+        response = encoded_response(request, result)
+        await run_in_threadpool(
+            db.record_sync_activity, store_id, "pull", changes=len(result["changes"]),
+            bytes_out=len(response.body), cursor=cursor
+        )
+        return response
     except Exception as e:
         logger.error(f"Error getting changes: {str(e)}")
+        await run_in_threadpool(db.record_sync_activity, token["store_id"], "pull", error=str(e))
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/subscribe")
+async def subscribe_changes(
+    cursor: int = Query(0, ge=0),
+    timeout: float = Query(25, ge=0, le=MAX_SUBSCRIBE_TIMEOUT),
+    token: dict = Depends(verify_token),
+    db: SQLiteDatabase = Depends(get_db)
+):
+    """Long-poll until the store has changes after cursor or the timeout passes."""
+    try:
+        latest = await get_notifier(db).wait(token["store_id"], cursor, timeout)
+        return {"changed": latest > cursor, "cursor": latest}
+    except Exception as e:
+        logger.error(f"Error waiting for changes: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/bootstrap")
+async def get_bootstrap_manifest(
+    token: dict = Depends(verify_token),
+    db: SQLiteDatabase = Depends(get_db)
+):
+    try:
+        return db.get_bootstrap_manifest(token["store_id"])
+    except Exception as e:
+        logger.error(f"Error building bootstrap manifest: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/bootstrap/{table}")
+async def get_bootstrap_chunk(
+    table: str,
+    request: Request,
+    after: int = Query(0, ge=0),
+    limit: int = Query(1000, ge=1, le=5000),
+    token: dict = Depends(verify_token),
+    db: SQLiteDatabase = Depends(get_db)
+):
+    try:
+        chunk = db.get_table_chunk(token["store_id"], table, after_key=after, limit=limit)
+        chunk["table"] = table
+        chunk["checksum"] = codec.rows_checksum(chunk["columns"], chunk["rows"])
+        response = encoded_response(request, chunk)
+        await run_in_threadpool(db.record_sync_activity, token["store_id"], "pull", bytes_out=len(response.body))
+        return response
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error reading bootstrap chunk of {table}: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/snapshot")
+async def get_snapshot(
+    token: dict = Depends(verify_token),
+    db: SQLiteDatabase = Depends(get_db)
+):
+    """Download the store's rows as a gzip-compressed SQLite database."""
+    try:
+        snapshot = await run_in_threadpool(build_snapshot, db, token["store_id"])
+    except Exception as e:
+        logger.error(f"Error creating snapshot: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return FileResponse(
+        snapshot["path"],
+        media_type="application/gzip",
+        filename=f"store_{token['store_id']}.db.gz",
+        headers={
+            "X-Snapshot-SHA256": snapshot["sha256"],
+            "X-Snapshot-Cursor": str(snapshot["cursor"])
+        },
+        background=BackgroundTask(os.remove, snapshot["path"])
+    )
+
 @router.post("/push")
 async def push_changes(
-    changes: dict,
+    request: Request,
     token: dict = Depends(verify_token),
     db: SQLiteDatabase = Depends(get_db)
 ):
     try:
         store_id = token["store_id"]
-        
-        # Process medicine changes
-        for medicine in changes.get("medicines", []):
-            if "MedicineID" in medicine:
-                db.update_medicine(medicine["MedicineID"], medicine)
-            else:
-                medicine["StoreID"] = store_id
-                db.insert_medicine(medicine)
-        
-        # Process customer changes
-        for customer in changes.get("customers", []):
-            if "CustomerID" in customer:
-                db.update_customer(customer["CustomerID"], customer)
-            else:
-                customer["StoreID"] = store_id
-                db.insert_customer(customer)
-        
-        # Process operator changes
-        for operator in changes.get("operators", []):
-            if "OperatorID" in operator:
-                db.update_operator(operator["OperatorID"], operator)
-            else:
-                operator["StoreID"] = store_id
-                db.insert_operator(operator)
-        
-        # Process purchase changes
-        for purchase in changes.get("purchases", []):
-            if "PurchaseID" in purchase:
-                db.update_purchase(purchase["PurchaseID"], purchase)
-            else:
-                purchase["StoreID"] = store_id
-                db.insert_purchase(purchase)
-        
-        return {"status": "success", "message": "Changes synchronized successfully"}
+        body = await request.body()
+        try:
+            payload = codec.decode_body(
+                body,
+                request.headers.get("content-type"),
+                request.headers.get("content-encoding")
+            )
+        except codec.UnsupportedEncodingError as e:
+            raise HTTPException(status_code=415, detail=str(e))
+        except codec.BodyTooLargeError as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Malformed push body: {e}")
+        try:
+            changes = normalize_changes(payload)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Malformed push body: {e}")
+        if len(changes) > MAX_PUSH_CHANGES:
+            raise HTTPException(
+                status_code=413,
+                detail=f"At most {MAX_PUSH_CHANGES} changes can be pushed at once"
+            )
+
+        try:
+            # One writer serializes all pushes and commits them in groups
+            result = await get_writer(db).submit(
+                store_id, changes, bytes_in=len(body), outbox_depth=outbox_depth(request)
+            )
+        except WriterBusyError as e:
+            raise HTTPException(status_code=503, detail=f"Server busy: {e}", headers={"Retry-After": "1"})
+        # No notify(): a push only changes the pushing store's rows, which it already holds
+        return {
+            "status": "success" if not result["failed"] else "partial",
+            "applied": result["applied"],
+            "failed": result["failed"],
+            "conflicts": result["conflicts"],
+            "results": result["results"]
+        }
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error pushing changes: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/writer")
+async def get_writer_stats(token: dict = Depends(verify_token), db: SQLiteDatabase = Depends(get_db)):
+    """Queue depth, group commit sizes and queue wait times of the push writer."""
+    return get_writer(db).stats()
+
+@router.get("/sessions")
+async def get_store_sessions(
+    active_within: Optional[float] = Query(None, gt=0),
+    token: dict = Depends(verify_token)
+):
+    """Connected stores with their last-seen times, and token cache statistics."""
+    return {"sessions": sessions.sessions(active_within), "cache": sessions.stats()}
+
+@router.get("/engine")
+async def get_sync_engine_status(request: Request, token: dict = Depends(verify_token)):
+    """State of the background sync engine when running in store mode."""
+    engine = getattr(request.app.state, "sync_engine", None)
+    if engine is None:
+        raise HTTPException(status_code=404, detail="Sync engine is not running")
+    return engine.status()
+
+@router.post("/engine/trigger")
+async def trigger_sync(request: Request, token: dict = Depends(verify_token)):
+    """Start a sync now instead of waiting for the next interval."""
+    engine = getattr(request.app.state, "sync_engine", None)
+    if engine is None:
+        raise HTTPException(status_code=404, detail="Sync engine is not running")
+    engine.notify()
+    return {"status": "scheduled"}
+
 @router.get("/status")
 async def get_sync_status(
     token: dict = Depends(verify_token),
     db: SQLiteDatabase = Depends(get_db)
 ):
+    """Sync state of the calling store, answered from counters kept on write."""
     try:
         store_id = token["store_id"]
-        store = db.get_store({"StoreID": store_id})
-        
-        if not store:
+        status = db.get_store_sync_status(store_id)
+
+        if status is None:
             raise HTTPException(status_code=404, detail="Store not found")
-        
-        # Get last sync time
-        last_sync = store[0].get("LastSyncTime", "Never")
-        
-        # Get sync statistics
-        medicines = db.get_medicine({"StoreID": store_id})
-        customers = db.get_customer({"StoreID": store_id})
-        operators = db.get_operator({"StoreID": store_id})
-        purchases = db.get_purchase({"StoreID": store_id})
-        
+
+        counts = status["RowCounts"]
+        last_sync = max(filter(None, (status.get("LastPullAt"), status.get("LastPushAt"))), default="Never")
         return {
             "store_id": store_id,
-            "store_name": store[0]["StoreName"],
+            "store_name": status["StoreName"],
             "last_sync": last_sync,
             "statistics": {
-                "total_medicines": len(medicines),
-                "total_customers": len(customers),
-                "total_operators": len(operators),
-                "total_purchases": len(purchases)
+                "total_medicines": counts["Medicine"],
+                "total_customers": counts["Customer"],
+                "total_operators": counts["Operator"],
+                "total_purchases": counts["Purchase"]
+            },
+            "sync": {
+                "last_pull": status.get("LastPullAt"),
+                "last_push": status.get("LastPushAt"),
+                "cursor": status["PullCursor"],
+                "latest_seq": status["LatestSeq"],
+                "change_lag": status["ChangeLag"],
+                "outbox_depth": status.get("OutboxDepth"),
+                "pulls": status.get("Pulls", 0),
+                "pushes": status.get("Pushes", 0),
+                "changes_pulled": status.get("ChangesPulled", 0),
+                "changes_pushed": status.get("ChangesPushed", 0),
+                "bytes_in": status.get("BytesIn", 0),
+                "bytes_out": status.get("BytesOut", 0),
+                "pull_errors": status.get("PullErrors", 0),
+                "push_errors": status.get("PushErrors", 0),
+                "last_error": status.get("LastError"),
+                "last_error_at": status.get("LastErrorAt")
             }
         }
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error getting sync status: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/fleet")
+async def get_fleet_status(
+    sort: str = Query("lag"),
+    order: str = Query("desc", regex="^(asc|desc)$"),
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    token: dict = Depends(verify_token),
+    db: SQLiteDatabase = Depends(get_db)
+):
+    """Every store's sync lag, outbox depth and error counts, sortable."""
+    try:
+        stores = db.get_fleet_sync_status(sort, descending=order == "desc", limit=limit, offset=offset)
+        return {"sort": sort, "order": order, "stores": stores}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error getting fleet status: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
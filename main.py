@@ -7,10 +7,10 @@ import sys
 import argparse
 from datetime import datetime
 
-import qrcode
 import uvicorn
 from src.utils.loggers import LoggerFactory
-from src.sync.sync_manager import SyncManager
+from src.utils.qr_codes import generate_qr_codes, write_qr_code
+from src.sync import sync_engine
 
 # Add the current directory to the Python path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), ".")))
@@ -35,22 +35,29 @@ def get_local_ip() -> str:
 def generate_qr_code(url: str, filename: str):
     """Generate a QR code for the given URL and save it to the specified filename."""
     try:
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
-        )
-        qr.add_data(url)
-        qr.make(fit=True)
-        
-        img = qr.make_image(fill_color="black", back_color="white")
-        img.save(filename)
+        write_qr_code(url, filename)
         logger.info(f"QR code saved to {filename}")
     except Exception as e:
         logger.error(f"Error generating QR code: {e}")
         raise
 
+def generate_store_qr_codes(server_url: str):
+    """Generate QR codes for every store, skipping those whose URL is unchanged."""
+    from src.database.database_sqlite import SQLiteDatabase
+    db = SQLiteDatabase('medical_store.db')
+    stores = db.get_store()
+
+    qr_dir = os.path.join(base_dir, "static", "images", "qrcodes")
+    targets = {
+        f"store_{store['StoreID']}_qr.png": f"{server_url}/stores/{store['StoreID']}"
+        for store in stores
+    }
+    summary = generate_qr_codes(targets, qr_dir)
+    logger.info(
+        f"QR codes for {summary['total']} stores: {summary['generated']} generated, "
+        f"{summary['skipped']} unchanged in {summary['seconds']:.2f}s"
+    )
+
 def initialize_database():
     """Initialize the database with required data."""
     try:
@@ -65,7 +72,7 @@ def initialize_database():
         logger.error(f"Error during database initialization: {e}")
         return False
 
-def run_store_mode(store_id: str, server_url: str):
+def run_store_mode(store_id: str, server_url: str, store_name: str = None, license_number: str = None):
     """Run the application in store mode."""
     try:
         # Initialize local database
@@ -73,17 +80,16 @@ def run_store_mode(store_id: str, server_url: str):
             logger.error("Failed to initialize local database")
             sys.exit(1)
 
-        # Initialize sync manager
+        # The API process runs the sync engine as a lifespan task; uvicorn
+        # may start it in a reloader subprocess, so pass settings by environment
         local_db_path = os.path.join(base_dir, "results", f"store_{store_id}.db")
-        sync_manager = SyncManager(store_id, server_url, local_db_path)
-
-        # Start sync loop in a separate thread
-        import threading
-        sync_thread = threading.Thread(
-            target=sync_manager.start_sync_loop,
-            daemon=True
-        )
-        sync_thread.start()
+        os.environ[sync_engine.ENV_STORE_ID] = str(store_id)
+        os.environ[sync_engine.ENV_SERVER_URL] = server_url
+        os.environ[sync_engine.ENV_LOCAL_DB] = local_db_path
+        if store_name:
+            os.environ[sync_engine.ENV_STORE_NAME] = store_name
+        if license_number:
+            os.environ[sync_engine.ENV_LICENSE_NUMBER] = license_number
 
         # Start the store server
         host = "0.0.0.0"
@@ -95,7 +101,7 @@ def run_store_mode(store_id: str, server_url: str):
         logger.error(f"Error in store mode: {e}")
         sys.exit(1)
 
-def run_server_mode(host: str, port: int):
+def run_server_mode(host: str, port: int, export_qr: bool = False):
     """Run the application in server mode."""
     try:
         # Initialize main database
@@ -103,25 +109,14 @@ def run_server_mode(host: str, port: int):
             logger.error("Failed to initialize main database")
             sys.exit(1)
 
-        # Generate QR codes for each store
-        from src.database.database_sqlite import SQLiteDatabase
-        db = SQLiteDatabase('medical_store.db')
-        stores = db.get_store()
-        
-        # Create qrcodes directory if it doesn't exist
-        qr_dir = os.path.join(base_dir, "static", "images", "qrcodes")
-        os.makedirs(qr_dir, exist_ok=True)
-        
         # Get the actual IP address to use in QR codes
         server_ip = get_local_ip()
         server_url = f"http://{server_ip}:{port}"
-        
-        # Generate QR code for each store
-        for store in stores:
-            store_url = f"{server_url}/stores/{store['StoreID']}"
-            qr_filename = os.path.join(qr_dir, f"store_{store['StoreID']}_qr.png")
-            generate_qr_code(store_url, qr_filename)
-            logger.info(f"Generated QR code for store {store['StoreID']}: {store['StoreName']}")
+
+        # Store QR codes are served by /stores/{store_id}/qr.png; PNG files
+        # are only written when explicitly requested (e.g. for printing)
+        if export_qr:
+            generate_store_qr_codes(server_url)
 
         # Start the main server
         logger.info(f"Starting main server on {server_url}")
@@ -131,7 +126,7 @@ def run_server_mode(host: str, port: int):
         logger.error(f"Error in server mode: {e}")
         sys.exit(1)
 
-def run_dev_mode():
+def run_dev_mode(export_qr: bool = False):
     """Run the application in development mode."""
     try:
         # Initialize database
@@ -139,25 +134,14 @@ def run_dev_mode():
             logger.error("Failed to initialize database")
             sys.exit(1)
 
-        # Generate QR codes for each store
-        from src.database.database_sqlite import SQLiteDatabase
-        db = SQLiteDatabase('medical_store.db')
-        stores = db.get_store()
-        
-        # Create qrcodes directory if it doesn't exist
-        qr_dir = os.path.join(base_dir, "static", "images", "qrcodes")
-        os.makedirs(qr_dir, exist_ok=True)
-        
         # Get the actual IP address to use in QR codes
         server_ip = get_local_ip()
         server_url = f"http://{server_ip}:8000"
-        
-        # Generate QR code for each store
-        for store in stores:
-            store_url = f"{server_url}/stores/{store['StoreID']}"
-            qr_filename = os.path.join(qr_dir, f"store_{store['StoreID']}_qr.png")
-            generate_qr_code(store_url, qr_filename)
-            logger.info(f"Generated QR code for store {store['StoreID']}: {store['StoreName']}")
+
+        # Store QR codes are served by /stores/{store_id}/qr.png; PNG files
+        # are only written when explicitly requested (e.g. for printing)
+        if export_qr:
+            generate_store_qr_codes(server_url)
 
         # Start the development server
         host = "0.0.0.0"
@@ -175,17 +159,21 @@ if __name__ == "__main__":
                       help="Run mode: dev, store, or server")
     parser.add_argument("--store-id", help="Store ID for store mode")
     parser.add_argument("--server-url", help="Main server URL for store mode")
+    parser.add_argument("--store-name", help="Registered store name for store mode")
+    parser.add_argument("--license-number", help="Store license number for store mode")
     parser.add_argument("--host", default="0.0.0.0", help="Host for server mode")
     parser.add_argument("--port", type=int, default=8000, help="Port for server mode")
+    parser.add_argument("--export-qr", action="store_true",
+                      help="Also write store QR code PNGs to static/images/qrcodes")
 
     args = parser.parse_args()
 
     if args.mode == "dev":
-        run_dev_mode()
+        run_dev_mode(args.export_qr)
     elif args.mode == "store":
         if not args.store_id or not args.server_url:
             logger.error("Store ID and server URL are required for store mode")
             sys.exit(1)
-        run_store_mode(args.store_id, args.server_url)
+        run_store_mode(args.store_id, args.server_url, args.store_name, args.license_number)
     elif args.mode == "server":
-        run_server_mode(args.host, args.port)
\ No newline at end of file
+        run_server_mode(args.host, args.port, args.export_qr)
\ No newline at end of file
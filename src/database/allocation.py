@@ -0,0 +1,100 @@
+"""First-expiry-first-out allocation of dispensed quantities to a medicine's batches."""
+
+
+import sqlite3
+from typing import Any, Dict, List
+
+
+def unbatched_stock(conn: sqlite3.Connection, store_id: int, medicine_ids: List[int]) -> Dict[int, int]:
+    """Return the stock of each medicine that is not held on any batch line.
+
+    This is StockQuantity less the RemainingQuantity of all the medicine's
+    batch lines in the store, expired ones included, i.e. stock received
+    before batches were tracked. Read it before the sale takes any stock.
+
+    Args:
+        conn: Connection with an open write transaction.
+        store_id: Store holding the stock.
+        medicine_ids: Medicines to report on.
+
+    Returns:
+        Units per medicine ID, never negative.
+    """
+    if not medicine_ids:
+        return {}
+    rows = conn.execute(f'''
+        SELECT m.MedicineID, m.StockQuantity - COALESCE((
+            SELECT SUM(bi.RemainingQuantity)
+            FROM BatchItem bi
+            JOIN Batch b ON b.BatchID = bi.BatchID
+            WHERE bi.MedicineID = m.MedicineID AND b.StoreID = m.StoreID
+        ), 0)
+        FROM Medicine m
+        WHERE m.StoreID = ? AND m.MedicineID IN ({', '.join('?' for _ in medicine_ids)})
+    ''', [store_id] + list(medicine_ids)).fetchall()
+    return {medicine_id: max(0, units) for medicine_id, units in rows}
+
+
+def allocate_fefo(conn: sqlite3.Connection, store_id: int, medicine_id: int, quantity: int,
+                  on_date: str, unbatched_available: int) -> Dict[str, Any]:
+    """Consume a quantity from a medicine's open batches, earliest expiry first.
+
+    Open batch lines are read through the partial (MedicineID, ExpiryDate)
+    index on BatchItem, which only holds lines with stock left, and the scan
+    stops as soon as the quantity is covered, so the cost depends on the
+    batches consumed rather than on how many are open. Batches that have
+    already expired on on_date are never dispensed: what the open batches
+    do not cover is taken from the unbatched stock, and anything beyond
+    that is reported as short rather than sold. Runs inside the caller's
+    transaction, which must be rolled back if the line is short.
+
+    Args:
+        conn: Connection with an open write transaction.
+        store_id: Store dispensing the medicine.
+        medicine_id: Medicine being dispensed.
+        quantity: Units to allocate.
+        on_date: Dispensing date as YYYY-MM-DD.
+        unbatched_available: Units of the medicine not held on any batch
+            line (see unbatched_stock), less what earlier lines took.
+
+    Returns:
+        Dictionary with batches, a list of {batch_item_id, batch_id,
+        expiry_date, quantity} in consumption order, unbatched, the units
+        taken from stock not held on any batch line, and short, the units
+        that only expired batches, or nothing, could cover.
+    """
+    rows = conn.execute('''
+        SELECT bi.BatchItemID, bi.BatchID, bi.ExpiryDate, bi.RemainingQuantity
+        FROM BatchItem bi
+        JOIN Batch b ON b.BatchID = bi.BatchID
+        WHERE bi.MedicineID = ? AND bi.ExpiryDate >= ? AND bi.RemainingQuantity > 0 AND b.StoreID = ?
+        ORDER BY bi.ExpiryDate, bi.BatchItemID
+    ''', (medicine_id, on_date, store_id))
+
+    batches = []
+    remaining = quantity
+    for batch_item_id, batch_id, expiry_date, available in rows:
+        if remaining <= 0:
+            break
+        taken = min(available, remaining)
+        batches.append({"batch_item_id": batch_item_id, "batch_id": batch_id,
+                        "expiry_date": expiry_date, "quantity": taken})
+        remaining -= taken
+    rows.close()
+
+    conn.executemany(
+        "UPDATE BatchItem SET RemainingQuantity = RemainingQuantity - ? WHERE BatchItemID = ?",
+        [(batch["quantity"], batch["batch_item_id"]) for batch in batches]
+    )
+    unbatched = min(remaining, max(0, unbatched_available))
+    return {"batches": batches, "unbatched": unbatched, "short": remaining - unbatched}
+
+
+def record_consumption(conn: sqlite3.Connection, purchase_item_id: int,
+                       batches: List[Dict[str, Any]]) -> None:
+    """Record which batches a purchase line was dispensed from."""
+    conn.executemany(
+        "INSERT INTO PurchaseItemBatch (PurchaseItemID, BatchItemID, Quantity) VALUES (?, ?, ?)",
+        [(purchase_item_id, batch["batch_item_id"], batch["quantity"]) for batch in batches]
+    )
+
@@ -0,0 +1,402 @@
+"""Batched, single-transaction application of store changes pushed during sync."""
+
+
+import sqlite3
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from src.database.ledger import record_stock_adjustments, snapshot_if_due
+
+# Tables a store may write through /sync/push, with their primary keys, in the
+# order inserts are applied (parents before children). Deletes run in reverse.
+SYNC_TABLES = OrderedDict([
+    ('Customer', 'CustomerID'),
+    ('Operator', 'OperatorID'),
+    ('Medicine', 'MedicineID'),
+    ('Purchase', 'PurchaseID'),
+    ('PurchaseItem', 'PurchaseItemID'),
+])
+
+# Columns of synced tables that point at another synced table's row, which
+# must belong to the pushing store as well
+FOREIGN_KEYS = {
+    'Purchase': (('CustomerID', 'Customer'), ('OperatorID', 'Operator')),
+    'PurchaseItem': (('PurchaseID', 'Purchase'), ('MedicineID', 'Medicine')),
+}
+
+# Older clients push {"medicines": [...], ...} with one list per table
+LEGACY_KEYS = {
+    'medicines': 'Medicine',
+    'customers': 'Customer',
+    'operators': 'Operator',
+    'purchases': 'Purchase',
+}
+
+OPERATIONS = ('insert', 'update', 'delete')
+
+# Stock changes travel as signed deltas recorded in the StockMovement ledger
+STOCK_DELTA = 'stock_delta'
+STOCK_MOVEMENT_REASONS = ('sale', 'receipt', 'return', 'adjustment', 'transfer')
+
+# Rows per executemany call
+DEFAULT_BATCH_SIZE = 500
+
+
+def normalize_changes(payload: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Turn a push payload into a flat list of {table, operation, data} changes.
+
+    Args:
+        payload: Body of a push request, either {"changes": [...]} as sent by
+            SyncManager or the legacy per-table lists.
+
+    Returns:
+        List of changes in the order they were made.
+
+    Raises:
+        ValueError: If the changes are not a list of objects with a table,
+            or a legacy table entry is not a list of rows.
+    """
+    if 'changes' in payload:
+        changes = payload['changes']
+        if not isinstance(changes, list):
+            raise ValueError("changes must be a list")
+        for index, change in enumerate(changes):
+            if not isinstance(change, dict) or not isinstance(change.get('table'), str):
+                raise ValueError(f"Change {index} must be an object with a table")
+        return list(changes)
+
+    changes = []
+    for key, table in LEGACY_KEYS.items():
+        rows = payload.get(key, [])
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            raise ValueError(f"{key} must be a list of objects")
+        for row in rows:
+            operation = 'update' if SYNC_TABLES[table] in row else 'insert'
+            changes.append({'table': table, 'operation': operation, 'data': row})
+    return changes
+
+
+def _chunks(items: List[Any], size: int) -> Iterable[List[Any]]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def validate_stock_movement(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Check a stock movement and return it with only the ledger columns.
+
+    Raises:
+        ValueError: If a required field is missing or malformed.
+    """
+    for field in ('MovementUID', 'MedicineID', 'Delta', 'Reason'):
+        if data.get(field) is None:
+            raise ValueError(f"stock_delta requires {field}")
+    if isinstance(data['Delta'], bool) or not isinstance(data['Delta'], int):
+        raise ValueError("stock_delta Delta must be an integer")
+    if data['Reason'] not in STOCK_MOVEMENT_REASONS:
+        raise ValueError(f"Unknown stock movement reason {data['Reason']!r}")
+    return {
+        'MovementUID': str(data['MovementUID']),
+        'MedicineID': data['MedicineID'],
+        'Delta': data['Delta'],
+        'Reason': data['Reason'],
+        'Reference': data.get('Reference'),
+    }
+
+
+def apply_stock_movements(conn: sqlite3.Connection, store_id: int,
+                          movements: List[Dict[str, Any]]) -> List[Optional[str]]:
+    """Record stock movements and add their deltas to Medicine.StockQuantity.
+
+    Each movement is inserted into the ledger keyed by its MovementUID, and
+    only a movement that was actually inserted changes the stock, so pushing
+    the same movement twice counts it once. The deltas of the new movements
+    are summed per medicine and applied with one relative UPDATE each, which
+    commutes with every other store's and head office's movements. A
+    balance snapshot is taken when enough movements have accumulated since
+    the last one. Runs inside the caller's transaction.
+
+    Args:
+        conn: Connection with an open transaction.
+        store_id: Store the movements belong to.
+        movements: Movements as returned by validate_stock_movement, with an
+            optional BatchItemID for movements of a known batch line.
+
+    Returns:
+        One entry per movement: None if it was recorded (now or before), or
+        the reason it was rejected.
+    """
+    errors: List[Optional[str]] = []
+    totals: Dict[int, int] = OrderedDict()
+    for movement in movements:
+        cursor = conn.execute(
+            """
+            INSERT INTO StockMovement (MovementUID, StoreID, MedicineID, Delta, Reason, Reference, BatchItemID)
+            SELECT ?, StoreID, MedicineID, ?, ?, ?, ? FROM Medicine WHERE MedicineID = ? AND StoreID = ?
+            ON CONFLICT(MovementUID) DO NOTHING
+            """,
+            (movement['MovementUID'], movement['Delta'], movement['Reason'], movement['Reference'],
+             movement.get('BatchItemID'), movement['MedicineID'], store_id)
+        )
+        if cursor.rowcount == 1:
+            totals[movement['MedicineID']] = totals.get(movement['MedicineID'], 0) + movement['Delta']
+            errors.append(None)
+        elif conn.execute("SELECT 1 FROM StockMovement WHERE MovementUID = ?",
+                          (movement['MovementUID'],)).fetchone():
+            # Already recorded by an earlier push whose acknowledgement was lost
+            errors.append(None)
+        else:
+            errors.append(f"Medicine {movement['MedicineID']} not found in store {store_id}")
+
+    conn.executemany(
+        "UPDATE Medicine SET StockQuantity = StockQuantity + ? WHERE MedicineID = ?",
+        [(delta, medicine_id) for medicine_id, delta in totals.items() if delta]
+    )
+    if totals:
+        snapshot_if_due(conn)
+    return errors
+
+
+class BatchApplier:
+    """Apply a push of store changes with executemany inside the caller's transaction.
+
+    Changes are grouped by table, operation and column set so each group runs
+    as a few executemany calls. Inserts are applied parents first, then
+    updates, then stock deltas, then deletes children first, keeping the
+    order of changes within each group. If a group fails, it is replayed row by row under
+    savepoints so a bad row is reported without losing its neighbours.
+    """
+
+    def __init__(self, conn: sqlite3.Connection, store_id: int, batch_size: int = DEFAULT_BATCH_SIZE):
+        """Initialize the applier.
+
+        Args:
+            conn: Connection with an open transaction.
+            store_id: Store the pushed changes belong to.
+            batch_size: Maximum number of rows per executemany call.
+        """
+        self.conn = conn
+        self.store_id = store_id
+        self.batch_size = batch_size
+        self._columns: Dict[str, set] = {}
+
+    def _table_columns(self, table: str) -> set:
+        if table not in self._columns:
+            rows = self.conn.execute(f"PRAGMA table_info({table})").fetchall()
+            self._columns[table] = {row[1] for row in rows}
+        return self._columns[table]
+
+    def _prepare(self, change: Dict[str, Any]) -> Tuple[Tuple[str, str, Tuple[str, ...]], Dict[str, Any]]:
+        """Validate a change and return its group key and row data."""
+        table = change.get('table')
+        operation = change.get('operation')
+        if not isinstance(change.get('data') or {}, dict):
+            raise ValueError("data must be an object")
+        data = dict(change.get('data') or {})
+
+        if operation == STOCK_DELTA:
+            if table != 'StockMovement':
+                raise ValueError(f"stock_delta is not supported on {table!r}")
+            return (table, operation, ()), validate_stock_movement(data)
+        if table not in SYNC_TABLES:
+            raise ValueError(f"Table {table!r} cannot be synced")
+        if operation not in OPERATIONS:
+            raise ValueError(f"Unknown operation {operation!r}")
+
+        key = SYNC_TABLES[table]
+        if operation in ('update', 'delete') and data.get(key) is None:
+            raise ValueError(f"{operation} on {table} requires {key}")
+
+        columns = self._table_columns(table)
+        if 'StoreID' in columns and operation == 'insert':
+            data['StoreID'] = self.store_id
+        if table == 'Customer':
+            # Derived from ContactInfo by the Customer triggers
+            data.pop('PhoneKey', None)
+
+        unknown = set(data) - columns
+        if unknown:
+            raise ValueError(f"Unknown columns for {table}: {', '.join(sorted(unknown))}")
+
+        if operation == 'delete':
+            data = {key: data[key]}
+        elif operation == 'update' and not set(data) - {key, 'StoreID'}:
+            raise ValueError(f"update on {table} has no columns to change")
+        return (table, operation, tuple(sorted(data))), data
+
+    def _statement(self, table: str, operation: str, columns: Tuple[str, ...]) -> Tuple[str, List[str]]:
+        """Build the SQL for a group and the order its parameters are bound in."""
+        key = SYNC_TABLES[table]
+        if 'StoreID' in self._table_columns(table):
+            scope = "StoreID = ?"
+        else:
+            scope = "PurchaseID IN (SELECT PurchaseID FROM Purchase WHERE StoreID = ?)"
+
+        # Rows may only point at the pushing store's rows; a NULL reference is left to the schema,
+        # except that line items may only be added to the pushing store's purchases
+        refs, ref_order = [], []
+        for column, parent in FOREIGN_KEYS.get(table, ()):
+            owned_ref = f"EXISTS (SELECT 1 FROM {parent} WHERE {SYNC_TABLES[parent]} = ? AND StoreID = ?)"
+            if operation == 'insert' and (table, column) == ('PurchaseItem', 'PurchaseID'):
+                refs.append(owned_ref)
+                ref_order += [column, '__store__']
+            elif column in columns:
+                refs.append(f"(? IS NULL OR {owned_ref})")
+                ref_order += [column, column, '__store__']
+
+        if operation == 'insert':
+            placeholders = ', '.join('?' for _ in columns)
+            order = list(columns)
+            if 'StoreID' in self._table_columns(table):
+                owned = f"{table}.StoreID = excluded.StoreID"
+            else:
+                owned = f"{table}.{scope}"
+            if refs:
+                sql = f"INSERT INTO {table} ({', '.join(columns)}) SELECT {placeholders} " \
+                      f"WHERE {' AND '.join(refs)}"
+                order += ref_order
+            else:
+                sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})"
+            updates = [c for c in columns if c != key]
+            if key in columns and updates:
+                # Pushes are retried after a lost acknowledgement, so inserts must be idempotent,
+                # but an ID that belongs to another store's row is a conflict, not an overwrite
+                sql += f" ON CONFLICT({key}) DO UPDATE SET " + ', '.join(f"{c} = excluded.{c}" for c in updates)
+                sql += f" WHERE {owned}"
+                if '?' in owned:
+                    order.append('__store__')
+            return sql, order
+
+        if operation == 'update':
+            updates = [c for c in columns if c not in (key, 'StoreID')]
+            sql = f"UPDATE {table} SET {', '.join(f'{c} = ?' for c in updates)} WHERE {key} = ? AND {scope}"
+            sql += ''.join(f" AND {ref}" for ref in refs)
+            return sql, updates + [key, '__store__'] + ref_order
+
+        sql = f"DELETE FROM {table} WHERE {key} = ? AND {scope}"
+        return sql, [key, '__store__']
+
+    def _conflict(self, table: str, data: Dict[str, Any]) -> str:
+        refs = [f"{parent} {data[column]}" for column, parent in FOREIGN_KEYS.get(table, ())
+                if data.get(column) is not None]
+        if 'StoreID' in self._table_columns(table):
+            owner = f"{table} {data.get(SYNC_TABLES[table])} belongs to another store"
+        else:
+            owner = f"Purchase {data.get('PurchaseID')} of {table} {data.get(SYNC_TABLES[table])} " \
+                    f"is not a purchase of store {self.store_id}"
+        if refs:
+            owner += f", or one of {', '.join(refs)} is not a row of store {self.store_id}"
+        return owner
+
+    def _params(self, order: List[str], data: Dict[str, Any]) -> List[Any]:
+        return [self.store_id if name == '__store__' else data.get(name) for name in order]
+
+    def apply(self, changes: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Apply changes and report the outcome of each one.
+
+        Args:
+            changes: Changes as returned by normalize_changes.
+
+        Returns:
+            Dictionary with applied, failed and conflicts counts and per-change
+            results, in the order the changes were given. An insert whose ID
+            belongs to another store's row is a conflict and leaves that row
+            untouched.
+        """
+        results: List[Dict[str, Any]] = [None] * len(changes)
+        groups: Dict[Tuple, List[Tuple[int, Dict[str, Any]]]] = OrderedDict()
+
+        for index, change in enumerate(changes):
+            try:
+                group_key, data = self._prepare(change)
+            except ValueError as e:
+                results[index] = {"index": index, "seq": change.get('seq'), "status": "error", "error": str(e)}
+                continue
+            groups.setdefault(group_key, []).append((index, data))
+
+        tables = list(SYNC_TABLES)
+        order = {
+            'insert': lambda g: (0, tables.index(g[0])),
+            'update': lambda g: (1, tables.index(g[0])),
+            STOCK_DELTA: lambda g: (2, 0),
+            'delete': lambda g: (3, -tables.index(g[0])),
+        }
+        # The ChangeLog triggers record the pushing store as the origin of what it writes
+        self.conn.execute("INSERT INTO SyncOrigin (StoreID) VALUES (?)", (self.store_id,))
+        try:
+            for group_key in sorted(groups, key=lambda g: order[g[1]](g)):
+                table, operation, columns = group_key
+                if operation == STOCK_DELTA:
+                    self._apply_stock_deltas(groups[group_key], changes, results)
+                    continue
+                sql, param_order = self._statement(table, operation, columns)
+                for chunk in _chunks(groups[group_key], self.batch_size):
+                    # An update that moves a row onto another store's rows must not pass as applied
+                    must_write = operation == 'insert' or any(
+                        column in columns for column, _ in FOREIGN_KEYS.get(table, ()))
+                    self._execute_chunk(sql, param_order, chunk, changes, results, must_write)
+                if table == 'Medicine' and 'StockQuantity' in columns:
+                    # Stock set outright is recorded in the ledger as an adjustment
+                    record_stock_adjustments(self.conn, [
+                        data['MedicineID'] for index, data in groups[group_key]
+                        if results[index]["status"] == "applied" and data.get('MedicineID') is not None
+                    ], f"sync:store{self.store_id}")
+        finally:
+            self.conn.execute("DELETE FROM SyncOrigin")
+
+        applied = sum(1 for r in results if r["status"] == "applied")
+        conflicts = sum(1 for r in results if r["status"] == "conflict")
+        return {"applied": applied, "failed": len(changes) - applied, "conflicts": conflicts, "results": results}
+
+    def _apply_stock_deltas(self, items: List[Tuple[int, Dict[str, Any]]],
+                            changes: List[Dict[str, Any]], results: List[Dict[str, Any]]) -> None:
+        self.conn.execute("SAVEPOINT sync_batch")
+        try:
+            errors = apply_stock_movements(self.conn, self.store_id, [data for _, data in items])
+            self.conn.execute("RELEASE sync_batch")
+        except sqlite3.Error as e:
+            self.conn.execute("ROLLBACK TO sync_batch")
+            self.conn.execute("RELEASE sync_batch")
+            errors = [str(e)] * len(items)
+        for (index, _), error in zip(items, errors):
+            result = {"index": index, "seq": changes[index].get('seq'), "status": "applied"}
+            if error:
+                result.update(status="error", error=error)
+            results[index] = result
+
+    def _execute_chunk(self, sql: str, param_order: List[str], chunk: List[Tuple[int, Dict[str, Any]]],
+                       changes: List[Dict[str, Any]], results: List[Dict[str, Any]],
+                       must_write: bool = False) -> None:
+        """Run a group chunk with one executemany, falling back to one row at a time.
+
+        With must_write set (inserts, and updates of foreign keys), every row
+        has to write: a row that writes nothing hit an ID owned by another
+        store, or pointed at one, and is reported as a conflict.
+        """
+        self.conn.execute("SAVEPOINT sync_batch")
+        try:
+            written = self.conn.executemany(sql, [self._params(param_order, data) for _, data in chunk]).rowcount
+            if not must_write or written == len(chunk):
+                self.conn.execute("RELEASE sync_batch")
+                for index, _ in chunk:
+                    results[index] = {"index": index, "seq": changes[index].get('seq'), "status": "applied"}
+                return
+        except sqlite3.Error:
+            pass
+        self.conn.execute("ROLLBACK TO sync_batch")
+        self.conn.execute("RELEASE sync_batch")
+
+        # Find the offending rows one at a time
+        for index, data in chunk:
+            self.conn.execute("SAVEPOINT sync_row")
+            try:
+                written = self.conn.execute(sql, self._params(param_order, data)).rowcount
+                self.conn.execute("RELEASE sync_row")
+                if must_write and written == 0:
+                    results[index] = {"index": index, "seq": changes[index].get('seq'), "status": "conflict",
+                                      "error": self._conflict(changes[index]['table'], data)}
+                else:
+                    results[index] = {"index": index, "seq": changes[index].get('seq'), "status": "applied"}
+            except sqlite3.Error as e:
+                self.conn.execute("ROLLBACK TO sync_row")
+                self.conn.execute("RELEASE sync_row")
+                results[index] = {"index": index, "seq": changes[index].get('seq'), "status": "error", "error": str(e)}
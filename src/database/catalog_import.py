@@ -0,0 +1,327 @@
+"""Streaming import of supplier catalogs from CSV or Excel into a store's medicines.
+
+Rows are read in fixed-size chunks, validated against MedicineCreate and
+upserted by Barcode, one transaction per chunk, so memory stays bounded by
+the chunk size whatever the size of the file. Run from the command line with
+
+    python -m src.database.catalog_import catalog.csv --store-id 1
+"""
+
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import uuid
+import zipfile
+from datetime import datetime
+from itertools import islice
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple, Union
+
+import pandas as pd
+from pydantic import ValidationError
+
+from src.database.batch_apply import apply_stock_movements
+from src.database.database_sqlite import SQLiteDatabase, next_id_sql
+from src.schemas.medicine import MedicineCreate
+from src.utils.loggers import LoggerFactory
+
+try:
+    import openpyxl
+    from openpyxl.utils.exceptions import InvalidFileException
+except ImportError:  # optional dependency
+    openpyxl = None
+    InvalidFileException = None
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+# MedicineCreate fields and the Medicine columns they are stored in
+CATALOG_COLUMNS = {
+    'name': 'Name',
+    'brand': 'Brand',
+    'batch_number': 'BatchNumber',
+    'expiry_date': 'ExpiryDate',
+    'price': 'Price',
+    'stock_quantity': 'StockQuantity',
+    'type': 'Type',
+    'requires_prescription': 'RequiresPrescription',
+    'schedule_category': 'ScheduleCategory',
+    'storage_location_id': 'StorageLocationID',
+}
+
+CATALOG_FORMATS = ('csv', 'xlsx')
+
+# Rows validated and written per transaction
+DEFAULT_CHUNK_SIZE = 1000
+
+# Barcodes looked up per query, below SQLite's bound parameter limit
+_LOOKUP_BATCH = 500
+
+
+def _header_key(header: Any) -> str:
+    return str(header).strip().lower().replace('_', '').replace(' ', '')
+
+
+# Headers may use the schema's field names or the table's column names
+_HEADERS = {_header_key(field): field for field in CATALOG_COLUMNS}
+_HEADERS.update({_header_key(column): field for field, column in CATALOG_COLUMNS.items()})
+_HEADERS['barcode'] = 'barcode'
+
+
+def catalog_format(filename: str) -> str:
+    """Guess a catalog's format from its file name.
+
+    Raises:
+        ValueError: If the extension is not one of CATALOG_FORMATS or its
+            reader is not installed.
+    """
+    extension = os.path.splitext(filename or '')[1].lower().lstrip('.')
+    if extension not in CATALOG_FORMATS:
+        raise ValueError(f"Unsupported catalog format {extension!r}, expected one of {', '.join(CATALOG_FORMATS)}")
+    if extension == 'xlsx' and openpyxl is None:
+        raise ValueError("Reading .xlsx catalogs requires the openpyxl package")
+    return extension
+
+
+def read_catalog(source: Union[str, BinaryIO], fmt: str,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[List[Tuple[int, Dict[str, Any]]]]:
+    """Read a catalog in chunks of (row number, raw row) pairs.
+
+    Row numbers count the header as row 1, as a spreadsheet shows them.
+    Empty cells are left out of the row.
+
+    Args:
+        source: Path or binary file object.
+        fmt: 'csv' or 'xlsx'.
+        chunk_size: Rows per chunk.
+
+    Raises:
+        ValueError: If the format is unknown, its reader is not installed or
+            the file is not a readable workbook.
+    """
+    if fmt == 'csv':
+        reader = pd.read_csv(source, chunksize=chunk_size, dtype=str, keep_default_na=False,
+                             skip_blank_lines=True)
+        row_number = 1
+        for frame in reader:
+            chunk = []
+            for record in frame.to_dict('records'):
+                row_number += 1
+                chunk.append((row_number, {k: v for k, v in record.items() if v.strip() != ''}))
+            yield chunk
+    elif fmt == 'xlsx':
+        if openpyxl is None:
+            raise ValueError("Reading .xlsx catalogs requires the openpyxl package")
+        # Read-only workbooks stream rows instead of loading the sheet
+        try:
+            workbook = openpyxl.load_workbook(source, read_only=True, data_only=True)
+        except (zipfile.BadZipFile, InvalidFileException, KeyError) as e:
+            raise ValueError(f"Not a valid .xlsx workbook: {e}")
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            headers = next(rows, None) or ()
+            numbered = (
+                (index, {h: v for h, v in zip(headers, values) if h is not None and v not in (None, '')})
+                for index, values in enumerate(rows, start=2)
+            )
+            while True:
+                chunk = [(index, row) for index, row in islice(numbered, chunk_size) if row]
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            workbook.close()
+    else:
+        raise ValueError(f"Unsupported catalog format {fmt!r}")
+
+
+def _validate(row_number: int, raw: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """Return (record, None) for a valid row or (None, error) for an invalid one."""
+    fields = {}
+    for header, value in raw.items():
+        field = _HEADERS.get(_header_key(header))
+        if field is not None:
+            fields[field] = value.strip() if isinstance(value, str) else value
+    barcode = fields.pop('barcode', None)
+    expiry = fields.get('expiry_date')
+    if isinstance(expiry, str) and len(expiry) == 10:
+        # Catalogs give plain dates, which the schema's datetime does not accept
+        fields['expiry_date'] = f"{expiry}T00:00:00"
+    if barcode is None:
+        return None, {"row": row_number, "barcode": None, "error": "barcode: field required"}
+    try:
+        medicine = MedicineCreate(**fields)
+    except ValidationError as e:
+        message = "; ".join(f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in e.errors())
+        return None, {"row": row_number, "barcode": str(barcode), "error": message}
+
+    values = {}
+    for field, value in medicine.dict().items():
+        if isinstance(value, datetime):
+            value = value.strftime("%Y-%m-%d")
+        values[CATALOG_COLUMNS[field]] = value
+    return {"row": row_number, "barcode": str(barcode), "values": values,
+            "present": {CATALOG_COLUMNS[f] for f in medicine.__fields_set__}}, None
+
+
+def _upsert_chunk(conn: sqlite3.Connection, store_id: int, records: List[Dict[str, Any]],
+                  reference: str) -> Tuple[int, int, List[Dict[str, Any]]]:
+    """Write one chunk of validated rows; returns inserted and updated counts and errors."""
+    # A barcode listed twice in a chunk keeps its last row
+    by_barcode = {record["barcode"]: record for record in records}
+    barcodes = list(by_barcode)
+    existing: Dict[str, Tuple[int, int]] = {}
+    for start in range(0, len(barcodes), _LOOKUP_BATCH):
+        batch = barcodes[start:start + _LOOKUP_BATCH]
+        existing.update(
+            (barcode, (medicine_id, owner)) for barcode, medicine_id, owner in conn.execute(
+                f"SELECT Barcode, MedicineID, StoreID FROM Medicine "
+                f"WHERE Barcode IN ({', '.join('?' for _ in batch)})", batch
+            )
+        )
+
+    errors = []
+    inserts = []
+    updated = 0
+    for barcode, record in by_barcode.items():
+        if barcode not in existing:
+            inserts.append(record)
+            continue
+        medicine_id, owner = existing[barcode]
+        if owner != store_id:
+            errors.append({"row": record["row"], "barcode": barcode,
+                           "error": f"barcode already belongs to a medicine of store {owner}"})
+            continue
+        # Stock of known medicines only changes through the StockMovement ledger
+        columns = [c for c in record["values"] if c in record["present"] and c != 'StockQuantity']
+        if columns:
+            conn.execute(
+                f"UPDATE Medicine SET {', '.join(f'{c} = ?' for c in columns)} WHERE MedicineID = ?",
+                [record["values"][c] for c in columns] + [medicine_id]
+            )
+        updated += 1
+
+    if inserts:
+        columns = [c for c in CATALOG_COLUMNS.values() if c != 'StockQuantity']
+        added = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        conn.executemany(
+            f"INSERT INTO Medicine (MedicineID, StoreID, Barcode, DateAdded, StockQuantity, {', '.join(columns)}) "
+            f"VALUES ({next_id_sql('Medicine')}, ?, ?, ?, 0, {', '.join('?' for _ in columns)})",
+            [[store_id, r["barcode"], added] + [r["values"][c] for c in columns] for r in inserts]
+        )
+        # Opening stock of new medicines is received through the ledger
+        opening = [r for r in inserts if r["values"]["StockQuantity"]]
+        ids = {}
+        for start in range(0, len(opening), _LOOKUP_BATCH):
+            batch = [r["barcode"] for r in opening[start:start + _LOOKUP_BATCH]]
+            ids.update(conn.execute(
+                f"SELECT Barcode, MedicineID FROM Medicine WHERE Barcode IN ({', '.join('?' for _ in batch)})",
+                batch
+            ).fetchall())
+        apply_stock_movements(conn, store_id, [
+            {'MovementUID': uuid.uuid4().hex, 'MedicineID': ids[r["barcode"]],
+             'Delta': r["values"]["StockQuantity"], 'Reason': 'receipt', 'Reference': reference}
+            for r in opening
+        ])
+    return len(inserts), updated, errors
+
+
+def import_catalog(db_path: str, source: Union[str, BinaryIO], store_id: int, fmt: str,
+                   chunk_size: int = DEFAULT_CHUNK_SIZE,
+                   reference: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """Import a supplier catalog into a store, yielding progress after each chunk.
+
+    Each row is validated against MedicineCreate and needs a barcode.
+    Medicines whose barcode is new are inserted, with their stock_quantity
+    received as a 'receipt' StockMovement. Medicines the store already has
+    get the columns present in the row updated; their stock is left to the
+    ledger. Every chunk is written in its own transaction, so an import that
+    stops halfway keeps the chunks already reported.
+
+    Args:
+        db_path: Path to the database.
+        source: Path or binary file object of the catalog.
+        store_id: Store the medicines belong to.
+        fmt: 'csv' or 'xlsx'.
+        chunk_size: Rows per chunk and transaction.
+        reference: Reference recorded on the opening stock movements
+            (default: import:<file name>).
+
+    Yields:
+        After each chunk, a dictionary with the chunk number, running totals
+        of rows, inserted, updated and failed, and the chunk's errors as
+        {row, barcode, error}.
+
+    Raises:
+        ValueError: If the format is unknown or cannot be read.
+        zipfile.BadZipFile: If a workbook turns out to be corrupt while it is read.
+        sqlite3.Error: If a chunk cannot be written; earlier chunks stay committed.
+    """
+    logger = LoggerFactory("DatabaseLogger", os.path.join(BASE_DIR, "results", "logs"), "database").get_logger()
+    name = source if isinstance(source, str) else getattr(source, 'name', None) or 'upload'
+    reference = reference or f"import:{os.path.basename(str(name))}"
+    totals = {"rows": 0, "inserted": 0, "updated": 0, "failed": 0}
+    logger.info(f"Importing catalog {name} into store {store_id}")
+
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    try:
+        for number, chunk in enumerate(read_catalog(source, fmt, chunk_size), start=1):
+            records, errors = [], []
+            for row_number, raw in chunk:
+                record, error = _validate(row_number, raw)
+                if error:
+                    errors.append(error)
+                else:
+                    records.append(record)
+
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                inserted, updated, conflicts = _upsert_chunk(conn, store_id, records, reference)
+                conn.execute("COMMIT")
+            except sqlite3.Error:
+                conn.execute("ROLLBACK")
+                raise
+            errors.extend(conflicts)
+
+            totals["rows"] += len(chunk)
+            totals["inserted"] += inserted
+            totals["updated"] += updated
+            totals["failed"] += len(errors)
+            yield {"chunk": number, **totals, "errors": sorted(errors, key=lambda e: e["row"])}
+        logger.info(f"Imported catalog {name} into store {store_id}: {totals}")
+    except (sqlite3.Error, ValueError, zipfile.BadZipFile) as e:
+        logger.error(f"Error importing catalog {name}: {e}")
+        raise
+    finally:
+        conn.close()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Import a supplier catalog into a store's medicines")
+    parser.add_argument("path", help="Catalog file (.csv or .xlsx)")
+    parser.add_argument("--store-id", type=int, required=True, help="Store the medicines belong to")
+    parser.add_argument("--db", default="medical_store.db", help="Database file, relative to results/")
+    parser.add_argument("--format", choices=CATALOG_FORMATS, help="Catalog format (default: from the extension)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Rows per transaction")
+    args = parser.parse_args(argv)
+
+    db_path = SQLiteDatabase(args.db).db_path
+
+    failed = 0
+    try:
+        for progress in import_catalog(db_path, args.path, args.store_id, args.format or catalog_format(args.path),
+                                       args.chunk_size):
+            for error in progress["errors"]:
+                print(json.dumps(error), file=sys.stderr)
+            print(f"chunk {progress['chunk']}: {progress['rows']} rows, {progress['inserted']} inserted, "
+                  f"{progress['updated']} updated, {progress['failed']} failed")
+            failed = progress["failed"]
+    except (sqlite3.Error, ValueError, zipfile.BadZipFile) as e:
+        print(f"Import failed: {e}", file=sys.stderr)
+        return 1
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
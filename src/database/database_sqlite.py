@@ -1,15 +1,124 @@
 import sqlite3
 import os
+import re
+import uuid
 from typing import Dict, List, Any, Optional
 from src.utils.loggers import LoggerFactory
+from src.utils.phone import phone_key, phone_key_sql
+from src.database.allocation import allocate_fefo, record_consumption, unbatched_stock
+from src.database.ledger import record_stock_adjustments, snapshot_if_due, stock_at, take_balance_snapshot
+from src.database.batch_apply import BatchApplier, DEFAULT_BATCH_SIZE, apply_stock_movements, validate_stock_movement
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
 
 
+# Tables whose row changes are recorded in ChangeLog for store sync, with their primary keys
+CHANGE_TRACKED_TABLES = {
+    'Medicine': 'MedicineID',
+    'Customer': 'CustomerID',
+    'Operator': 'OperatorID',
+    'Purchase': 'PurchaseID',
+    'PurchaseItem': 'PurchaseItemID',
+}
+
+# Rows are created with IDs from the ID block of the database that creates
+# them: block 0 on the server, the store's ID on a store. Rows created by
+# different stores and by the server can then never share an ID.
+ID_BLOCK_BITS = 40
+
+
+def next_id_sql(table: str) -> str:
+    """SQL expression for the next ID of a change-tracked table in this database's ID block."""
+    key = CHANGE_TRACKED_TABLES[table]
+    return (
+        f"(SELECT COALESCE((SELECT {key} FROM {table} WHERE {key} > Lo AND {key} < Lo + {1 << ID_BLOCK_BITS} "
+        f"ORDER BY {key} DESC LIMIT 1), Lo) + 1 "
+        f"FROM (SELECT COALESCE((SELECT Block FROM LocalIdBlock), 0) << {ID_BLOCK_BITS} AS Lo))"
+    )
+
+
+# Tables without a StoreID column, scoped to a store through their parent table,
+# listed parents first
+SNAPSHOT_CHILD_TABLES = {
+    'PurchaseItem': ('PurchaseID', 'Purchase'),
+    'PurchaseItemBatch': ('PurchaseItemID', 'PurchaseItem'),
+    'BatchItem': ('BatchID', 'Batch'),
+}
+
+# Tables whose per-store row counts are kept in StoreRowCount by triggers
+ROW_COUNTED_TABLES = ('Medicine', 'Customer', 'Operator', 'Purchase')
+
+# ChangeLog entries counted towards a store's lag; larger backlogs report this value
+MAX_COUNTED_LAG = 1000
+
+# Columns the fleet sync view can be sorted by
+FLEET_SORT_COLUMNS = {
+    'lag': 'ChangeLag',
+    'outbox': 'OutboxDepth',
+    'last_pull': 'LastPullAt',
+    'last_push': 'LastPushAt',
+    'errors': 'Errors',
+    'store': 'StoreID',
+}
+
+# StoreSyncState columns updated by a pull or a push
+_SYNC_STATE_COLUMNS = {
+    'pull': ('LastPullAt', 'Pulls', 'ChangesPulled', 'PullErrors'),
+    'push': ('LastPushAt', 'Pushes', 'ChangesPushed', 'PushErrors'),
+}
+
+
+def record_sync_activity(conn: sqlite3.Connection, store_id: int, direction: str, changes: int = 0,
+                         bytes_in: int = 0, bytes_out: int = 0, cursor: Optional[int] = None,
+                         outbox_depth: Optional[int] = None, error: Optional[str] = None) -> None:
+    """Add one pull or push to a store's row in StoreSyncState.
+
+    Runs inside the caller's transaction, so the sync writer can account for
+    a push in the same commit that applies it.
+
+    Args:
+        conn: Connection to the main server database.
+        store_id: Store that pulled or pushed.
+        direction: 'pull' or 'push'.
+        changes: Changes sent to (pull) or applied from (push) the store.
+        bytes_in: Request body size.
+        bytes_out: Response body size.
+        cursor: ChangeLog cursor the store has applied (pulls only).
+        outbox_depth: Entries waiting in the store's outbox, as it reported.
+        error: Error message if the request failed.
+    """
+    if direction not in _SYNC_STATE_COLUMNS:
+        raise ValueError(f"Unknown sync direction {direction!r}")
+    last_at, requests, changed, errors = _SYNC_STATE_COLUMNS[direction]
+    conn.execute("INSERT INTO StoreSyncState (StoreID) VALUES (?) ON CONFLICT(StoreID) DO NOTHING", (store_id,))
+    if error:
+        conn.execute(f'''
+            UPDATE StoreSyncState SET {errors} = {errors} + 1, LastError = ?, LastErrorAt = CURRENT_TIMESTAMP
+            WHERE StoreID = ?
+        ''', (error[:500], store_id))
+        return
+    conn.execute(f'''
+        UPDATE StoreSyncState SET
+            {last_at} = CURRENT_TIMESTAMP,
+            {requests} = {requests} + 1,
+            {changed} = {changed} + ?,
+            BytesIn = BytesIn + ?,
+            BytesOut = BytesOut + ?,
+            PullCursor = COALESCE(?, PullCursor),
+            OutboxDepth = COALESCE(?, OutboxDepth)
+        WHERE StoreID = ?
+    ''', (changes, bytes_in, bytes_out, cursor, outbox_depth, store_id))
+
+
 class SQLiteDatabase:
     """Manages SQLite database for medical store operations."""
 
+    # Database files whose schema has already been created in this process.
+    # Route dependencies build a new instance per request, so re-running the
+    # DDL (and its commit) every time would dominate cheap lookups.
+    _schema_ready: set = set()
+
     def __init__(self, db_name: str, config: Optional[Dict[str, Any]] = None) -> None:
         """Initialize the database with a new schema.
 
@@ -35,7 +144,9 @@ class SQLiteDatabase:
         self.logger.info("Initializing Database Processor")
 
         # Create schema
-        self._create_schema()
+        if self.db_path not in self._schema_ready or not os.path.exists(self.db_path):
+            self._create_schema()
+            self._schema_ready.add(self.db_path)
 
         # Set up SQLAlchemy
         SQLALCHEMY_DATABASE_URL = f"sqlite:///{self.db_path}"
@@ -88,6 +199,7 @@ class SQLiteDatabase:
                     Age INTEGER,
                     Gender TEXT,
                     Address TEXT,
+                    PhoneKey TEXT,
                     CreatedAt TEXT DEFAULT CURRENT_TIMESTAMP,
                     FOREIGN KEY (StoreID) REFERENCES Store(StoreID)
                 )
@@ -131,6 +243,8 @@ class SQLiteDatabase:
                     BatchID INTEGER NOT NULL,
                     MedicineID INTEGER NOT NULL,
                     Quantity INTEGER NOT NULL,
+                    ExpiryDate DATE,
+                    RemainingQuantity INTEGER NOT NULL DEFAULT 0,
                     CreatedAt TEXT DEFAULT CURRENT_TIMESTAMP,
                     FOREIGN KEY (BatchID) REFERENCES Batch(BatchID),
                     FOREIGN KEY (MedicineID) REFERENCES Medicine(MedicineID)
@@ -190,6 +304,18 @@ class SQLiteDatabase:
                 )
             ''')
 
+            # Create PurchaseItemBatch table recording the batches each line was dispensed from
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS PurchaseItemBatch (
+                    PurchaseItemID INTEGER NOT NULL,
+                    BatchItemID INTEGER NOT NULL,
+                    Quantity INTEGER NOT NULL,
+                    PRIMARY KEY (PurchaseItemID, BatchItemID),
+                    FOREIGN KEY (PurchaseItemID) REFERENCES PurchaseItem(PurchaseItemID),
+                    FOREIGN KEY (BatchItemID) REFERENCES BatchItem(BatchItemID)
+                )
+            ''')
+
             # Create Prescription table with store reference
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS Prescription (
@@ -236,6 +362,123 @@ class SQLiteDatabase:
                 )
             ''')
 
+            # Create LocalIdBlock table, the ID block of rows created in this database (empty on the server)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS LocalIdBlock (
+                    Block INTEGER NOT NULL
+                )
+            ''')
+
+            # Create StockMovement table, the ledger of signed stock changes
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS StockMovement (
+                    MovementID INTEGER PRIMARY KEY AUTOINCREMENT,
+                    MovementUID TEXT NOT NULL UNIQUE,
+                    StoreID INTEGER NOT NULL,
+                    MedicineID INTEGER NOT NULL,
+                    Delta INTEGER NOT NULL,
+                    Reason TEXT NOT NULL,
+                    Reference TEXT,
+                    BatchItemID INTEGER,
+                    CreatedAt TEXT DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (StoreID) REFERENCES Store(StoreID),
+                    FOREIGN KEY (MedicineID) REFERENCES Medicine(MedicineID),
+                    FOREIGN KEY (BatchItemID) REFERENCES BatchItem(BatchItemID)
+                )
+            ''')
+
+            # Create StockSnapshot table, the points at which ledger balances were materialized
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS StockSnapshot (
+                    SnapshotID INTEGER PRIMARY KEY AUTOINCREMENT,
+                    AsOfMovementID INTEGER NOT NULL,
+                    TakenAt TEXT NOT NULL
+                )
+            ''')
+
+            # Create StockBalanceSnapshot table, balances per store, medicine and batch line
+            # (BatchItemID 0 for stock outside any batch) at each StockSnapshot
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS StockBalanceSnapshot (
+                    SnapshotID INTEGER NOT NULL,
+                    StoreID INTEGER NOT NULL,
+                    MedicineID INTEGER NOT NULL,
+                    BatchItemID INTEGER NOT NULL DEFAULT 0,
+                    Balance INTEGER NOT NULL,
+                    PRIMARY KEY (SnapshotID, StoreID, MedicineID, BatchItemID),
+                    FOREIGN KEY (SnapshotID) REFERENCES StockSnapshot(SnapshotID)
+                ) WITHOUT ROWID
+            ''')
+
+            # Create StoreSyncState table, the server's view of each store's sync
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS StoreSyncState (
+                    StoreID INTEGER PRIMARY KEY,
+                    LastPullAt TEXT,
+                    LastPushAt TEXT,
+                    PullCursor INTEGER NOT NULL DEFAULT 0,
+                    OutboxDepth INTEGER,
+                    Pulls INTEGER NOT NULL DEFAULT 0,
+                    Pushes INTEGER NOT NULL DEFAULT 0,
+                    ChangesPulled INTEGER NOT NULL DEFAULT 0,
+                    ChangesPushed INTEGER NOT NULL DEFAULT 0,
+                    BytesIn INTEGER NOT NULL DEFAULT 0,
+                    BytesOut INTEGER NOT NULL DEFAULT 0,
+                    PullErrors INTEGER NOT NULL DEFAULT 0,
+                    PushErrors INTEGER NOT NULL DEFAULT 0,
+                    LastError TEXT,
+                    LastErrorAt TEXT,
+                    FOREIGN KEY (StoreID) REFERENCES Store(StoreID)
+                )
+            ''')
+
+            # Create ChangeLog table, filled by triggers on the synced tables
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS ChangeLog (
+                    Seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    StoreID INTEGER NOT NULL,
+                    TableName TEXT NOT NULL,
+                    RowID INTEGER NOT NULL,
+                    Operation TEXT NOT NULL,
+                    ChangedAt TEXT DEFAULT CURRENT_TIMESTAMP,
+                    OriginStoreID INTEGER
+                )
+            ''')
+
+            # Create SyncOrigin table, holding the pushing store while its changes are applied
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS SyncOrigin (
+                    StoreID INTEGER NOT NULL
+                )
+            ''')
+
+            # Create StoreRowCount table, kept up to date by triggers
+            row_counts_exist = cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'StoreRowCount'"
+            ).fetchone()
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS StoreRowCount (
+                    StoreID INTEGER NOT NULL,
+                    TableName TEXT NOT NULL,
+                    Rows INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (StoreID, TableName)
+                ) WITHOUT ROWID
+            ''')
+            if not row_counts_exist:
+                for table in ROW_COUNTED_TABLES:
+                    cursor.execute(f'''
+                        INSERT INTO StoreRowCount (StoreID, TableName, Rows)
+                        SELECT StoreID, '{table}', COUNT(*) FROM {table} GROUP BY StoreID
+                    ''')
+
+            self._migrate_schema(cursor)
+            self._create_indexes(cursor)
+            self._create_change_triggers(cursor)
+            self._create_phone_key_triggers(cursor)
+            self._create_row_count_triggers(cursor)
+            self._create_ledger_triggers(cursor)
+            self._create_search_index(cursor)
+
             conn.commit()
             self.logger.info("Database schema created successfully")
         except sqlite3.Error as e:
@@ -244,6 +487,638 @@ class SQLiteDatabase:
         finally:
             conn.close()
 
+    def _add_missing_columns(self, cursor: sqlite3.Cursor, table: str, columns: Dict[str, str]) -> List[str]:
+        """Add columns introduced after a database file was first created.
+
+        Args:
+            cursor: Cursor on the connection creating the schema.
+            table: Name of the table to extend.
+            columns: Mapping of column name to its SQL declaration.
+
+        Returns:
+            Names of the columns that were added.
+        """
+        cursor.execute(f"PRAGMA table_info({table})")
+        existing = {row[1] for row in cursor.fetchall()}
+        added = []
+        for name, declaration in columns.items():
+            if name not in existing:
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {declaration}")
+                added.append(name)
+                self.logger.info(f"Added column {table}.{name}")
+        return added
+
+    def _migrate_schema(self, cursor: sqlite3.Cursor) -> None:
+        """Bring tables created by older versions up to the current schema."""
+        self._add_missing_columns(cursor, "Customer", {"PhoneKey": "TEXT"})
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'Customer_phone_key_insert'")
+        if cursor.fetchone() is None:
+            # A ChangeLog trigger that predates them, and keys written before the triggers kept them
+            cursor.execute("DROP TRIGGER IF EXISTS Customer_changelog_update")
+            cursor.execute(f"UPDATE Customer SET PhoneKey = {phone_key_sql('ContactInfo')}")
+        added = self._add_missing_columns(cursor, "BatchItem", {
+            "ExpiryDate": "DATE",
+            "RemainingQuantity": "INTEGER NOT NULL DEFAULT 0",
+        })
+        if added:
+            # Batches received before allocation was tracked are treated as untouched
+            cursor.execute('''
+                UPDATE BatchItem SET
+                    ExpiryDate = (SELECT b.ExpiryDate FROM Batch b WHERE b.BatchID = BatchItem.BatchID),
+                    RemainingQuantity = Quantity
+            ''')
+        self._add_missing_columns(cursor, "StockMovement", {"BatchItemID": "INTEGER"})
+        if self._add_missing_columns(cursor, "ChangeLog", {"OriginStoreID": "INTEGER"}):
+            # Recreated by _create_change_triggers with the origin column
+            for table in CHANGE_TRACKED_TABLES:
+                for operation in ('insert', 'update', 'delete'):
+                    cursor.execute(f"DROP TRIGGER IF EXISTS {table}_changelog_{operation}")
+
+    def _create_indexes(self, cursor: sqlite3.Cursor) -> None:
+        """Create secondary indexes used by lookups on hot paths."""
+        # Checkout customer lookup by phone digits or name prefix
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_customer_store_phone ON Customer (StoreID, PhoneKey)"
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_customer_store_name ON Customer (StoreID, Name COLLATE NOCASE)"
+        )
+        # Most recent purchase of a customer
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_purchase_customer_date ON Purchase (CustomerID, DateOfPurchase)"
+        )
+        # Purchase exports read by date and join line items to their purchase
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_purchase_date ON Purchase (DateOfPurchase)"
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_purchaseitem_purchase ON PurchaseItem (PurchaseID)"
+        )
+        # FEFO allocation walks a medicine's open batch lines by expiry
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_batchitem_open_expiry ON BatchItem (MedicineID, ExpiryDate, BatchItemID) "
+            "WHERE RemainingQuantity > 0"
+        )
+        # Movement history of a medicine
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_stock_movement_medicine ON StockMovement (MedicineID, MovementID)"
+        )
+        # Store sync reads ChangeLog entries after a cursor
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_changelog_store_seq ON ChangeLog (StoreID, Seq)"
+        )
+
+    def _create_change_triggers(self, cursor: sqlite3.Cursor) -> None:
+        """Record every insert, update and delete on the synced tables in ChangeLog.
+
+        Changes made while a store's push is applied carry that store, read
+        from SyncOrigin, as their origin so they are not sent back to it.
+        """
+        origin = "(SELECT StoreID FROM SyncOrigin)"
+        for table, key in CHANGE_TRACKED_TABLES.items():
+            for event, operation, ref in (('INSERT', 'insert', 'new'),
+                                          ('UPDATE', 'update', 'new'),
+                                          ('DELETE', 'delete', 'old')):
+                if table == 'PurchaseItem':
+                    # Line items take their store from the purchase they belong to
+                    source = f"SELECT p.StoreID, 'PurchaseItem', {ref}.PurchaseItemID, '{operation}', {origin} " \
+                             f"FROM Purchase p WHERE p.PurchaseID = {ref}.PurchaseID"
+                else:
+                    source = f"SELECT {ref}.StoreID, '{table}', {ref}.{key}, '{operation}', {origin}"
+                when = ""
+                if (table, operation) == ('Customer', 'update'):
+                    # The phone key triggers' own write is not a change of the row
+                    when = "WHEN NOT (old.PhoneKey IS NOT new.PhoneKey AND old.ContactInfo IS new.ContactInfo)"
+                cursor.execute(f'''
+                    CREATE TRIGGER IF NOT EXISTS {table}_changelog_{operation} AFTER {event} ON {table} {when}
+                    BEGIN
+                        INSERT INTO ChangeLog (StoreID, TableName, RowID, Operation, OriginStoreID) {source};
+                    END
+                ''')
+
+    def _create_phone_key_triggers(self, cursor: sqlite3.Cursor) -> None:
+        """Keep Customer.PhoneKey in step with ContactInfo on every insert and update."""
+        for event in ('INSERT', 'UPDATE OF ContactInfo'):
+            name = 'insert' if event == 'INSERT' else 'update'
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS Customer_phone_key_{name} AFTER {event} ON Customer
+                BEGIN
+                    UPDATE Customer SET PhoneKey = Key.Value
+                    FROM (SELECT {phone_key_sql('new.ContactInfo')} AS Value) AS Key
+                    WHERE CustomerID = new.CustomerID AND PhoneKey IS NOT Key.Value;
+                END
+            ''')
+
+    def _create_row_count_triggers(self, cursor: sqlite3.Cursor) -> None:
+        """Keep the per-store row counts in StoreRowCount in step with inserts and deletes."""
+        for table in ROW_COUNTED_TABLES:
+            add = f'''
+                INSERT INTO StoreRowCount (StoreID, TableName, Rows) VALUES (new.StoreID, '{table}', 1)
+                ON CONFLICT(StoreID, TableName) DO UPDATE SET Rows = Rows + 1;
+            '''
+            remove = f'''
+                UPDATE StoreRowCount SET Rows = Rows - 1 WHERE StoreID = old.StoreID AND TableName = '{table}';
+            '''
+            cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {table}_rowcount_insert AFTER INSERT ON {table} "
+                           f"BEGIN {add} END")
+            cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {table}_rowcount_delete AFTER DELETE ON {table} "
+                           f"BEGIN {remove} END")
+            cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {table}_rowcount_move AFTER UPDATE OF StoreID ON {table} "
+                           f"WHEN old.StoreID IS NOT new.StoreID BEGIN {remove} {add} END")
+
+    def _create_ledger_triggers(self, cursor: sqlite3.Cursor) -> None:
+        """Make StockMovement append-only; corrections are recorded as new movements."""
+        for event in ('UPDATE', 'DELETE'):
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS StockMovement_append_only_{event.lower()} BEFORE {event} ON StockMovement
+                BEGIN
+                    SELECT RAISE(ABORT, 'StockMovement is append-only');
+                END
+            ''')
+
+    def _create_search_index(self, cursor: sqlite3.Cursor) -> None:
+        """Create the FTS5 medicine search index and the triggers that maintain it.
+
+        The index is an external-content table over Medicine, so it only stores
+        the token data. StoreID is indexed as its own column to let searches be
+        scoped to a store inside the full-text query instead of after it.
+        """
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'MedicineSearch'"
+        )
+        exists = cursor.fetchone() is not None
+
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS MedicineSearch USING fts5(
+                Name,
+                Brand,
+                Type,
+                ScheduleCategory,
+                StoreID,
+                content='Medicine',
+                content_rowid='MedicineID',
+                tokenize='unicode61 remove_diacritics 2',
+                prefix='1 2 3'
+            )
+        ''')
+
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS Medicine_search_insert AFTER INSERT ON Medicine
+            BEGIN
+                INSERT INTO MedicineSearch (rowid, Name, Brand, Type, ScheduleCategory, StoreID)
+                VALUES (new.MedicineID, new.Name, new.Brand, new.Type, new.ScheduleCategory, new.StoreID);
+            END
+        ''')
+
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS Medicine_search_delete AFTER DELETE ON Medicine
+            BEGIN
+                INSERT INTO MedicineSearch (MedicineSearch, rowid, Name, Brand, Type, ScheduleCategory, StoreID)
+                VALUES ('delete', old.MedicineID, old.Name, old.Brand, old.Type, old.ScheduleCategory, old.StoreID);
+            END
+        ''')
+
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS Medicine_search_update
+            AFTER UPDATE OF Name, Brand, Type, ScheduleCategory, StoreID ON Medicine
+            BEGIN
+                INSERT INTO MedicineSearch (MedicineSearch, rowid, Name, Brand, Type, ScheduleCategory, StoreID)
+                VALUES ('delete', old.MedicineID, old.Name, old.Brand, old.Type, old.ScheduleCategory, old.StoreID);
+                INSERT INTO MedicineSearch (rowid, Name, Brand, Type, ScheduleCategory, StoreID)
+                VALUES (new.MedicineID, new.Name, new.Brand, new.Type, new.ScheduleCategory, new.StoreID);
+            END
+        ''')
+
+        if not exists:
+            # Index medicines that were added before the search index existed
+            cursor.execute("INSERT INTO MedicineSearch (MedicineSearch) VALUES ('rebuild')")
+            self.logger.info("Built medicine search index")
+
+    # ChangeLog methods
+    def get_changes(self, store_id: int, cursor: int = 0, limit: int = 1000) -> Dict[str, Any]:
+        """Get the changes of a store recorded after a ChangeLog cursor.
+
+        Reads at most limit ChangeLog entries through the (StoreID, Seq) index,
+        keeps the latest entry per row and attaches the row's current data.
+        Rows whose entries all came from the store's own pushes are skipped,
+        since the store already holds them; the cursor still moves past them.
+
+        Args:
+            store_id: Store whose changes are requested.
+            cursor: Sequence number of the last change the caller has seen.
+            limit: Maximum number of ChangeLog entries to read.
+
+        Returns:
+            Dictionary with the changes, the new cursor and whether more remain.
+        """
+        self.logger.info(f"Retrieving changes of store {store_id} after {cursor}")
+        try:
+            conn = sqlite3.connect(self.db_path)
+            conn.row_factory = sqlite3.Row
+            db_cursor = conn.cursor()
+            db_cursor.execute('''
+                SELECT Seq, TableName, RowID, Operation, ChangedAt, OriginStoreID FROM ChangeLog
+                WHERE StoreID = ? AND Seq > ?
+                ORDER BY Seq
+                LIMIT ?
+            ''', (store_id, cursor, limit))
+            entries = db_cursor.fetchall()
+
+            # Only the latest entry per row matters to the caller, and only for rows
+            # someone other than the store itself changed
+            latest = {}
+            changed_elsewhere = set()
+            for entry in entries:
+                row = (entry['TableName'], entry['RowID'])
+                latest.pop(row, None)
+                latest[row] = entry
+                if entry['OriginStoreID'] != store_id:
+                    changed_elsewhere.add(row)
+            latest = {row: entry for row, entry in latest.items() if row in changed_elsewhere}
+
+            rows = {}
+            for table, key in CHANGE_TRACKED_TABLES.items():
+                ids = [row_id for (name, row_id), entry in latest.items()
+                       if name == table and entry['Operation'] != 'delete']
+                for start in range(0, len(ids), 500):
+                    chunk = ids[start:start + 500]
+                    placeholders = ', '.join('?' for _ in chunk)
+                    db_cursor.execute(f"SELECT * FROM {table} WHERE {key} IN ({placeholders})", chunk)
+                    for row in db_cursor.fetchall():
+                        rows[(table, row[key])] = dict(row)
+
+            changes = []
+            for (table, row_id), entry in latest.items():
+                data = rows.get((table, row_id))
+                changes.append({
+                    "seq": entry['Seq'],
+                    "table": table,
+                    "row_id": row_id,
+                    "operation": entry['Operation'] if data is not None else 'delete',
+                    "changed_at": entry['ChangedAt'],
+                    "data": data
+                })
+
+            new_cursor = entries[-1]['Seq'] if entries else cursor
+            self.logger.info(f"Retrieved {len(changes)} changes of store {store_id}, cursor {new_cursor}")
+            return {"changes": changes, "cursor": new_cursor, "has_more": len(entries) == limit}
+        except sqlite3.Error as e:
+            self.logger.error(f"Error retrieving from ChangeLog: {e}")
+            raise
+        finally:
+            conn.close()
+
+    def apply_sync_changes(self, store_id: int, changes: List[Dict[str, Any]],
+                           batch_size: int = DEFAULT_BATCH_SIZE) -> Dict[str, Any]:
+        """Apply changes pushed by a store in a single transaction.
+
+        Args:
+            store_id: Store the changes belong to.
+            changes: Changes as {table, operation, data} dictionaries.
+            batch_size: Maximum number of rows per executemany call.
+
+        Returns:
+            Dictionary with applied and failed counts and per-change results.
+        """
+        self.logger.info(f"Applying {len(changes)} changes from store {store_id}")
+        conn = sqlite3.connect(self.db_path, isolation_level=None)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            result = BatchApplier(conn, store_id, batch_size).apply(changes)
+            conn.execute("COMMIT")
+            self.logger.info(f"Applied {result['applied']} changes from store {store_id}, {result['failed']} failed")
+            return result
+        except sqlite3.Error as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            self.logger.error(f"Error applying changes from store {store_id}: {e}")
+            raise
+        finally:
+            conn.close()
+
+    # Sync status methods
+    def record_sync_activity(self, store_id: int, direction: str, **activity: Any) -> bool:
+        """Account for a store's pull or push in StoreSyncState.
+
+        Args:
+            store_id: Store that pulled or pushed.
+            direction: 'pull' or 'push'.
+            **activity: changes, bytes_in, bytes_out, cursor, outbox_depth or
+                error, as taken by record_sync_activity.
+
+        Returns:
+            True if the activity was recorded. Failures are logged, never raised,
+            so accounting cannot fail a sync.
+        """
+        conn = sqlite3.connect(self.db_path, timeout=5)
+        try:
+            record_sync_activity(conn, store_id, direction, **activity)
+            conn.commit()
+            return True
+        except (sqlite3.Error, ValueError) as e:
+            self.logger.error(f"Error recording {direction} of store {store_id}: {e}")
+            return False
+        finally:
+            conn.close()
+
+    def get_store_sync_status(self, store_id: int) -> Optional[Dict[str, Any]]:
+        """Get a store's sync state, lag and row counts with bounded index lookups only.
+
+        Args:
+            store_id: Store to describe.
+
+        Returns:
+            Dictionary with the store's name, its StoreSyncState columns, the
+            latest ChangeLog sequence, the ChangeLog entries it has not pulled
+            yet (ChangeLag, at most MAX_COUNTED_LAG) and its row counts per
+            table, or None if the store does not exist.
+        """
+        try:
+            conn = sqlite3.connect(self.db_path)
+            conn.row_factory = sqlite3.Row
+            store = conn.execute("SELECT StoreID, StoreName FROM Store WHERE StoreID = ?", (store_id,)).fetchone()
+            if store is None:
+                return None
+            state = conn.execute("SELECT * FROM StoreSyncState WHERE StoreID = ?", (store_id,)).fetchone()
+            state = dict(state) if state is not None else {"PullCursor": 0}
+            latest_seq = conn.execute(
+                "SELECT COALESCE(MAX(Seq), 0) FROM ChangeLog WHERE StoreID = ?", (store_id,)
+            ).fetchone()[0]
+            lag = conn.execute(
+                "SELECT COUNT(*) FROM (SELECT 1 FROM ChangeLog WHERE StoreID = ? AND Seq > ? LIMIT ?)",
+                (store_id, state["PullCursor"], MAX_COUNTED_LAG)
+            ).fetchone()[0]
+            counts = dict(conn.execute(
+                "SELECT TableName, Rows FROM StoreRowCount WHERE StoreID = ?", (store_id,)
+            ).fetchall())
+            state.pop("StoreID", None)
+            return {
+                "StoreID": store["StoreID"],
+                "StoreName": store["StoreName"],
+                **state,
+                "LatestSeq": latest_seq,
+                "ChangeLag": lag,
+                "RowCounts": {table: counts.get(table, 0) for table in ROW_COUNTED_TABLES},
+            }
+        except sqlite3.Error as e:
+            self.logger.error(f"Error reading sync status of store {store_id}: {e}")
+            raise
+        finally:
+            conn.close()
+
+    def get_fleet_sync_status(self, sort: str = 'lag', descending: bool = True,
+                              limit: int = 100, offset: int = 0) -> List[Dict[str, Any]]:
+        """List every store's sync state and lag.
+
+        Args:
+            sort: One of FLEET_SORT_COLUMNS, e.g. 'lag' or 'last_pull'.
+            descending: Sort largest (or most recent) first.
+            limit: Maximum number of stores to return.
+            offset: Number of stores to skip.
+
+        Returns:
+            One dictionary per store with its StoreSyncState columns, latest
+            ChangeLog sequence, ChangeLag and total error count.
+
+        Raises:
+            ValueError: If sort is not a known column.
+        """
+        if sort not in FLEET_SORT_COLUMNS:
+            raise ValueError(f"Cannot sort by {sort!r}, use one of {', '.join(FLEET_SORT_COLUMNS)}")
+        direction = "DESC" if descending else "ASC"
+        try:
+            conn = sqlite3.connect(self.db_path)
+            conn.row_factory = sqlite3.Row
+            rows = conn.execute(f'''
+                SELECT *, (
+                    SELECT COUNT(*) FROM (
+                        SELECT 1 FROM ChangeLog c WHERE c.StoreID = fleet.StoreID AND c.Seq > fleet.PullCursor LIMIT ?
+                    )
+                ) AS ChangeLag, PullErrors + PushErrors AS Errors
+                FROM (
+                    SELECT s.StoreID, s.StoreName, st.LastPullAt, st.LastPushAt,
+                           COALESCE(st.PullCursor, 0) AS PullCursor, st.OutboxDepth,
+                           COALESCE(st.Pulls, 0) AS Pulls, COALESCE(st.Pushes, 0) AS Pushes,
+                           COALESCE(st.BytesIn, 0) AS BytesIn, COALESCE(st.BytesOut, 0) AS BytesOut,
+                           COALESCE(st.PullErrors, 0) AS PullErrors, COALESCE(st.PushErrors, 0) AS PushErrors,
+                           st.LastError, st.LastErrorAt,
+                           (SELECT COALESCE(MAX(c.Seq), 0) FROM ChangeLog c WHERE c.StoreID = s.StoreID) AS LatestSeq
+                    FROM Store s LEFT JOIN StoreSyncState st ON st.StoreID = s.StoreID
+                ) AS fleet
+                ORDER BY {FLEET_SORT_COLUMNS[sort]} IS NULL, {FLEET_SORT_COLUMNS[sort]} {direction}, StoreID
+                LIMIT ? OFFSET ?
+            ''', (MAX_COUNTED_LAG, limit, offset)).fetchall()
+            return [dict(row) for row in rows]
+        except sqlite3.Error as e:
+            self.logger.error(f"Error reading fleet sync status: {e}")
+            raise
+        finally:
+            conn.close()
+
+    # Bootstrap methods
+    def _store_scope(self, table: str) -> str:
+        """WHERE clause limiting a change-tracked table to one store."""
+        if table == 'PurchaseItem':
+            return "PurchaseID IN (SELECT PurchaseID FROM Purchase WHERE StoreID = ?)"
+        return "StoreID = ?"
+
+    def get_bootstrap_manifest(self, store_id: int) -> Dict[str, Any]:
+        """Describe the data a new store has to download.
+
+        Args:
+            store_id: Store being bootstrapped.
+
+        Returns:
+            Dictionary with the ChangeLog high-water mark of the store and,
+            per table, its row count and largest primary key.
+        """
+        self.logger.info(f"Building bootstrap manifest of store {store_id}")
+        try:
+            conn = sqlite3.connect(self.db_path)
+            # Read the cursor first: changes made while the tables are
+            # downloaded are then pulled again afterwards
+            cursor = conn.execute(
+                "SELECT COALESCE(MAX(Seq), 0) FROM ChangeLog WHERE StoreID = ?", (store_id,)
+            ).fetchone()[0]
+            tables = {}
+            for table, key in CHANGE_TRACKED_TABLES.items():
+                rows, max_key = conn.execute(
+                    f"SELECT COUNT(*), COALESCE(MAX({key}), 0) FROM {table} WHERE {self._store_scope(table)}",
+                    (store_id,)
+                ).fetchone()
+                tables[table] = {"rows": rows, "max_key": max_key}
+            return {"cursor": cursor, "tables": tables}
+        except sqlite3.Error as e:
+            self.logger.error(f"Error building bootstrap manifest: {e}")
+            raise
+        finally:
+            conn.close()
+
+    def get_table_chunk(self, store_id: int, table: str, after_key: int = 0, limit: int = 1000) -> Dict[str, Any]:
+        """Read one page of a store's rows in primary key order.
+
+        Args:
+            store_id: Store whose rows are requested.
+            table: One of the change-tracked tables.
+            after_key: Largest primary key the caller already has.
+            limit: Maximum number of rows to return.
+
+        Returns:
+            Dictionary with the column names, the rows as value lists, the
+            key to resume after and whether more rows remain.
+        """
+        if table not in CHANGE_TRACKED_TABLES:
+            raise ValueError(f"Table {table!r} cannot be bootstrapped")
+        key = CHANGE_TRACKED_TABLES[table]
+        try:
+            conn = sqlite3.connect(self.db_path)
+            db_cursor = conn.execute(
+                f"SELECT * FROM {table} WHERE {key} > ? AND {self._store_scope(table)} ORDER BY {key} LIMIT ?",
+                (after_key, store_id, limit)
+            )
+            columns = [column[0] for column in db_cursor.description]
+            rows = [list(row) for row in db_cursor.fetchall()]
+            next_after = rows[-1][columns.index(key)] if rows else after_key
+            return {"columns": columns, "rows": rows, "next_after": next_after, "has_more": len(rows) == limit}
+        except sqlite3.Error as e:
+            self.logger.error(f"Error reading {table} after {after_key}: {e}")
+            raise
+        finally:
+            conn.close()
+
+    def upsert_rows(self, table: str, columns: List[str], rows: List[List[Any]]) -> int:
+        """Insert or overwrite rows by primary key in a single transaction.
+
+        Args:
+            table: One of the change-tracked tables.
+            columns: Column names, including the primary key.
+            rows: Value lists in column order.
+
+        Returns:
+            Number of rows written.
+        """
+        if table not in CHANGE_TRACKED_TABLES:
+            raise ValueError(f"Table {table!r} cannot be bootstrapped")
+        key = CHANGE_TRACKED_TABLES[table]
+        try:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            known = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+            unknown = set(columns) - known
+            if unknown or key not in columns:
+                raise ValueError(f"Unexpected columns for {table}: {', '.join(sorted(unknown)) or 'no ' + key}")
+            updates = ', '.join(f"{c} = excluded.{c}" for c in columns if c != key)
+            conn.executemany(
+                f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)}) "
+                f"ON CONFLICT({key}) DO UPDATE SET {updates}",
+                rows
+            )
+            conn.commit()
+            return len(rows)
+        except sqlite3.Error as e:
+            self.logger.error(f"Error writing {len(rows)} rows to {table}: {e}")
+            raise
+        finally:
+            conn.close()
+
+    # Snapshot methods
+    def create_store_snapshot(self, store_id: int, dest_path: str) -> Dict[str, Any]:
+        """Write a copy of the database that only holds one store's rows.
+
+        The copy is taken with the online backup API in a single step, so it
+        is consistent even while other connections write. Rows of other
+        stores and the ChangeLog are then removed from the copy with the
+        triggers dropped, and the triggers and search index are rebuilt.
+
+        Args:
+            store_id: Store to keep.
+            dest_path: Path of the new database file.
+
+        Returns:
+            Dictionary with the store's ChangeLog cursor at the time of the
+            copy and the number of rows kept per table.
+        """
+        self.logger.info(f"Creating snapshot of store {store_id}")
+        try:
+            dest = sqlite3.connect(dest_path)
+            source = sqlite3.connect(self.db_path)
+            try:
+                source.backup(dest)
+            finally:
+                source.close()
+
+            cursor = dest.cursor()
+            snapshot_cursor = cursor.execute(
+                "SELECT COALESCE(MAX(Seq), 0) FROM ChangeLog WHERE StoreID = ?", (store_id,)
+            ).fetchone()[0]
+
+            triggers = [row[0] for row in cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")]
+            for trigger in triggers:
+                cursor.execute(f"DROP TRIGGER {trigger}")
+            cursor.execute("DELETE FROM ChangeLog")
+
+            virtual = [row[0] for row in cursor.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND sql LIKE 'CREATE VIRTUAL TABLE%'"
+            )]
+            tables = [
+                row[0] for row in cursor.execute(
+                    "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+                ).fetchall()
+                if row[0] not in virtual and not any(row[0].startswith(f"{v}_") for v in virtual)
+            ]
+            for table in tables:
+                columns = {row[1] for row in cursor.execute(f"PRAGMA table_info({table})")}
+                if 'StoreID' in columns:
+                    cursor.execute(f"DELETE FROM {table} WHERE StoreID != ?", (store_id,))
+            # Children go once their parents only hold the store's rows
+            for table, (key, parent) in SNAPSHOT_CHILD_TABLES.items():
+                if table in tables:
+                    cursor.execute(f"DELETE FROM {table} WHERE {key} NOT IN (SELECT {key} FROM {parent})")
+            counts = {table: cursor.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in tables}
+
+            cursor.execute("INSERT INTO MedicineSearch (MedicineSearch) VALUES ('rebuild')")
+            # Rows the store creates after installing the snapshot take IDs from its own block
+            cursor.execute("DELETE FROM LocalIdBlock")
+            cursor.execute("INSERT INTO LocalIdBlock (Block) VALUES (?)", (store_id,))
+            self._create_change_triggers(cursor)
+            self._create_phone_key_triggers(cursor)
+            self._create_row_count_triggers(cursor)
+            self._create_ledger_triggers(cursor)
+            self._create_search_index(cursor)
+            dest.commit()
+            cursor.execute("VACUUM")
+            cursor.execute("PRAGMA journal_mode = DELETE")
+            self.logger.info(f"Snapshot of store {store_id} at cursor {snapshot_cursor}: {counts}")
+            return {"cursor": snapshot_cursor, "tables": counts}
+        except sqlite3.Error as e:
+            self.logger.error(f"Error creating snapshot of store {store_id}: {e}")
+            raise
+        finally:
+            dest.close()
+
+    def set_id_block(self, block: int) -> None:
+        """Create rows in this database with IDs from a store's ID block.
+
+        Args:
+            block: The store's ID; 0 (the default) is the server's block
+        """
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.execute("DELETE FROM LocalIdBlock")
+            conn.execute("INSERT INTO LocalIdBlock (Block) VALUES (?)", (block,))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _insert_query(self, table: str, data: Dict[str, Any]) -> str:
+        """Build the INSERT of a change-tracked row, taking its ID from this database's ID block."""
+        key = CHANGE_TRACKED_TABLES[table]
+        columns = list(data)
+        values = ['?' for _ in data]
+        if key not in data:
+            columns.insert(0, key)
+            values.insert(0, next_id_sql(table))
+        return f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(values)})"
+
     # Store methods
     def insert_store(self, data: Dict[str, Any]) -> Optional[int]:
         """Insert a new store record."""
@@ -458,9 +1333,7 @@ class SQLiteDatabase:
             self.logger.error(f"Missing required fields: {required_fields - set(data)}")
             raise ValueError(f"Missing required fields: {required_fields - set(data)}")
 
-        columns = ', '.join(data.keys())
-        placeholders = ', '.join(['?' for _ in data])
-        query = f"INSERT INTO Operator ({columns}) VALUES ({placeholders})"
+        query = self._insert_query('Operator', data)
 
         try:
             conn = sqlite3.connect(self.db_path)
@@ -555,9 +1428,7 @@ class SQLiteDatabase:
             self.logger.error(f"Missing required fields: {required_fields - set(data)}")
             raise ValueError(f"Missing required fields: {required_fields - set(data)}")
 
-        columns = ', '.join(data.keys())
-        placeholders = ', '.join(['?' for _ in data])
-        query = f"INSERT INTO Customer ({columns}) VALUES ({placeholders})"
+        query = self._insert_query('Customer', data)
 
         try:
             conn = sqlite3.connect(self.db_path)
@@ -605,6 +1476,60 @@ class SQLiteDatabase:
         finally:
             conn.close()
 
+    def lookup_customer(self, store_id: int, query: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """Find customers of a store by phone digits or name prefix.
+
+        Queries containing letters match the start of the name, case-insensitively.
+        Otherwise the digits are matched against the end of the phone number, so
+        "0123" finds "+1-555-0123". Both are range scans on a (StoreID, ...) index,
+        and each match carries its most recent purchase date.
+
+        Args:
+            store_id: Store whose customers are searched.
+            query: Name prefix or phone digits typed at checkout.
+            limit: Maximum number of customers to return.
+
+        Returns:
+            List of dictionaries with customer details and LastPurchaseDate.
+        """
+        self.logger.info(f"Looking up customers of store {store_id} for '{query}'")
+        query = query.strip()
+        if any(ch.isalpha() for ch in query):
+            prefix = query.lower()
+            where = "c.Name COLLATE NOCASE >= ? AND c.Name COLLATE NOCASE < ?"
+            order = "c.Name COLLATE NOCASE"
+        else:
+            prefix = phone_key(query)
+            where = "c.PhoneKey >= ? AND c.PhoneKey < ?"
+            order = "c.PhoneKey"
+        if not prefix or limit <= 0:
+            return []
+        upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+        sql = f'''
+            SELECT c.CustomerID, c.StoreID, c.Name, c.ContactInfo, c.Age, c.Gender, c.Address,
+                   (SELECT MAX(p.DateOfPurchase) FROM Purchase p
+                    WHERE p.CustomerID = c.CustomerID) AS LastPurchaseDate
+            FROM Customer c
+            WHERE c.StoreID = ? AND {where}
+            ORDER BY {order}
+            LIMIT ?
+        '''
+
+        try:
+            conn = sqlite3.connect(self.db_path)
+            conn.row_factory = sqlite3.Row
+            cursor = conn.cursor()
+            cursor.execute(sql, (store_id, prefix, upper, limit))
+            results = [dict(row) for row in cursor.fetchall()]
+            self.logger.info(f"Found {len(results)} customers matching '{query}'")
+            return results
+        except sqlite3.Error as e:
+            self.logger.error(f"Error looking up Customer: {e}")
+            return []
+        finally:
+            conn.close()
+
     def delete_customer(self, condition: Dict[str, Any]) -> int:
         """Delete records from the Customer table.
 
@@ -749,16 +1674,16 @@ class SQLiteDatabase:
             self.logger.error(f"Missing required fields: {required_fields - set(data)}")
             raise ValueError(f"Missing required fields: {required_fields - set(data)}")
 
-        columns = ', '.join(data.keys())
-        placeholders = ', '.join(['?' for _ in data])
-        query = f"INSERT INTO Medicine ({columns}) VALUES ({placeholders})"
+        query = self._insert_query('Medicine', data)
 
         try:
             conn = sqlite3.connect(self.db_path)
             cursor = conn.cursor()
             cursor.execute(query, list(data.values()))
-            conn.commit()
             record_id = cursor.lastrowid
+            # Opening stock enters the ledger with the medicine
+            record_stock_adjustments(conn, [record_id], "opening")
+            conn.commit()
             self.logger.info(f"Successfully inserted record into Medicine, ID: {record_id}")
             return record_id
         except sqlite3.Error as e:
@@ -800,6 +1725,54 @@ class SQLiteDatabase:
         finally:
             conn.close()
 
+    def search_medicine(self, query: str, store_id: Optional[int] = None, limit: int = 20) -> List[Dict[str, Any]]:
+        """Search medicines by name, brand, type and schedule category.
+
+        Every word in the query is matched as a prefix, so partial input such as
+        "para 500" finds "Paracetamol 500mg". Matches in Name rank above matches
+        in Brand, Type and ScheduleCategory.
+
+        Args:
+            query: Free text typed by the user.
+            store_id: Restrict results to this store (optional).
+            limit: Maximum number of results to return.
+
+        Returns:
+            List of dictionaries containing the best matching medicines.
+        """
+        self.logger.info(f"Searching Medicine for '{query}'")
+        terms = re.findall(r"\w+", query)
+        if not terms or limit <= 0:
+            return []
+
+        match = " ".join(f'"{term}"*' for term in terms)
+        if store_id is not None:
+            match = f'StoreID : "{int(store_id)}" AND ({match})'
+
+        sql = '''
+            SELECT m.MedicineID, m.StoreID, m.Name, m.Brand, m.Type, m.ScheduleCategory,
+                   m.Price, m.StockQuantity, m.RequiresPrescription, m.Barcode
+            FROM MedicineSearch
+            JOIN Medicine m ON m.MedicineID = MedicineSearch.rowid
+            WHERE MedicineSearch MATCH ?
+            ORDER BY bm25(MedicineSearch, 10.0, 4.0, 2.0, 1.0, 0.0)
+            LIMIT ?
+        '''
+
+        try:
+            conn = sqlite3.connect(self.db_path)
+            conn.row_factory = sqlite3.Row
+            cursor = conn.cursor()
+            cursor.execute(sql, (match, limit))
+            results = [dict(row) for row in cursor.fetchall()]
+            self.logger.info(f"Found {len(results)} medicines matching '{query}'")
+            return results
+        except sqlite3.Error as e:
+            self.logger.error(f"Error searching Medicine: {e}")
+            return []
+        finally:
+            conn.close()
+
     def delete_medicine(self, condition: Dict[str, Any]) -> int:
         """Delete records from the Medicine table.
 
@@ -847,9 +1820,7 @@ class SQLiteDatabase:
             self.logger.error(f"Missing required fields: {required_fields - set(data)}")
             raise ValueError(f"Missing required fields: {required_fields - set(data)}")
 
-        columns = ', '.join(data.keys())
-        placeholders = ', '.join(['?' for _ in data])
-        query = f"INSERT INTO Purchase ({columns}) VALUES ({placeholders})"
+        query = self._insert_query('Purchase', data)
 
         try:
             conn = sqlite3.connect(self.db_path)
@@ -865,6 +1836,138 @@ class SQLiteDatabase:
         finally:
             conn.close()
 
+    def checkout_purchase(self, store_id: int, items: List[Dict[str, Any]], customer_id: Optional[int] = None,
+                          operator_id: Optional[int] = None,
+                          date_of_purchase: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Sell a basket: take the stock, record the purchase and its lines atomically.
+
+        Stock is taken with one conditional UPDATE per medicine
+        (StockQuantity = StockQuantity - n WHERE StockQuantity >= n), so two
+        tills selling the last units at once cannot both succeed and no
+        stock is read before it is written. If any line cannot be covered,
+        nothing is written and the failing lines are reported. Otherwise each
+        line is allocated to the medicine's batches first-expiry-first-out
+        (see allocate_fefo), and the purchase, its items, their batch
+        consumption and a 'sale' StockMovement per medicine and batch line
+        are committed together with the stock changes. Units on expired
+        batches count towards StockQuantity but are never sold: a line only
+        they could cover is refused like a line short of stock.
+
+        Args:
+            store_id: The ID of the store selling the basket
+            items: Lines as {"medicine_id": int, "quantity": int}
+            customer_id: Optional ID of the customer
+            operator_id: Optional ID of the operator at the till
+            date_of_purchase: Purchase time (default: now)
+
+        Returns:
+            Dictionary with purchase_id (None if the basket was refused),
+            total_amount and failed, a list of {index, medicine_id, requested,
+            available} for lines without enough stock; None if an error occurs
+
+        Raises:
+            ValueError: If the basket is empty or a line is malformed
+        """
+        if not items:
+            raise ValueError("A purchase needs at least one item")
+        wanted: Dict[int, int] = {}
+        for item in items:
+            quantity = item.get("quantity")
+            if not isinstance(quantity, int) or isinstance(quantity, bool) or quantity <= 0:
+                raise ValueError(f"Invalid quantity for medicine {item.get('medicine_id')}: {quantity!r}")
+            # Lines of the same medicine draw on the same stock
+            wanted[item["medicine_id"]] = wanted.get(item["medicine_id"], 0) + quantity
+
+        self.logger.info(f"Checking out {len(items)} lines in store {store_id}")
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            # Read before any stock is taken; lines draw it down as they use it
+            unbatched = unbatched_stock(conn, store_id, list(wanted))
+            short = [
+                medicine_id for medicine_id, quantity in wanted.items()
+                if conn.execute(
+                    "UPDATE Medicine SET StockQuantity = StockQuantity - ? "
+                    "WHERE MedicineID = ? AND StoreID = ? AND StockQuantity >= ?",
+                    (quantity, medicine_id, store_id, quantity)
+                ).rowcount != 1
+            ]
+            if short:
+                conn.execute("ROLLBACK")
+                available = dict(conn.execute(
+                    f"SELECT MedicineID, StockQuantity FROM Medicine WHERE StoreID = ? "
+                    f"AND MedicineID IN ({', '.join('?' for _ in short)})",
+                    [store_id] + short
+                ).fetchall())
+                failed = [
+                    {"index": index, "medicine_id": item["medicine_id"], "requested": item["quantity"],
+                     "available": available.get(item["medicine_id"], 0)}
+                    for index, item in enumerate(items) if item["medicine_id"] in short
+                ]
+                self.logger.info(f"Refused purchase in store {store_id}: {len(failed)} lines short of stock")
+                return {"purchase_id": None, "total_amount": 0, "failed": failed, "allocations": []}
+
+            ids = list(wanted)
+            prices = dict(conn.execute(
+                f"SELECT MedicineID, Price FROM Medicine WHERE MedicineID IN ({', '.join('?' for _ in ids)})", ids
+            ).fetchall())
+            total_amount = sum(item["quantity"] * prices[item["medicine_id"]] for item in items)
+            date_of_purchase = date_of_purchase or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            purchase_id = conn.execute(
+                f"INSERT INTO Purchase (PurchaseID, StoreID, CustomerID, OperatorID, DateOfPurchase, TotalAmount) "
+                f"VALUES ({next_id_sql('Purchase')}, ?, ?, ?, ?, ?)",
+                (store_id, customer_id, operator_id, date_of_purchase, total_amount)
+            ).lastrowid
+            allocations = []
+            expired = []
+            for index, item in enumerate(items):
+                purchase_item_id = conn.execute(
+                    f"INSERT INTO PurchaseItem (PurchaseItemID, PurchaseID, MedicineID, Quantity, PricePerUnit) "
+                    f"VALUES ({next_id_sql('PurchaseItem')}, ?, ?, ?, ?)",
+                    (purchase_id, item["medicine_id"], item["quantity"], prices[item["medicine_id"]])
+                ).lastrowid
+                allocation = allocate_fefo(conn, store_id, item["medicine_id"], item["quantity"],
+                                           date_of_purchase[:10], unbatched.get(item["medicine_id"], 0))
+                unbatched[item["medicine_id"]] = unbatched.get(item["medicine_id"], 0) - allocation["unbatched"]
+                if allocation["short"]:
+                    expired.append({"index": index, "medicine_id": item["medicine_id"],
+                                    "requested": item["quantity"],
+                                    "available": item["quantity"] - allocation["short"]})
+                record_consumption(conn, purchase_item_id, allocation["batches"])
+                allocations.append({"purchase_item_id": purchase_item_id, **allocation})
+            if expired:
+                conn.execute("ROLLBACK")
+                self.logger.info(f"Refused purchase in store {store_id}: {len(expired)} lines only covered by "
+                                 f"expired batches")
+                return {"purchase_id": None, "total_amount": 0, "failed": expired, "allocations": []}
+            # One 'sale' movement per batch line consumed, plus any unbatched remainder
+            sold: Dict[tuple, int] = {}
+            for item, allocation in zip(items, allocations):
+                for batch in allocation["batches"]:
+                    key = (item["medicine_id"], batch["batch_item_id"])
+                    sold[key] = sold.get(key, 0) + batch["quantity"]
+                if allocation["unbatched"]:
+                    key = (item["medicine_id"], None)
+                    sold[key] = sold.get(key, 0) + allocation["unbatched"]
+            conn.executemany(
+                "INSERT INTO StockMovement (MovementUID, StoreID, MedicineID, Delta, Reason, Reference, BatchItemID) "
+                "VALUES (?, ?, ?, ?, 'sale', ?, ?)",
+                [(uuid.uuid4().hex, store_id, medicine_id, -quantity, f"purchase:{purchase_id}", batch_item_id)
+                 for (medicine_id, batch_item_id), quantity in sold.items()]
+            )
+            snapshot_if_due(conn)
+            conn.execute("COMMIT")
+            self.logger.info(f"Successfully checked out purchase {purchase_id}, total {total_amount}")
+            return {"purchase_id": purchase_id, "total_amount": total_amount, "failed": [],
+                    "allocations": allocations}
+        except sqlite3.Error as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            self.logger.error(f"Error checking out purchase: {e}")
+            return None
+        finally:
+            conn.close()
+
     def get_purchase(self, condition: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
         """Retrieve records from the Purchase table.
 
@@ -944,9 +2047,7 @@ class SQLiteDatabase:
             self.logger.error(f"Missing required fields: {required_fields - set(data)}")
             raise ValueError(f"Missing required fields: {required_fields - set(data)}")
 
-        columns = ', '.join(data.keys())
-        placeholders = ', '.join(['?' for _ in data])
-        query = f"INSERT INTO PurchaseItem ({columns}) VALUES ({placeholders})"
+        query = self._insert_query('PurchaseItem', data)
 
         try:
             conn = sqlite3.connect(self.db_path)
@@ -1025,12 +2126,13 @@ class SQLiteDatabase:
         finally:
             conn.close()
 
-    def add_batch(self, invoice_number: str, supplier: str, batch_number: str, 
+    def add_batch(self, store_id: int, invoice_number: str, supplier: str, batch_number: str,
                  batch_size: int, expiry_date: datetime, storage_location: str, 
                  barcode: Optional[str] = None) -> Optional[int]:
         """Add a new batch record.
 
         Args:
+            store_id: The ID of the store receiving the batch
             invoice_number: The invoice number for this batch
             supplier: The supplier's name
             batch_number: The batch number
@@ -1049,11 +2151,11 @@ class SQLiteDatabase:
             
             cursor.execute("""
                 INSERT INTO Batch (
-                    InvoiceNumber, Supplier, BatchNumber, BatchSize,
+                    StoreID, InvoiceNumber, Supplier, BatchNumber, BatchSize,
                     ExpiryDate, StorageLocation, Barcode
-                ) VALUES (?, ?, ?, ?, ?, ?, ?)
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
             """, (
-                invoice_number, supplier, batch_number, batch_size,
+                store_id, invoice_number, supplier, batch_number, batch_size,
                 expiry_date, storage_location, barcode
             ))
             
@@ -1111,7 +2213,10 @@ class SQLiteDatabase:
             conn.close()
 
     def add_batch_item(self, batch_id: int, medicine_id: int, quantity: int) -> Optional[int]:
-        """Add an item to a batch.
+        """Add an item to a batch and receive it into stock.
+
+        The batch line, a 'receipt' StockMovement for it and the increase of
+        the medicine's stock are committed together.
 
         Args:
             batch_id: The ID of the batch
@@ -1122,25 +2227,132 @@ class SQLiteDatabase:
             The ID of the inserted batch item record, or None if an error occurs
         """
         self.logger.info(f"Adding item {medicine_id} to batch {batch_id}")
+        conn = sqlite3.connect(self.db_path, isolation_level=None)
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                INSERT INTO BatchItem (BatchID, MedicineID, Quantity)
-                VALUES (?, ?, ?)
-            """, (batch_id, medicine_id, quantity))
-            
-            item_id = cursor.lastrowid
-            conn.commit()
+            conn.execute("BEGIN IMMEDIATE")
+            batch = conn.execute(
+                "SELECT StoreID, InvoiceNumber, ExpiryDate FROM Batch WHERE BatchID = ?", (batch_id,)
+            ).fetchone()
+            if batch is None:
+                conn.execute("ROLLBACK")
+                self.logger.error(f"Error adding batch item: batch {batch_id} does not exist")
+                return None
+            store_id, invoice_number, expiry_date = batch
+
+            # Every unit starts out available to FEFO allocation
+            item_id = conn.execute("""
+                INSERT INTO BatchItem (BatchID, MedicineID, Quantity, ExpiryDate, RemainingQuantity)
+                VALUES (?, ?, ?, ?, ?)
+            """, (batch_id, medicine_id, quantity, expiry_date, quantity)).lastrowid
+            movement = validate_stock_movement({
+                'MovementUID': uuid.uuid4().hex, 'MedicineID': medicine_id, 'Delta': quantity,
+                'Reason': 'receipt', 'Reference': f"invoice:{invoice_number}"
+            })
+            movement['BatchItemID'] = item_id
+            error = apply_stock_movements(conn, store_id, [movement])[0]
+            if error:
+                conn.execute("ROLLBACK")
+                self.logger.error(f"Error adding batch item: {error}")
+                return None
+            conn.execute("COMMIT")
             self.logger.info(f"Successfully added batch item with ID: {item_id}")
             return item_id
-        except sqlite3.Error as e:
+        except (sqlite3.Error, ValueError) as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
             self.logger.error(f"Error adding batch item: {e}")
             return None
         finally:
             conn.close()
 
+    def record_stock_movement(self, store_id: int, medicine_id: int, delta: int, reason: str,
+                              reference: Optional[str] = None,
+                              movement_uid: Optional[str] = None) -> Optional[str]:
+        """Record a signed stock change and apply it to the medicine's stock.
+
+        Args:
+            store_id: The ID of the store holding the medicine
+            medicine_id: The ID of the medicine
+            delta: Quantity added (positive) or removed (negative)
+            reason: One of STOCK_MOVEMENT_REASONS, e.g. 'sale' or 'receipt'
+            reference: Optional source document, e.g. a purchase or invoice number
+            movement_uid: Unique ID of the movement (generated if omitted)
+
+        Returns:
+            The movement's unique ID, or None if an error occurs
+        """
+        movement_uid = movement_uid or uuid.uuid4().hex
+        self.logger.info(f"Recording stock movement {movement_uid}: {delta:+d} of medicine {medicine_id}")
+        conn = sqlite3.connect(self.db_path, isolation_level=None)
+        try:
+            movement = validate_stock_movement({
+                'MovementUID': movement_uid, 'MedicineID': medicine_id,
+                'Delta': delta, 'Reason': reason, 'Reference': reference
+            })
+            conn.execute("BEGIN IMMEDIATE")
+            error = apply_stock_movements(conn, store_id, [movement])[0]
+            if error:
+                conn.execute("ROLLBACK")
+                self.logger.error(f"Error recording stock movement: {error}")
+                return None
+            conn.execute("COMMIT")
+            return movement_uid
+        except (sqlite3.Error, ValueError) as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            self.logger.error(f"Error recording stock movement: {e}")
+            return None
+        finally:
+            conn.close()
+
+
+    def take_stock_snapshot(self) -> Optional[int]:
+        """Materialize the current ledger balances of every store, medicine and batch.
+
+        Snapshots are also taken automatically every STOCK_SNAPSHOT_INTERVAL
+        movements; this forces one, e.g. at the end of a business day.
+
+        Returns:
+            The snapshot's ID, None if nothing moved since the last one or if
+            an error occurs
+        """
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            snapshot_id = take_balance_snapshot(conn)
+            conn.execute("COMMIT")
+            self.logger.info(f"Took stock balance snapshot {snapshot_id}")
+            return snapshot_id
+        except sqlite3.Error as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            self.logger.error(f"Error taking stock snapshot: {e}")
+            return None
+        finally:
+            conn.close()
+
+    def get_stock_at(self, store_id: int, as_of: Optional[str] = None, medicine_id: Optional[int] = None,
+                     by_batch: bool = False) -> List[Dict[str, Any]]:
+        """Get a store's stock at a point in time from the StockMovement ledger.
+
+        Args:
+            store_id: The ID of the store
+            as_of: UTC time as YYYY-MM-DD HH:MM:SS (default: now)
+            medicine_id: Optional ID of a single medicine
+            by_batch: Report each batch line separately
+
+        Returns:
+            List of {MedicineID, Quantity} (and BatchItemID when by_batch is
+            set), or an empty list if an error occurs
+        """
+        conn = sqlite3.connect(self.db_path)
+        try:
+            return stock_at(conn, store_id, as_of, medicine_id, by_batch)
+        except sqlite3.Error as e:
+            self.logger.error(f"Error reading stock of store {store_id} at {as_of}: {e}")
+            return []
+        finally:
+            conn.close()
 
 if __name__ == '__main__':
     db = SQLiteDatabase('medical_store.db')
\ No newline at end of file
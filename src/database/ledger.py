@@ -0,0 +1,161 @@
+"""Balance snapshots over the append-only StockMovement ledger and point-in-time stock queries."""
+
+
+import sqlite3
+from typing import Any, Dict, List, Optional
+
+# Movements recorded after the latest balance snapshot before a new one is taken
+STOCK_SNAPSHOT_INTERVAL = 1000
+
+
+def _latest_snapshot(conn: sqlite3.Connection) -> Optional[tuple]:
+    return conn.execute(
+        "SELECT SnapshotID, AsOfMovementID FROM StockSnapshot ORDER BY SnapshotID DESC LIMIT 1"
+    ).fetchone()
+
+
+def take_balance_snapshot(conn: sqlite3.Connection) -> Optional[int]:
+    """Materialize every (store, medicine, batch) balance as of the latest movement.
+
+    The new balances are the previous snapshot's plus the movements
+    recorded since, so the work is proportional to the number of balances
+    and the interval, not to the length of the ledger. Runs inside the
+    caller's transaction.
+
+    Args:
+        conn: Connection with an open write transaction.
+
+    Returns:
+        The new snapshot's ID, or None if nothing moved since the last one.
+    """
+    last_movement = conn.execute("SELECT COALESCE(MAX(MovementID), 0) FROM StockMovement").fetchone()[0]
+    previous = _latest_snapshot(conn)
+    previous_id, previous_movement = previous if previous else (None, 0)
+    if last_movement <= previous_movement:
+        return None
+
+    snapshot_id = conn.execute(
+        "INSERT INTO StockSnapshot (AsOfMovementID, TakenAt) VALUES (?, datetime('now'))", (last_movement,)
+    ).lastrowid
+    conn.execute('''
+        INSERT INTO StockBalanceSnapshot (SnapshotID, StoreID, MedicineID, BatchItemID, Balance)
+        SELECT ?, StoreID, MedicineID, BatchItemID, SUM(Delta) FROM (
+            SELECT StoreID, MedicineID, BatchItemID, Balance AS Delta
+            FROM StockBalanceSnapshot WHERE SnapshotID = ?
+            UNION ALL
+            SELECT StoreID, MedicineID, COALESCE(BatchItemID, 0), Delta
+            FROM StockMovement WHERE MovementID > ? AND MovementID <= ?
+        )
+        GROUP BY StoreID, MedicineID, BatchItemID
+        HAVING SUM(Delta) != 0
+    ''', (snapshot_id, previous_id, previous_movement, last_movement))
+    return snapshot_id
+
+
+def snapshot_if_due(conn: sqlite3.Connection, interval: int = STOCK_SNAPSHOT_INTERVAL) -> Optional[int]:
+    """Take a balance snapshot once interval movements have been recorded since the last one."""
+    last_movement = conn.execute("SELECT COALESCE(MAX(MovementID), 0) FROM StockMovement").fetchone()[0]
+    previous = _latest_snapshot(conn)
+    if last_movement - (previous[1] if previous else 0) < interval:
+        return None
+    return take_balance_snapshot(conn)
+
+
+def record_stock_adjustments(conn: sqlite3.Connection, medicine_ids: List[int],
+                             reference: Optional[str] = None) -> int:
+    """Bring medicines whose stock was written directly back in line with the ledger.
+
+    Inserting a medicine with opening stock, or setting StockQuantity
+    through an edit or a synced row, changes the stock without a movement.
+    For each given medicine whose StockQuantity differs from its ledger
+    balance (latest snapshot plus the movements since), the difference is
+    recorded as an 'adjustment' movement. Runs inside the caller's
+    transaction, after the write.
+
+    Args:
+        conn: Connection with an open write transaction.
+        medicine_ids: Medicines that may have been written.
+        reference: Optional reference of the movements, e.g. 'opening'.
+
+    Returns:
+        The number of adjustment movements recorded.
+    """
+    previous = _latest_snapshot(conn)
+    snapshot_id, snapshot_movement = previous if previous else (None, 0)
+    recorded = 0
+    ids = list(dict.fromkeys(medicine_ids))
+    for start in range(0, len(ids), 500):
+        chunk = ids[start:start + 500]
+        recorded += conn.execute(f'''
+            INSERT INTO StockMovement (MovementUID, StoreID, MedicineID, Delta, Reason, Reference)
+            SELECT lower(hex(randomblob(16))), StoreID, MedicineID, Delta, 'adjustment', ? FROM (
+                SELECT m.StoreID, m.MedicineID, m.StockQuantity
+                    - COALESCE((SELECT SUM(b.Balance) FROM StockBalanceSnapshot b WHERE b.SnapshotID = ?
+                                AND b.StoreID = m.StoreID AND b.MedicineID = m.MedicineID), 0)
+                    - COALESCE((SELECT SUM(s.Delta) FROM StockMovement s
+                                WHERE s.MedicineID = m.MedicineID AND s.MovementID > ?), 0) AS Delta
+                FROM Medicine m WHERE m.MedicineID IN ({', '.join('?' for _ in chunk)})
+            )
+            WHERE Delta != 0
+        ''', [reference, snapshot_id, snapshot_movement] + chunk).rowcount
+    if recorded:
+        snapshot_if_due(conn)
+    return recorded
+
+
+def stock_at(conn: sqlite3.Connection, store_id: int, as_of: Optional[str] = None,
+             medicine_id: Optional[int] = None, by_batch: bool = False) -> List[Dict[str, Any]]:
+    """Compute a store's stock at a point in time from the ledger.
+
+    Starts from the latest snapshot taken at or before as_of and adds only
+    the movements between that snapshot and the next one that were
+    recorded by as_of, so at most one interval of the ledger is read.
+
+    Args:
+        conn: Connection to the database.
+        store_id: Store whose stock is wanted.
+        as_of: UTC time as YYYY-MM-DD HH:MM:SS (default: now).
+        medicine_id: Only report this medicine.
+        by_batch: Report a balance per batch line instead of per medicine.
+
+    Returns:
+        List of {MedicineID, BatchItemID, Quantity} with non-zero quantities;
+        BatchItemID is None for stock outside any batch, and omitted unless
+        by_batch is set.
+    """
+    as_of = as_of or conn.execute("SELECT datetime('now')").fetchone()[0]
+    base = conn.execute(
+        "SELECT SnapshotID, AsOfMovementID FROM StockSnapshot WHERE TakenAt <= ? "
+        "ORDER BY SnapshotID DESC LIMIT 1", (as_of,)
+    ).fetchone()
+    base_id, base_movement = base if base else (None, 0)
+    following = conn.execute(
+        "SELECT AsOfMovementID FROM StockSnapshot WHERE SnapshotID > ? ORDER BY SnapshotID LIMIT 1",
+        (base_id or 0,)
+    ).fetchone()
+    # Movements after the next snapshot were recorded after as_of
+    tail_end = following[0] if following else conn.execute(
+        "SELECT COALESCE(MAX(MovementID), 0) FROM StockMovement"
+    ).fetchone()[0]
+
+    medicine_filter = "AND MedicineID = ?" if medicine_id is not None else ""
+    medicine_params = [medicine_id] if medicine_id is not None else []
+    batch_column = "BatchItemID" if by_batch else "0"
+    rows = conn.execute(f'''
+        SELECT MedicineID, {batch_column} AS BatchKey, SUM(Delta) FROM (
+            SELECT MedicineID, BatchItemID, Balance AS Delta FROM StockBalanceSnapshot
+            WHERE SnapshotID = ? AND StoreID = ? {medicine_filter}
+            UNION ALL
+            SELECT MedicineID, COALESCE(BatchItemID, 0), Delta FROM StockMovement
+            WHERE MovementID > ? AND MovementID <= ? AND CreatedAt <= ? AND StoreID = ? {medicine_filter}
+        )
+        GROUP BY MedicineID, BatchKey
+        HAVING SUM(Delta) != 0
+        ORDER BY MedicineID, BatchKey
+    ''', [base_id, store_id] + medicine_params
+         + [base_movement, tail_end, as_of, store_id] + medicine_params).fetchall()
+
+    if by_batch:
+        return [{"MedicineID": medicine, "BatchItemID": batch or None, "Quantity": quantity}
+                for medicine, batch, quantity in rows]
+    return [{"MedicineID": medicine, "Quantity": quantity} for medicine, _, quantity in rows]
@@ -0,0 +1,252 @@
+"""Streaming export of purchases and their line items as CSV or Parquet.
+
+Rows are read from one SQLite cursor with fetchmany and written chunk by
+chunk, compressed as they go, so memory stays constant however many
+purchases are exported. Run from the command line with
+
+    python -m src.database.purchase_export purchases_2026.csv.gz --from 2026-01-01 --to 2026-12-31
+"""
+
+
+import argparse
+import csv
+import io
+import os
+import sqlite3
+import sys
+import zlib
+from typing import Any, Iterator, List, Optional, Tuple
+
+from src.database.database_sqlite import SQLiteDatabase
+from src.utils.loggers import LoggerFactory
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional dependency
+    pa = pq = None
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+# Exported columns with their Parquet types
+EXPORT_COLUMNS = (
+    ('PurchaseID', 'int64'),
+    ('StoreID', 'int64'),
+    ('DateOfPurchase', 'string'),
+    ('CustomerID', 'int64'),
+    ('OperatorID', 'int64'),
+    ('TotalAmount', 'float64'),
+    ('PurchaseItemID', 'int64'),
+    ('MedicineID', 'int64'),
+    ('MedicineName', 'string'),
+    ('Quantity', 'int64'),
+    ('PricePerUnit', 'float64'),
+    ('LineTotal', 'float64'),
+)
+
+EXPORT_FORMATS = ('csv', 'parquet')
+
+# Rows fetched from the cursor and written per chunk
+DEFAULT_CHUNK_SIZE = 5000
+
+
+def export_formats() -> List[str]:
+    """Return the export formats this installation can write."""
+    return [fmt for fmt in EXPORT_FORMATS if fmt != 'parquet' or pq is not None]
+
+
+def iter_purchase_rows(db_path: str, store_id: Optional[int] = None, date_from: Optional[str] = None,
+                       date_to: Optional[str] = None,
+                       chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[List[Tuple[Any, ...]]]:
+    """Read purchases joined with their line items in chunks, oldest first.
+
+    Args:
+        db_path: Path to the database.
+        store_id: Only export this store's purchases.
+        date_from: First day to export, as YYYY-MM-DD.
+        date_to: Last day to export (inclusive), as YYYY-MM-DD.
+        chunk_size: Rows per chunk.
+
+    Yields:
+        Lists of rows in EXPORT_COLUMNS order.
+    """
+    conditions, params = [], []
+    if store_id is not None:
+        conditions.append("p.StoreID = ?")
+        params.append(store_id)
+    if date_from:
+        conditions.append("p.DateOfPurchase >= ?")
+        params.append(date_from)
+    if date_to:
+        conditions.append("p.DateOfPurchase < date(?, '+1 day')")
+        params.append(date_to)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    conn = sqlite3.connect(db_path)
+    try:
+        cursor = conn.execute(f'''
+            SELECT p.PurchaseID, p.StoreID, p.DateOfPurchase, p.CustomerID, p.OperatorID, p.TotalAmount,
+                   pi.PurchaseItemID, pi.MedicineID, m.Name, pi.Quantity, pi.PricePerUnit,
+                   pi.Quantity * pi.PricePerUnit
+            FROM Purchase p
+            JOIN PurchaseItem pi ON pi.PurchaseID = p.PurchaseID
+            LEFT JOIN Medicine m ON m.MedicineID = pi.MedicineID
+            {where}
+            ORDER BY p.DateOfPurchase, p.PurchaseID, pi.PurchaseItemID
+        ''', params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        conn.close()
+
+
+def _gzip(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _csv_chunks(rows: Iterator[List[Tuple[Any, ...]]]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(name for name, _ in EXPORT_COLUMNS)
+    for chunk in rows:
+        writer.writerows(chunk)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+class _Drain:
+    """Write-only file object whose contents are taken out after every row group."""
+
+    def __init__(self):
+        self._parts: List[bytes] = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data: bytes) -> int:
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def take(self) -> bytes:
+        data, self._parts = b''.join(self._parts), []
+        return data
+
+
+def _parquet_chunks(rows: Iterator[List[Tuple[Any, ...]]], compression: Optional[str]) -> Iterator[bytes]:
+    schema = pa.schema([(name, getattr(pa, kind)()) for name, kind in EXPORT_COLUMNS])
+    sink = _Drain()
+    # Each chunk becomes a row group; only the footer is written at the end
+    writer = pq.ParquetWriter(sink, schema, compression=compression or 'none')
+    try:
+        for chunk in rows:
+            columns = list(zip(*chunk))
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(values, type=field.type) for values, field in zip(columns, schema)], schema=schema
+            ))
+            yield sink.take()
+    finally:
+        writer.close()
+    yield sink.take()
+
+
+def export_purchases(db_path: str, fmt: str = 'csv', compress: bool = True, store_id: Optional[int] = None,
+                     date_from: Optional[str] = None, date_to: Optional[str] = None,
+                     chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[bytes]:
+    """Stream purchases joined with their line items as encoded bytes.
+
+    CSV is gzip-compressed on the fly when compress is set. Parquet
+    compresses inside the file instead, with gzip column chunks, and
+    requires pyarrow.
+
+    Args:
+        db_path: Path to the database.
+        fmt: 'csv' or 'parquet'.
+        compress: Compress the output.
+        store_id: Only export this store's purchases.
+        date_from: First day to export, as YYYY-MM-DD.
+        date_to: Last day to export (inclusive), as YYYY-MM-DD.
+        chunk_size: Rows read and written per chunk.
+
+    Returns:
+        Iterator over consecutive pieces of the file; nothing is read from
+        the database until it is iterated.
+
+    Raises:
+        ValueError: If the format is unknown or its writer is not installed.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format {fmt!r}, expected one of {', '.join(EXPORT_FORMATS)}")
+    if fmt not in export_formats():
+        raise ValueError("Parquet export requires the pyarrow package")
+
+    logger = LoggerFactory("DatabaseLogger", os.path.join(BASE_DIR, "results", "logs"), "database").get_logger()
+    logger.info(f"Exporting purchases as {fmt} (store {store_id}, {date_from} to {date_to})")
+    rows = iter_purchase_rows(db_path, store_id, date_from, date_to, chunk_size)
+    if fmt == 'parquet':
+        return _parquet_chunks(rows, 'gzip' if compress else None)
+    if compress:
+        return _gzip(_csv_chunks(rows))
+    return _csv_chunks(rows)
+
+
+def export_filename(fmt: str, compress: bool, store_id: Optional[int] = None, date_from: Optional[str] = None,
+                    date_to: Optional[str] = None) -> str:
+    """Name an export after its filters, e.g. purchases_store3_2026-01-01_2026-12-31.csv.gz."""
+    parts = ["purchases"]
+    if store_id is not None:
+        parts.append(f"store{store_id}")
+    if date_from or date_to:
+        parts.append(f"{date_from or 'start'}_{date_to or 'end'}")
+    extension = 'parquet' if fmt == 'parquet' else ('csv.gz' if compress else 'csv')
+    return f"{'_'.join(parts)}.{extension}"
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Export purchases and their line items")
+    parser.add_argument("output", help="Output file (.csv, .csv.gz or .parquet)")
+    parser.add_argument("--db", default="medical_store.db", help="Database file, relative to results/")
+    parser.add_argument("--store-id", type=int, help="Only export this store")
+    parser.add_argument("--from", dest="date_from", help="First day, YYYY-MM-DD")
+    parser.add_argument("--to", dest="date_to", help="Last day (inclusive), YYYY-MM-DD")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Rows per chunk")
+    args = parser.parse_args(argv)
+
+    fmt = 'parquet' if args.output.endswith('.parquet') else 'csv'
+    compress = fmt == 'parquet' or args.output.endswith('.gz')
+    db_path = SQLiteDatabase(args.db).db_path
+    try:
+        with open(args.output, 'wb') as f:
+            for piece in export_purchases(db_path, fmt, compress, args.store_id, args.date_from, args.date_to,
+                                          args.chunk_size):
+                f.write(piece)
+    except (sqlite3.Error, ValueError) as e:
+        if os.path.exists(args.output):
+            os.remove(args.output)
+        print(f"Export failed: {e}", file=sys.stderr)
+        return 1
+    print(f"Purchases exported to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
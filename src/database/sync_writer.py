@@ -0,0 +1,226 @@
+"""Single writer thread applying store pushes to the main database with group commit."""
+
+
+import asyncio
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from src.database.batch_apply import BatchApplier, DEFAULT_BATCH_SIZE
+from src.database.database_sqlite import record_sync_activity
+from src.utils.loggers import LoggerFactory
+
+
+class WriterBusyError(Exception):
+    """Raised when the write queue is full and the push should be retried later."""
+
+
+class _Job:
+    __slots__ = ("store_id", "changes", "activity", "future", "loop", "enqueued")
+
+    def __init__(self, store_id: int, changes: List[Dict[str, Any]], activity: Dict[str, Any],
+                 future: asyncio.Future, loop: asyncio.AbstractEventLoop):
+        self.store_id = store_id
+        self.changes = changes
+        self.activity = activity
+        self.future = future
+        self.loop = loop
+        self.enqueued = time.perf_counter()
+
+
+def _deliver(future: asyncio.Future, result: Any) -> None:
+    if future.done():
+        # The client went away while its push was queued
+        return
+    if isinstance(result, BaseException):
+        future.set_exception(result)
+    else:
+        future.set_result(result)
+
+
+class SyncWriter:
+    """Serialize every /sync/push write through one connection on one thread.
+
+    Requests put their changes on a bounded queue and await the result.
+    The writer takes whatever has queued up since its last commit, applies
+    each push under its own savepoint and commits the group once, so many
+    concurrent pushes cost one fsync instead of one lock fight each. When
+    the queue is full, submit() fails fast with WriterBusyError.
+    """
+
+    def __init__(self, db_path: str, max_queue: int = 256, max_group_changes: int = 20000,
+                 busy_timeout_ms: int = 5000, batch_size: int = DEFAULT_BATCH_SIZE):
+        """Initialize the writer.
+
+        Args:
+            db_path: Path to the main server database.
+            max_queue: Pushes that may wait before new ones are refused.
+            max_group_changes: Changes after which a group is committed.
+            busy_timeout_ms: How long the writer waits for other connections' locks.
+            batch_size: Maximum number of rows per executemany call.
+        """
+        self.db_path = db_path
+        self.max_group_changes = max_group_changes
+        self.busy_timeout_ms = busy_timeout_ms
+        self.batch_size = batch_size
+        self._queue: "queue.Queue[Optional[_Job]]" = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._waits = deque(maxlen=1000)
+        self._counters = {"pushes": 0, "changes": 0, "groups": 0, "failed_groups": 0, "rejected": 0,
+                          "max_depth": 0}
+        base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+        log_dir = os.path.join(base_dir, "results", "logs")
+        self.logger = LoggerFactory("DatabaseLogger", log_dir, "database").get_logger()
+
+    def start(self) -> None:
+        """Start the writer thread."""
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="sync-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Finish the queued pushes and stop the writer thread."""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout)
+        self._thread = None
+
+    async def submit(self, store_id: int, changes: List[Dict[str, Any]], **activity: Any) -> Dict[str, Any]:
+        """Queue a push and wait until it is committed.
+
+        Args:
+            store_id: Store the changes belong to.
+            changes: Changes as returned by normalize_changes.
+            **activity: bytes_in and outbox_depth of the push, recorded in the
+                store's StoreSyncState in the same commit.
+
+        Returns:
+            Dictionary with applied and failed counts and per-change results.
+
+        Raises:
+            WriterBusyError: If the queue is full.
+        """
+        self.start()
+        loop = asyncio.get_running_loop()
+        job = _Job(store_id, changes, activity, loop.create_future(), loop)
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                self._counters["rejected"] += 1
+            raise WriterBusyError(f"{self._queue.maxsize} pushes already queued")
+        with self._lock:
+            self._counters["max_depth"] = max(self._counters["max_depth"], self._queue.qsize())
+        return await job.future
+
+    def stats(self) -> Dict[str, Any]:
+        """Report queue depth, group sizes and time spent waiting in the queue."""
+        with self._lock:
+            waits = sorted(self._waits)
+            counters = dict(self._counters)
+
+        def percentile(p: float) -> Optional[float]:
+            if not waits:
+                return None
+            return waits[min(len(waits) - 1, int(p * len(waits)))] * 1000
+
+        return {
+            **counters,
+            "depth": self._queue.qsize(),
+            "max_queue": self._queue.maxsize,
+            "pushes_per_group": counters["pushes"] / counters["groups"] if counters["groups"] else None,
+            "wait_p50_ms": percentile(0.50),
+            "wait_p95_ms": percentile(0.95),
+            "wait_max_ms": waits[-1] * 1000 if waits else None,
+        }
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False)
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout_ms)}")
+        # Readers keep reading while the writer commits
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        return conn
+
+    def _run(self) -> None:
+        conn = self._connect()
+        try:
+            stopping = False
+            while not stopping:
+                job = self._queue.get()
+                if job is None:
+                    break
+                group = [job]
+                changes = len(job.changes)
+                # Group commit: take everything that queued up behind this push
+                while changes < self.max_group_changes:
+                    try:
+                        job = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if job is None:
+                        stopping = True
+                        break
+                    group.append(job)
+                    changes += len(job.changes)
+                self._commit_group(conn, group)
+        finally:
+            conn.close()
+
+    def _commit_group(self, conn: sqlite3.Connection, group: List[_Job]) -> None:
+        started = time.perf_counter()
+        results: List[Any] = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for job in group:
+                conn.execute("SAVEPOINT push_job")
+                try:
+                    result = BatchApplier(conn, job.store_id, self.batch_size).apply(job.changes)
+                    record_sync_activity(conn, job.store_id, 'push', changes=result["applied"], **job.activity)
+                    conn.execute("RELEASE push_job")
+                    results.append(result)
+                except Exception as e:
+                    conn.execute("ROLLBACK TO push_job")
+                    conn.execute("RELEASE push_job")
+                    self.logger.error(f"Error applying push from store {job.store_id}: {e}")
+                    record_sync_activity(conn, job.store_id, 'push', error=str(e))
+                    results.append(e)
+            conn.execute("COMMIT")
+            failed_group = False
+        except Exception as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            self.logger.error(f"Error committing {len(group)} pushes: {e}")
+            results = [e] * len(group)
+            failed_group = True
+            self._record_errors(conn, group, str(e))
+
+        with self._lock:
+            self._counters["groups"] += 1
+            self._counters["failed_groups"] += int(failed_group)
+            self._counters["pushes"] += len(group)
+            self._counters["changes"] += sum(len(job.changes) for job in group)
+            self._waits.extend(started - job.enqueued for job in group)
+
+        for job, result in zip(group, results):
+            try:
+                job.loop.call_soon_threadsafe(_deliver, job.future, result)
+            except RuntimeError:
+                # The request's event loop has already shut down
+                pass
+
+    def _record_errors(self, conn: sqlite3.Connection, group: List[_Job], error: str) -> None:
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for job in group:
+                record_sync_activity(conn, job.store_id, 'push', error=error)
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            self.logger.error(f"Error recording failed pushes: {e}")
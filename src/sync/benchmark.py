@@ -0,0 +1,412 @@
+"""Fleet sync load simulator: many simulated stores against a locally started server.
+
+Usage:
+    python -m src.sync.benchmark --stores 10,50,100 --duration 60
+
+Each scenario seeds a fresh server database, starts the sync API in its own
+process, bootstraps N SyncManager clients and then lets them record sales
+(stock movements) and sync at fixed rates. Per endpoint it reports throughput,
+p50/p95/p99 latency, error, lock-error and busy rates, plus the server's CPU
+time, and writes everything to a JSON file so runs can be compared release
+over release.
+"""
+
+
+import argparse
+import json
+import logging
+import math
+import os
+import platform
+import random
+import signal
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from ..database.database_sqlite import SQLiteDatabase
+from ..utils.loggers import LoggerFactory
+from .sync_manager import SyncManager
+from .transport import SyncTransport
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+# Loggers that would otherwise write a line per queued change and request
+NOISY_LOGGERS = {"SyncLogger": "sync", "DatabaseLogger": "database"}
+
+
+def _quiet_loggers() -> None:
+    log_dir = os.path.join(BASE_DIR, "results", "logs")
+    for name, log_file_base in NOISY_LOGGERS.items():
+        # Set up the logger first, or its first use resets the level to INFO
+        LoggerFactory(name, log_dir, log_file_base).get_logger().setLevel(logging.WARNING)
+
+
+def percentile(sorted_values: List[float], p: float) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted list (None if empty)."""
+    if not sorted_values:
+        return None
+    rank = max(math.ceil(p / 100 * len(sorted_values)), 1)
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(samples: List[Dict[str, Any]], duration: float) -> Dict[str, Any]:
+    """Summarize request samples of one endpoint.
+
+    Args:
+        samples: Samples as recorded by RequestRecorder
+        duration: Length of the measured window in seconds
+
+    Returns:
+        Dictionary with count, throughput, error rates and latency percentiles in ms
+    """
+    latencies = sorted(s["seconds"] * 1000 for s in samples)
+    count = len(samples)
+    errors = sum(1 for s in samples if s["status"] is None or s["status"] >= 400)
+    lock_errors = sum(1 for s in samples if s["locked"])
+    busy = sum(1 for s in samples if s["status"] == 503)
+    return {
+        "count": count,
+        "throughput_rps": count / duration if duration else None,
+        "errors": errors,
+        "error_rate": errors / count if count else 0.0,
+        "lock_errors": lock_errors,
+        "lock_error_rate": lock_errors / count if count else 0.0,
+        "busy": busy,
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99),
+        "max_ms": latencies[-1] if latencies else None,
+    }
+
+
+class RequestRecorder:
+    """Thread-safe collection of request samples, grouped by endpoint."""
+
+    def __init__(self):
+        self.enabled = False
+        self._samples: Dict[str, List[Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint: str, seconds: float, status: Optional[int], locked: bool = False) -> None:
+        if not self.enabled:
+            return
+        sample = {"seconds": seconds, "status": status, "locked": locked}
+        with self._lock:
+            self._samples.setdefault(endpoint, []).append(sample)
+
+    def report(self, duration: float) -> Dict[str, Any]:
+        with self._lock:
+            samples = {endpoint: list(values) for endpoint, values in self._samples.items()}
+        return {endpoint: summarize(values, duration) for endpoint, values in sorted(samples.items())}
+
+
+class RecordingTransport(SyncTransport):
+    """SyncTransport that records the latency and outcome of every call."""
+
+    def __init__(self, base_url: str, recorder: RequestRecorder, **kwargs):
+        super().__init__(base_url, **kwargs)
+        self.recorder = recorder
+
+    def request(self, method: str, path: str, **kwargs):
+        endpoint = path.split("?")[0]
+        if endpoint.startswith("/sync/bootstrap/"):
+            endpoint = "/sync/bootstrap/{table}"
+        start = time.perf_counter()
+        try:
+            response = super().request(method, path, **kwargs)
+        except Exception:
+            self.recorder.record(endpoint, time.perf_counter() - start, None)
+            raise
+        locked = response.status_code >= 500 and "locked" in response.text.lower()
+        self.recorder.record(endpoint, time.perf_counter() - start, response.status_code, locked)
+        return response
+
+
+class SimulatedStore:
+    """One store recording sales and syncing at fixed rates."""
+
+    def __init__(self, store: Dict[str, Any], server_url: str, work_dir: str, recorder: RequestRecorder,
+                 sales_per_minute: float, sync_interval: float, seed: int):
+        self.store = store
+        self.sales_per_minute = sales_per_minute
+        self.sync_interval = sync_interval
+        self.rng = random.Random(seed)
+        self.sales = 0
+        self.cycles: List[float] = []
+        self.failed_cycles = 0
+        self.medicine_ids: List[int] = []
+        self.manager = SyncManager(
+            str(store["StoreID"]), server_url, os.path.join(work_dir, f"store_{store['StoreID']}.db"),
+            store_name=store["StoreName"], license_number=store["LicenseNumber"],
+            # No retries: the benchmark reports what the server answers
+            transport=RecordingTransport(server_url, recorder, max_retries=0, failure_threshold=10 ** 9)
+        )
+
+    def setup(self) -> bool:
+        """Connect, bootstrap and pick up the store's medicines."""
+        if not self.manager.sync_changes():
+            return False
+        conn = sqlite3.connect(self.manager.local_db_path)
+        try:
+            self.medicine_ids = [row[0] for row in conn.execute("SELECT MedicineID FROM Medicine")]
+        finally:
+            conn.close()
+        return bool(self.medicine_ids)
+
+    def run(self, start_at: float, deadline: float) -> None:
+        """Record sales as a Poisson stream and sync every sync_interval until deadline."""
+        time.sleep(max(start_at - time.monotonic(), 0))
+        self.manager.sync_token = None
+        self.manager.connect_to_server()
+        rate = self.sales_per_minute / 60
+        next_sale = time.monotonic() + (self.rng.expovariate(rate) if rate else float("inf"))
+        next_sync = time.monotonic() + self.rng.uniform(0, self.sync_interval)
+        while True:
+            now = time.monotonic()
+            if now >= deadline:
+                return
+            if now >= next_sale:
+                medicine_id = self.rng.choice(self.medicine_ids)
+                if self.manager.record_stock_movement(medicine_id, -self.rng.randint(1, 3), "sale",
+                                                      reference=f"bench-{self.store['StoreID']}-{self.sales}"):
+                    self.sales += 1
+                next_sale += self.rng.expovariate(rate)
+            elif now >= next_sync:
+                started = time.perf_counter()
+                if self.manager.sync_changes():
+                    self.cycles.append(time.perf_counter() - started)
+                else:
+                    self.failed_cycles += 1
+                next_sync = time.monotonic() + self.sync_interval
+            else:
+                time.sleep(min(next_sale, next_sync, deadline) - now)
+
+    def drain(self, attempts: int = 5) -> int:
+        """Push what is left in the outbox; returns the entries still queued."""
+        for _ in range(attempts):
+            if self.manager.outbox.depth() == 0:
+                break
+            self.manager.sync_changes()
+        return self.manager.outbox.depth()
+
+
+def seed_database(db_path: str, stores: int, medicines: int) -> List[Dict[str, Any]]:
+    """Create a server database with stores and medicines for a scenario."""
+    db = SQLiteDatabase(db_path)
+    _quiet_loggers()
+    created = []
+    for n in range(stores):
+        store = {"StoreName": f"Bench Store {n}", "Address": f"{n} Bench Road", "LicenseNumber": f"BENCH-{n}"}
+        store["StoreID"] = db.insert_store(dict(store))
+        created.append(store)
+
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.executemany(
+            "INSERT INTO Medicine (StoreID, Name, Price, StockQuantity) VALUES (?, ?, ?, ?)",
+            [(store["StoreID"], f"Medicine {m}", 1.0 + m % 20, 1_000_000)
+             for store in created for m in range(medicines)]
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    return created
+
+
+def build_app(db_path: str):
+    """Build an API app serving only the sync routes, backed by db_path."""
+    from contextlib import asynccontextmanager
+    from fastapi import FastAPI
+    from api.routes import sync as sync_routes
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        try:
+            yield
+        finally:
+            sync_routes.stop_writer()
+
+    app = FastAPI(title="PharmaHub sync benchmark", lifespan=lifespan)
+    app.include_router(sync_routes.router)
+    app.dependency_overrides[sync_routes.get_db] = lambda: SQLiteDatabase(db_path)
+    return app
+
+
+def serve(db_path: str, port: int) -> None:
+    """Run the sync API on 127.0.0.1:port (the server process of a scenario)."""
+    import uvicorn
+    app = build_app(db_path)
+    _quiet_loggers()
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def _wait_for_port(port: int, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Server did not start on port {port}")
+
+
+def _stop_server(process: subprocess.Popen) -> Optional[float]:
+    """Stop the server and return the CPU seconds it used (None if unknown)."""
+    process.send_signal(signal.SIGINT)
+    if hasattr(os, "wait4"):
+        try:
+            _, status, usage = os.wait4(process.pid, 0)
+            process.returncode = status
+            return usage.ru_utime + usage.ru_stime
+        except ChildProcessError:
+            return None
+    process.wait(timeout=30)
+    return None
+
+
+def run_scenario(stores: int, medicines: int, sales_per_minute: float, sync_interval: float,
+                 duration: float, port: int, seed: int, logger: logging.Logger) -> Dict[str, Any]:
+    """Run one scenario and return its report."""
+    with tempfile.TemporaryDirectory(prefix="pharmahub_bench_") as work_dir:
+        db_path = os.path.join(work_dir, "server.db")
+        created = seed_database(db_path, stores, medicines)
+        server = subprocess.Popen(
+            [sys.executable, "-m", "src.sync.benchmark", "serve", "--db", db_path, "--port", str(port)],
+            cwd=BASE_DIR
+        )
+        cpu_seconds = None
+        try:
+            _wait_for_port(port)
+            server_url = f"http://127.0.0.1:{port}"
+            recorder = RequestRecorder()
+            clients = [
+                SimulatedStore(store, server_url, work_dir, recorder, sales_per_minute, sync_interval, seed + n)
+                for n, store in enumerate(created)
+            ]
+            _quiet_loggers()
+            ready = sum(1 for client in clients if client.setup())
+            logger.info(f"{ready}/{stores} simulated stores bootstrapped, measuring for {duration}s")
+
+            recorder.enabled = True
+            start_at = time.monotonic() + 0.5
+            deadline = start_at + duration
+            threads = [threading.Thread(target=client.run, args=(start_at, deadline), daemon=True)
+                       for client in clients if client.medicine_ids]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            recorder.enabled = False
+            wall = time.monotonic() - start_at
+
+            queued = sum(client.drain() for client in clients)
+        finally:
+            cpu_seconds = _stop_server(server)
+
+        conn = sqlite3.connect(db_path)
+        try:
+            server_movements = conn.execute("SELECT COUNT(*) FROM StockMovement").fetchone()[0]
+        finally:
+            conn.close()
+
+    cycles = sorted(seconds * 1000 for client in clients for seconds in client.cycles)
+    sales = sum(client.sales for client in clients)
+    return {
+        "stores": stores,
+        "stores_ready": ready,
+        "duration_seconds": wall,
+        "sales": sales,
+        "sales_per_second": sales / wall,
+        "endpoints": recorder.report(wall),
+        "sync_cycles": {
+            "count": len(cycles),
+            "failed": sum(client.failed_cycles for client in clients),
+            "p50_ms": percentile(cycles, 50),
+            "p95_ms": percentile(cycles, 95),
+            "p99_ms": percentile(cycles, 99),
+        },
+        "server": {
+            "cpu_seconds": cpu_seconds,
+            "cpu_percent": 100 * cpu_seconds / wall if cpu_seconds is not None else None,
+        },
+        # Every recorded sale must reach the server exactly once
+        "movements_on_server": server_movements,
+        "movements_still_queued": queued,
+        "movements_lost": sales - server_movements - queued,
+    }
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="PharmaHub fleet sync benchmark")
+    subparsers = parser.add_subparsers(dest="command")
+    serve_parser = subparsers.add_parser("serve", help=argparse.SUPPRESS)
+    serve_parser.add_argument("--db", required=True)
+    serve_parser.add_argument("--port", type=int, required=True)
+    parser.add_argument("--stores", default="10,50", help="Comma-separated store counts, one scenario each")
+    parser.add_argument("--medicines", type=int, default=50, help="Medicines per store")
+    parser.add_argument("--sales-per-minute", type=float, default=60, help="Sales per store per minute")
+    parser.add_argument("--sync-interval", type=float, default=2.0, help="Seconds between syncs of a store")
+    parser.add_argument("--duration", type=float, default=30.0, help="Measured seconds per scenario")
+    parser.add_argument("--port", type=int, default=8790, help="Port of the benchmark server")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed of the sale streams")
+    parser.add_argument("--output", help="JSON report path (default: results/benchmarks/fleet_sync_<time>.json)")
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        serve(args.db, args.port)
+        return 0
+
+    logger = LoggerFactory("BenchmarkLogger", os.path.join(BASE_DIR, "results", "logs"), "benchmark").get_logger()
+    started = datetime.now()
+    output = args.output or os.path.join(
+        BASE_DIR, "results", "benchmarks", f"fleet_sync_{started.strftime('%Y-%m-%d_%H-%M-%S')}.json"
+    )
+    report = {
+        "benchmark": "fleet_sync",
+        "started_at": started.isoformat(),
+        "revision": _git_revision(),
+        "environment": {
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "parameters": {k: v for k, v in vars(args).items() if k not in ("command", "db", "output")},
+        "scenarios": [],
+    }
+    for stores in (int(n) for n in args.stores.split(",") if n.strip()):
+        logger.info(f"Scenario: {stores} stores")
+        result = run_scenario(stores, args.medicines, args.sales_per_minute, args.sync_interval,
+                              args.duration, args.port, args.seed, logger)
+        push = result["endpoints"].get("/sync/push", {})
+        logger.info(
+            f"{stores} stores: {result['sales_per_second']:.1f} sales/s, push p95 {push.get('p95_ms')} ms, "
+            f"lock errors {push.get('lock_errors')}, server CPU {result['server']['cpu_percent']}%"
+        )
+        report["scenarios"].append(result)
+
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    logger.info(f"Benchmark report written to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
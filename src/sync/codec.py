@@ -0,0 +1,191 @@
+"""Wire encodings for sync payloads, negotiated between SyncManager and the server.
+
+Plain JSON is always understood. Clients that send an Accept header listing
+the columnar media types get change lists as column groups, with each
+column name sent once per group instead of once per row. The columnar
+layout can be serialized as JSON or, when the optional msgpack package is
+installed, as msgpack. Any encoding can additionally be gzip-compressed.
+"""
+
+
+import gzip
+import hashlib
+import json
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import msgpack
+except ImportError:  # optional dependency
+    msgpack = None
+
+JSON = "application/json"
+COLUMNAR_JSON = "application/vnd.pharmahub.columnar+json"
+COLUMNAR_MSGPACK = "application/vnd.pharmahub.columnar+msgpack"
+
+class UnsupportedEncodingError(ValueError):
+    """Raised for a media type or content encoding this installation cannot decode."""
+
+
+class BodyTooLargeError(ValueError):
+    """Raised when a compressed body inflates beyond the decoding limit."""
+
+
+# Bodies smaller than this are not worth compressing
+GZIP_MIN_BYTES = 1024
+
+# Largest body decode_body will inflate a gzip payload to
+MAX_DECODED_BYTES = 64 * 1024 * 1024
+
+
+def supported_media_types() -> List[str]:
+    """Return the media types this installation can encode, preferred first."""
+    types = [COLUMNAR_JSON, JSON]
+    if msgpack is not None:
+        types.insert(0, COLUMNAR_MSGPACK)
+    return types
+
+
+def accept_header() -> str:
+    """Build the Accept header a client sends to request compact encodings."""
+    return ", ".join(supported_media_types()[:-1] + [f"{JSON};q=0.5"])
+
+
+def negotiate(accept: Optional[str]) -> str:
+    """Pick the response media type from an Accept header.
+
+    Types are tried in the order the client lists them; JSON is the fallback.
+    """
+    supported = supported_media_types()
+    for item in (accept or "").split(","):
+        media_type = item.split(";")[0].strip().lower()
+        if media_type in supported:
+            return media_type
+    return JSON
+
+
+def accepts_gzip(accept_encoding: Optional[str]) -> bool:
+    """Return whether an Accept-Encoding header allows gzip."""
+    return any(
+        item.split(";")[0].strip().lower() == "gzip"
+        for item in (accept_encoding or "").split(",")
+    )
+
+
+def to_columnar(changes: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Convert a list of change dictionaries into column groups.
+
+    Changes are grouped by table, envelope fields and the exact set of data
+    columns, so a column missing from a partial update is never confused
+    with a NULL value. Each row starts with the change's position in the
+    original list, which from_columnar uses to restore the order.
+    """
+    groups: Dict[Tuple, Dict[str, Any]] = {}
+    for position, change in enumerate(changes):
+        fields = tuple(k for k in change if k != "data")
+        data = change.get("data")
+        columns = tuple(data) if isinstance(data, dict) else None
+        key = (change.get("table"), fields, columns)
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = {
+                "fields": list(fields),
+                "columns": list(columns) if columns is not None else None,
+                "rows": [],
+            }
+        row = [position] + [change[k] for k in fields]
+        if columns is not None:
+            row.extend(data[c] for c in columns)
+        group["rows"].append(row)
+    return list(groups.values())
+
+
+def from_columnar(groups: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Rebuild the ordered list of change dictionaries from column groups."""
+    positioned = []
+    for group in groups:
+        fields = group["fields"]
+        columns = group["columns"]
+        width = len(fields)
+        for row in group["rows"]:
+            change = dict(zip(fields, row[1:width + 1]))
+            change["data"] = dict(zip(columns, row[width + 1:])) if columns is not None else None
+            positioned.append((row[0], change))
+    positioned.sort(key=lambda item: item[0])
+    return [change for _, change in positioned]
+
+
+def rows_checksum(columns: List[str], rows: List[List[Any]]) -> str:
+    """SHA-256 of a table chunk, identical on both ends whatever the wire encoding."""
+    canonical = json.dumps([columns, rows], separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def encode_body(payload: Dict[str, Any], media_type: str = JSON, compress: bool = False) -> Tuple[bytes, Optional[str]]:
+    """Serialize a sync payload.
+
+    Args:
+        payload: Dictionary that may hold a "changes" list.
+        media_type: One of the media types in supported_media_types().
+        compress: Whether gzip may be applied.
+
+    Returns:
+        Tuple of the body and its Content-Encoding (None when uncompressed).
+    """
+    if media_type in (COLUMNAR_JSON, COLUMNAR_MSGPACK) and "changes" in payload:
+        payload = {**payload, "changes": to_columnar(payload["changes"]), "columnar": True}
+
+    if media_type == COLUMNAR_MSGPACK:
+        body = msgpack.packb(payload, use_bin_type=True)
+    else:
+        body = json.dumps(payload, separators=(",", ":"), default=str).encode("utf-8")
+
+    if compress and len(body) >= GZIP_MIN_BYTES:
+        return gzip.compress(body, compresslevel=6), "gzip"
+    return body, None
+
+
+def decode_body(body: bytes, media_type: Optional[str] = JSON, content_encoding: Optional[str] = None,
+                max_size: int = MAX_DECODED_BYTES) -> Dict[str, Any]:
+    """Parse a sync payload produced by encode_body.
+
+    A gzip body is inflated incrementally and abandoned as soon as it
+    exceeds max_size, so a small compressed request cannot expand into an
+    unbounded allocation.
+
+    Raises:
+        UnsupportedEncodingError: If the media type or content encoding is not supported.
+        BodyTooLargeError: If the decompressed body exceeds max_size.
+        ValueError: If the body is malformed or is not an object.
+    """
+    if content_encoding and content_encoding.lower() != "identity":
+        if content_encoding.lower() != "gzip":
+            raise UnsupportedEncodingError(f"Unsupported content encoding {content_encoding!r}")
+        decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+        try:
+            body = decompressor.decompress(body, max_size + 1)
+        except zlib.error as e:
+            raise ValueError(f"Invalid gzip body: {e}")
+        if len(body) > max_size:
+            raise BodyTooLargeError(f"Decompressed body exceeds {max_size} bytes")
+        if not decompressor.eof:
+            raise ValueError("Invalid gzip body: truncated stream")
+
+    media_type = (media_type or JSON).split(";")[0].strip().lower()
+    if media_type == COLUMNAR_MSGPACK:
+        if msgpack is None:
+            raise UnsupportedEncodingError("msgpack is not installed")
+        payload = msgpack.unpackb(body, raw=False)
+    elif media_type in (JSON, COLUMNAR_JSON):
+        payload = json.loads(body) if body else {}
+    else:
+        raise UnsupportedEncodingError(f"Unsupported media type {media_type!r}")
+
+    if not isinstance(payload, dict):
+        raise ValueError(f"Expected an object, got {type(payload).__name__}")
+    if payload.pop("columnar", False):
+        try:
+            payload["changes"] = from_columnar(payload["changes"])
+        except (KeyError, TypeError, IndexError) as e:
+            raise ValueError(f"Invalid columnar changes: {e!r}")
+    return payload
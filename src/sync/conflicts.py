@@ -0,0 +1,317 @@
+"""Application of pulled server changes to a store's local database."""
+
+
+import json
+import sqlite3
+import time
+from calendar import timegm
+from collections import Counter, OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..database.batch_apply import STOCK_DELTA
+from ..database.database_sqlite import CHANGE_TRACKED_TABLES
+from ..database.ledger import record_stock_adjustments
+
+# Resolution policies for a column changed both locally and on the server
+LAST_WRITER_WINS = "last_writer_wins"
+SERVER_WINS = "server_wins"
+ADDITIVE = "additive"
+
+# Per-table default policy and per-column overrides
+TABLE_POLICIES = {
+    'Medicine': {
+        'default': LAST_WRITER_WINS,
+        'columns': {'Price': SERVER_WINS, 'StockQuantity': ADDITIVE},
+    },
+    'Customer': {'default': LAST_WRITER_WINS},
+    'Operator': {'default': LAST_WRITER_WINS},
+    'Purchase': {'default': LAST_WRITER_WINS},
+    'PurchaseItem': {'default': LAST_WRITER_WINS},
+}
+
+# Rows per executemany call and per IN (...) lookup
+DEFAULT_BATCH_SIZE = 500
+
+# Marks a column to remove from pending local edits
+_DROP = object()
+
+
+def _chunks(items: List[Any], size: int):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _server_time(changed_at: Optional[str]) -> float:
+    """Convert a ChangeLog timestamp (UTC, as written by CURRENT_TIMESTAMP) to epoch seconds."""
+    if not changed_at:
+        return 0.0
+    try:
+        return float(timegm(time.strptime(changed_at[:19], "%Y-%m-%d %H:%M:%S")))
+    except ValueError:
+        return 0.0
+
+
+class ConflictResolver:
+    """Apply server changes to the local database, merging rows edited on both sides.
+
+    Every row carries a version stamp in SyncRowVersion: the server ChangeLog
+    sequence number last applied to it, and the values of its additive
+    columns at that point. Local edits not yet acknowledged by the server
+    are the row's entries in SyncOutbox, numbered by the store's own outbox
+    sequence. A server change to a row without pending local edits is
+    applied as is; a change to a row with pending edits is a conflict and
+    is merged column by column:
+
+    - server_wins: the server value is kept and the column is dropped from
+      the pending local edits.
+    - last_writer_wins: whichever side changed the column later is kept.
+    - additive: the local change since the last synced value is added to
+      the server value, and the pending edits carry the merged value.
+
+    A server delete always wins. A pending local delete wins over a server
+    update, since it will be pushed next. Stock movements still in the
+    outbox are added on top of the server's stock until they are pushed.
+    """
+
+    def __init__(self, db_path: str, policies: Optional[Dict[str, Dict[str, Any]]] = None,
+                 batch_size: int = DEFAULT_BATCH_SIZE):
+        """Initialize the resolver.
+
+        Args:
+            db_path: Path to the store's local SQLite database, with its schema created
+            policies: Per-table policies (default: TABLE_POLICIES)
+            batch_size: Maximum number of rows per executemany call
+        """
+        self.db_path = db_path
+        self.policies = policies or TABLE_POLICIES
+        self.batch_size = batch_size
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS SyncRowVersion (
+                    TableName TEXT NOT NULL,
+                    RowID INTEGER NOT NULL,
+                    ServerSeq INTEGER NOT NULL,
+                    Base TEXT,
+                    PRIMARY KEY (TableName, RowID)
+                ) WITHOUT ROWID
+            ''')
+            conn.commit()
+        finally:
+            conn.close()
+
+    def policy(self, table: str, column: str) -> str:
+        config = self.policies.get(table, {})
+        return config.get('columns', {}).get(column, config.get('default', LAST_WRITER_WINS))
+
+    def _additive_columns(self, table: str) -> List[str]:
+        return [c for c, p in self.policies.get(table, {}).get('columns', {}).items() if p == ADDITIVE]
+
+    def apply(self, changes: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Apply one page of server changes in a single local transaction.
+
+        Args:
+            changes: Changes as returned by /sync/changes, in sequence order
+
+        Returns:
+            Dictionary with the number of changes applied, already applied
+            (skipped), and conflicts in total and per resolution
+        """
+        changes = [c for c in changes if c.get('table') in CHANGE_TRACKED_TABLES]
+        stats = {"applied": 0, "skipped": 0, "conflicts": 0, "resolutions": Counter()}
+        if not changes:
+            return {**stats, "resolutions": {}}
+
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            versions = self._load_versions(conn, changes)
+            pending = self._load_pending(conn, changes)
+            deltas = self._load_pending_deltas(conn, changes)
+
+            upserts: Dict[Tuple[str, Tuple[str, ...]], List[List[Any]]] = OrderedDict()
+            deletes: Dict[str, List[Any]] = OrderedDict()
+            stamps = []
+            for change in changes:
+                table, row_id = change['table'], change['row_id']
+                version = versions.get((table, row_id))
+                if version is not None and version[0] >= change['seq']:
+                    stats["skipped"] += 1
+                    continue
+
+                data = change.get('data')
+                entries = pending.get((table, row_id))
+                if entries:
+                    stats["conflicts"] += 1
+                    resolution, data = self._resolve(conn, change, entries, version)
+                    stats["resolutions"][resolution] += 1
+                    if resolution == "local_delete":
+                        continue
+
+                if change['operation'] == 'delete' or data is None:
+                    deletes.setdefault(table, []).append(row_id)
+                    base = None
+                else:
+                    if row_id in deltas and table == 'Medicine' and data.get('StockQuantity') is not None:
+                        # Local stock movements the server has not counted yet
+                        data = dict(data, StockQuantity=data['StockQuantity'] + deltas[row_id])
+                    columns = tuple(sorted(data))
+                    upserts.setdefault((table, columns), []).append([data[c] for c in columns])
+                    base = {c: change['data'].get(c) for c in self._additive_columns(table) if c in change['data']}
+                stamps.append((table, row_id, change['seq'], json.dumps(base) if base else None))
+                stats["applied"] += 1
+
+            for (table, columns), rows in upserts.items():
+                key = CHANGE_TRACKED_TABLES[table]
+                updates = ', '.join(f"{c} = excluded.{c}" for c in columns if c != key)
+                sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})"
+                if updates:
+                    sql += f" ON CONFLICT({key}) DO UPDATE SET {updates}"
+                for chunk in _chunks(rows, self.batch_size):
+                    conn.executemany(sql, chunk)
+                if table == 'Medicine' and 'StockQuantity' in columns and key in columns:
+                    # Pulled stock differs from the local ledger by what other stores moved
+                    record_stock_adjustments(conn, [row[columns.index(key)] for row in rows], "sync:pull")
+            for table, row_ids in deletes.items():
+                key = CHANGE_TRACKED_TABLES[table]
+                conn.executemany(f"DELETE FROM {table} WHERE {key} = ?", [(r,) for r in row_ids])
+            conn.executemany(
+                "INSERT INTO SyncRowVersion (TableName, RowID, ServerSeq, Base) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(TableName, RowID) DO UPDATE SET ServerSeq = excluded.ServerSeq, "
+                "Base = COALESCE(excluded.Base, SyncRowVersion.Base)",
+                stamps
+            )
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+        return {**stats, "resolutions": dict(stats["resolutions"])}
+
+    def _load_versions(self, conn: sqlite3.Connection, changes: List[Dict[str, Any]]) -> Dict[Tuple[str, int], Tuple[int, Dict]]:
+        versions = {}
+        for table in {c['table'] for c in changes}:
+            row_ids = list({c['row_id'] for c in changes if c['table'] == table})
+            for chunk in _chunks(row_ids, self.batch_size):
+                rows = conn.execute(
+                    f"SELECT RowID, ServerSeq, Base FROM SyncRowVersion WHERE TableName = ? "
+                    f"AND RowID IN ({', '.join('?' for _ in chunk)})",
+                    [table] + chunk
+                ).fetchall()
+                for row in rows:
+                    versions[(table, row['RowID'])] = (row['ServerSeq'], json.loads(row['Base']) if row['Base'] else {})
+        return versions
+
+    def _load_pending(self, conn: sqlite3.Connection, changes: List[Dict[str, Any]]) -> Dict[Tuple[str, int], List[Dict]]:
+        """Find local edits not yet pushed for the rows the server changed."""
+        has_outbox = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'SyncOutbox'"
+        ).fetchone()
+        pending = {}
+        if not has_outbox:
+            return pending
+        for table in {c['table'] for c in changes}:
+            key = CHANGE_TRACKED_TABLES[table]
+            row_ids = list({c['row_id'] for c in changes if c['table'] == table})
+            for chunk in _chunks(row_ids, self.batch_size):
+                rows = conn.execute(
+                    f"SELECT Seq, Operation, Payload, CreatedAt FROM SyncOutbox WHERE TableName = ? "
+                    f"AND json_extract(Payload, '$.{key}') IN ({', '.join('?' for _ in chunk)}) ORDER BY Seq",
+                    [table] + chunk
+                ).fetchall()
+                for row in rows:
+                    data = json.loads(row['Payload'])
+                    pending.setdefault((table, data[key]), []).append({
+                        "seq": row['Seq'], "operation": row['Operation'],
+                        "data": data, "created_at": row['CreatedAt']
+                    })
+        return pending
+
+    def _load_pending_deltas(self, conn: sqlite3.Connection, changes: List[Dict[str, Any]]) -> Dict[int, int]:
+        """Sum the stock deltas not yet pushed for the medicines the server changed."""
+        medicine_ids = list({c['row_id'] for c in changes if c['table'] == 'Medicine'})
+        has_outbox = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'SyncOutbox'"
+        ).fetchone()
+        deltas = {}
+        if not has_outbox or not medicine_ids:
+            return deltas
+        for chunk in _chunks(medicine_ids, self.batch_size):
+            rows = conn.execute(
+                f"SELECT json_extract(Payload, '$.MedicineID'), SUM(json_extract(Payload, '$.Delta')) "
+                f"FROM SyncOutbox WHERE TableName = 'StockMovement' AND Operation = ? "
+                f"AND json_extract(Payload, '$.MedicineID') IN ({', '.join('?' for _ in chunk)}) GROUP BY 1",
+                [STOCK_DELTA] + chunk
+            ).fetchall()
+            deltas.update({medicine_id: delta for medicine_id, delta in rows if delta})
+        return deltas
+
+    def _resolve(self, conn: sqlite3.Connection, change: Dict[str, Any], entries: List[Dict[str, Any]],
+                 version: Optional[Tuple[int, Dict]]) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """Merge a server change with pending local edits of the same row.
+
+        Returns:
+            The resolution applied and the row data to write (None to delete).
+        """
+        table = change['table']
+        key = CHANGE_TRACKED_TABLES[table]
+
+        if change['operation'] == 'delete' or change.get('data') is None:
+            conn.executemany("DELETE FROM SyncOutbox WHERE Seq = ?", [(e['seq'],) for e in entries])
+            return SERVER_WINS, None
+        if any(e['operation'] == 'delete' for e in entries):
+            return "local_delete", None
+
+        server = change['data']
+        local = conn.execute(f"SELECT * FROM {table} WHERE {key} = ?", (change['row_id'],)).fetchone()
+        local = dict(local) if local is not None else {}
+        base = version[1] if version else {}
+        server_time = _server_time(change.get('changed_at'))
+
+        merged = dict(server)
+        kept_local = server_wins = False
+        rewrites: Dict[str, Any] = {}
+        for column, value in server.items():
+            touched = [e for e in entries if column in e['data']]
+            if column == key or not touched or column not in local:
+                continue
+            policy = self.policy(table, column)
+            if policy == ADDITIVE and base.get(column) is not None:
+                merged[column] = (value or 0) + ((local[column] or 0) - base[column])
+                rewrites[column] = merged[column]
+                kept_local = True
+            elif policy != SERVER_WINS and max(e['created_at'] for e in touched) >= server_time:
+                merged[column] = local[column]
+                kept_local = True
+            else:
+                rewrites[column] = _DROP
+                server_wins = True
+
+        self._rewrite_pending(conn, key, entries, rewrites)
+        if kept_local and server_wins:
+            return "merged", merged
+        return ("local_wins" if kept_local else SERVER_WINS), merged
+
+    def _rewrite_pending(self, conn: sqlite3.Connection, key: str, entries: List[Dict[str, Any]],
+                         rewrites: Dict[str, Any]) -> None:
+        """Drop columns the server won from pending edits and carry merged additive values."""
+        if not rewrites:
+            return
+        for entry in entries:
+            data = entry['data']
+            for column, value in rewrites.items():
+                if column not in data:
+                    continue
+                if value is _DROP:
+                    del data[column]
+                else:
+                    data[column] = value
+            if entry['operation'] == 'update' and not set(data) - {key, 'StoreID'}:
+                conn.execute("DELETE FROM SyncOutbox WHERE Seq = ?", (entry['seq'],))
+            else:
+                conn.execute("UPDATE SyncOutbox SET Payload = ? WHERE Seq = ?",
+                             (json.dumps(data, default=str), entry['seq']))
@@ -0,0 +1,103 @@
+import asyncio
+import sqlite3
+from typing import Dict, Optional
+
+
+class ChangeNotifier:
+    """Wake long-polling stores when their ChangeLog advances.
+
+    Writes made through this process can call notify() to wake the store's
+    waiters at once. Changes made by other routes or processes are picked
+    up by one shared watcher task that, while anyone is waiting, checks the
+    ChangeLog for new entries every poll_interval seconds with a single
+    range query on Seq, however many stores wait. Entries that came from
+    the store's own pushes never wake it.
+    """
+
+    def __init__(self, db_path: str, poll_interval: float = 1.0):
+        """Initialize the notifier.
+
+        Args:
+            db_path: Path to the main server database
+            poll_interval: Seconds between ChangeLog checks while stores wait
+        """
+        self.db_path = db_path
+        self.poll_interval = poll_interval
+        self._events: Dict[int, asyncio.Event] = {}
+        self._waiters = 0
+        self._watcher: Optional[asyncio.Task] = None
+
+    def _query(self, sql: str, params: tuple):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            return conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+
+    async def latest_seq(self, store_id: int) -> int:
+        """Return the store's largest ChangeLog sequence number not from its own pushes."""
+        rows = await asyncio.to_thread(
+            self._query,
+            "SELECT COALESCE(MAX(Seq), 0) FROM ChangeLog WHERE StoreID = ? AND OriginStoreID IS NOT StoreID",
+            (store_id,)
+        )
+        return rows[0][0]
+
+    def notify(self, store_id: int) -> None:
+        """Wake everyone waiting on a store."""
+        event = self._events.pop(store_id, None)
+        if event is not None:
+            event.set()
+
+    async def wait(self, store_id: int, cursor: int, timeout: float) -> int:
+        """Wait until the store has changes after cursor, or until timeout.
+
+        Args:
+            store_id: Store waiting for changes
+            cursor: Last ChangeLog sequence number the store has seen
+            timeout: Longest time to wait in seconds
+
+        Returns:
+            The store's latest sequence number, larger than cursor if it changed
+        """
+        latest = await self.latest_seq(store_id)
+        if latest > cursor or timeout <= 0:
+            return latest
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        self._waiters += 1
+        if self._watcher is None or self._watcher.done():
+            self._watcher = asyncio.create_task(self._watch())
+        try:
+            while latest <= cursor:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                event = self._events.setdefault(store_id, asyncio.Event())
+                try:
+                    await asyncio.wait_for(event.wait(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    break
+                latest = await self.latest_seq(store_id)
+            return latest
+        finally:
+            self._waiters -= 1
+
+    async def _watch(self) -> None:
+        rows = await asyncio.to_thread(self._query, "SELECT COALESCE(MAX(Seq), 0) FROM ChangeLog", ())
+        last_seen = rows[0][0]
+        while self._waiters > 0:
+            await asyncio.sleep(self.poll_interval)
+            if not self._events:
+                continue
+            rows = await asyncio.to_thread(
+                self._query,
+                "SELECT StoreID, MAX(Seq), MAX(OriginStoreID IS NOT StoreID) FROM ChangeLog WHERE Seq > ? "
+                "GROUP BY StoreID",
+                (last_seen,)
+            )
+            for store_id, seq, changed_elsewhere in rows:
+                last_seen = max(last_seen, seq)
+                if changed_elsewhere:
+                    self.notify(store_id)
@@ -0,0 +1,304 @@
+"""Durable outbox of local changes waiting to be pushed, and their coalescing into minimal batches."""
+
+
+import json
+import os
+import sqlite3
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..database.database_sqlite import CHANGE_TRACKED_TABLES
+
+
+def coalesce(changes: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Merge successive changes to the same row into the one change the server needs.
+
+    Per (table, row) and in sequence order:
+
+    - update after insert or update: the columns are merged into the earlier change
+    - delete after insert: both are dropped, the server never saw the row
+    - delete after update: only the delete is kept
+    - anything after delete starts over, so a re-created row is pushed as is
+
+    A merged change stays at the position of the row's first change and
+    carries the sequence number and timestamp of the last change it covers.
+    Its position can therefore be ahead of a parent row it was later
+    pointed at: the order within a batch is not relied on, because a batch
+    is pushed as one request and the server applies its inserts parents
+    first, then updates, then deletes children first (see BatchApplier).
+    Rows without a primary key in their payload are passed through unchanged.
+
+    Args:
+        changes: Changes as returned by SyncOutbox.dequeue, in sequence order
+
+    Returns:
+        Coalesced changes; acknowledging the last sequence number of the input
+        removes every entry they cover
+    """
+    merged: List[Optional[Dict[str, Any]]] = []
+    # (table, row id) -> index in merged of the row's open change
+    open_rows: Dict[tuple, int] = {}
+    for change in changes:
+        key = CHANGE_TRACKED_TABLES.get(change["table"])
+        row_id = change["data"].get(key) if key else None
+        if row_id is None:
+            merged.append(change)
+            continue
+
+        row = (change["table"], row_id)
+        index = open_rows.get(row)
+        previous = merged[index] if index is not None else None
+        if previous is None or previous["operation"] == "delete" or change["operation"] == "insert":
+            open_rows[row] = len(merged)
+            merged.append(change)
+            continue
+
+        if change["operation"] == "delete":
+            if previous["operation"] == "insert":
+                merged[index] = None
+                del open_rows[row]
+                continue
+            current = dict(change)
+        else:
+            current = dict(previous, data={**previous["data"], **change["data"]})
+        current["seq"] = change["seq"]
+        current["timestamp"] = change["timestamp"]
+        merged[index] = current
+
+    return [change for change in merged if change is not None]
+
+
+class SyncOutbox:
+    """Durable queue of local changes waiting to be pushed to the main server.
+
+    Changes are appended to a SyncOutbox table in the store's local database,
+    so they survive restarts and crashes. Each entry gets a monotonically
+    increasing sequence number; batches are read in sequence order and
+    deleted once the server has acknowledged them. Changes the server
+    rejected are moved to a SyncDeadLetter table with the server's error
+    instead of being dropped, so they can be inspected and replayed.
+    """
+
+    def __init__(self, db_path: str):
+        """Initialize the outbox.
+
+        Args:
+            db_path: Path to the store's local SQLite database
+        """
+        self.db_path = db_path
+        directory = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(directory, exist_ok=True)
+        self._create_table()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        # A committed sale must still be queued after a power loss
+        conn.execute("PRAGMA synchronous = FULL")
+        return conn
+
+    def _create_table(self) -> None:
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS SyncOutbox (
+                    Seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    TableName TEXT NOT NULL,
+                    Operation TEXT NOT NULL,
+                    Payload TEXT NOT NULL,
+                    CreatedAt REAL NOT NULL
+                )
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS SyncDeadLetter (
+                    Seq INTEGER PRIMARY KEY,
+                    TableName TEXT NOT NULL,
+                    Operation TEXT NOT NULL,
+                    Payload TEXT NOT NULL,
+                    Status TEXT NOT NULL,
+                    Error TEXT,
+                    RejectedAt REAL NOT NULL
+                )
+            ''')
+            conn.commit()
+        finally:
+            conn.close()
+
+    def append(self, table: str, operation: str, data: Dict[str, Any],
+               conn: Optional[sqlite3.Connection] = None) -> int:
+        """Append a change to the outbox.
+
+        Args:
+            table: Name of the table being modified
+            operation: Type of operation (insert/update/delete/stock_delta)
+            data: The data being changed
+            conn: Connection to the store database whose open transaction the
+                entry joins, so it commits together with the local write
+                (default: a new connection, committed at once)
+
+        Returns:
+            Sequence number of the new entry
+        """
+        sql = "INSERT INTO SyncOutbox (TableName, Operation, Payload, CreatedAt) VALUES (?, ?, ?, ?)"
+        params = (table, operation, json.dumps(data, default=str), time.time())
+        if conn is not None:
+            return conn.execute(sql, params).lastrowid
+
+        conn = self._connect()
+        try:
+            cursor = conn.execute(sql, params)
+            conn.commit()
+            return cursor.lastrowid
+        finally:
+            conn.close()
+
+    def dequeue(self, limit: int = 500, after_seq: int = 0) -> List[Dict[str, Any]]:
+        """Read the oldest pending changes without removing them.
+
+        Args:
+            limit: Maximum number of changes to return
+            after_seq: Only return changes with a larger sequence number
+
+        Returns:
+            Changes in sequence order
+        """
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT Seq, TableName, Operation, Payload, CreatedAt FROM SyncOutbox "
+                "WHERE Seq > ? ORDER BY Seq LIMIT ?",
+                (after_seq, limit)
+            ).fetchall()
+        finally:
+            conn.close()
+
+        return [
+            {
+                "seq": seq,
+                "timestamp": datetime.fromtimestamp(created_at).isoformat(),
+                "table": table,
+                "operation": operation,
+                "data": json.loads(payload)
+            }
+            for seq, table, operation, payload, created_at in rows
+        ]
+
+    def dequeue_coalesced(self, limit: int = 500, after_seq: int = 0) -> Tuple[List[Dict[str, Any]], int]:
+        """Read the oldest pending changes and merge the redundant ones.
+
+        Args:
+            limit: Maximum number of outbox entries to read
+            after_seq: Only read entries with a larger sequence number
+
+        Returns:
+            The coalesced changes and the last sequence number they cover
+            (0 if the outbox is empty), to be passed to ack()
+        """
+        batch = self.dequeue(limit=limit, after_seq=after_seq)
+        if not batch:
+            return [], 0
+        return coalesce(batch), batch[-1]["seq"]
+
+    def depth(self) -> int:
+        """Return the number of changes waiting to be pushed."""
+        conn = self._connect()
+        try:
+            return conn.execute("SELECT COUNT(*) FROM SyncOutbox").fetchone()[0]
+        finally:
+            conn.close()
+
+    def ack(self, up_to_seq: int, rejected: Optional[List[Tuple[Dict[str, Any], Dict[str, Any]]]] = None) -> int:
+        """Delete every change up to and including a sequence number.
+
+        Args:
+            up_to_seq: Last sequence number answered by the server
+            rejected: (change, result) pairs the server did not apply; they
+                are kept in SyncDeadLetter, in the same transaction
+
+        Returns:
+            Number of changes removed from the outbox
+        """
+        conn = self._connect()
+        try:
+            conn.executemany(
+                "INSERT OR REPLACE INTO SyncDeadLetter (Seq, TableName, Operation, Payload, Status, Error, RejectedAt) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(change["seq"], change["table"], change["operation"], json.dumps(change["data"], default=str),
+                  result.get("status"), result.get("error"), time.time())
+                 for change, result in rejected or []]
+            )
+            cursor = conn.execute("DELETE FROM SyncOutbox WHERE Seq <= ?", (up_to_seq,))
+            conn.commit()
+            return cursor.rowcount
+        finally:
+            conn.close()
+
+    def dead_letters(self, limit: int = 100) -> List[Dict[str, Any]]:
+        """Return the changes the server rejected, oldest first."""
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT Seq, TableName, Operation, Payload, Status, Error FROM SyncDeadLetter ORDER BY Seq LIMIT ?",
+                (limit,)
+            ).fetchall()
+        finally:
+            conn.close()
+        return [
+            {"seq": seq, "table": table, "operation": operation, "data": json.loads(payload),
+             "status": status, "error": error}
+            for seq, table, operation, payload, status, error in rows
+        ]
+
+    def compact(self, min_free_ratio: float = 0.25) -> None:
+        """Return space freed by acknowledged changes to the file system.
+
+        The WAL is always checkpointed and truncated. The database file is only
+        vacuumed when at least min_free_ratio of its pages are free, since a
+        vacuum rewrites the whole store database.
+        """
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+            free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            if page_count and free_pages / page_count >= min_free_ratio:
+                conn.execute("VACUUM")
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        finally:
+            conn.close()
+
+    def stats(self) -> Dict[str, Optional[float]]:
+        """Report queue depth, age of the oldest entry and on-disk size.
+
+        Returns:
+            Dictionary with depth, oldest_seq, oldest_age_seconds, size_bytes
+            and dead_letters, the number of changes the server rejected
+        """
+        conn = self._connect()
+        try:
+            depth, oldest_seq, oldest_created = conn.execute(
+                "SELECT COUNT(*), MIN(Seq), MIN(CreatedAt) FROM SyncOutbox"
+            ).fetchone()
+            dead_letters = conn.execute("SELECT COUNT(*) FROM SyncDeadLetter").fetchone()[0]
+            try:
+                size_bytes = conn.execute(
+                    "SELECT COALESCE(SUM(pgsize), 0) FROM dbstat WHERE name = 'SyncOutbox'"
+                ).fetchone()[0]
+            except sqlite3.Error:
+                # dbstat is optional in SQLite builds, fall back to the file sizes
+                size_bytes = sum(
+                    os.path.getsize(path)
+                    for path in (self.db_path, self.db_path + "-wal")
+                    if os.path.exists(path)
+                )
+        finally:
+            conn.close()
+
+        return {
+            "depth": depth,
+            "oldest_seq": oldest_seq,
+            "oldest_age_seconds": time.time() - oldest_created if oldest_created else None,
+            "size_bytes": size_bytes,
+            "dead_letters": dead_letters
+        }
@@ -0,0 +1,122 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import jwt
+
+
+class StoreSessionRegistry:
+    """Verified sync tokens and the stores currently talking to the server.
+
+    Verifying a JWT means parsing it and checking its HMAC signature. Stores
+    send the same token on every sync request until it expires, so the
+    verified claims are kept in a bounded LRU cache keyed by the token and
+    reused until the token's own expiry. Every verified request also
+    refreshes the store's last-seen time, giving a live view of connected
+    stores without touching the database.
+    """
+
+    def __init__(self, secret_key: str, algorithm: str, max_tokens: int = 10000):
+        """Initialize the registry.
+
+        Args:
+            secret_key: Key the tokens are signed with
+            algorithm: JWT signing algorithm, e.g. HS256
+            max_tokens: Verified tokens kept before the least recently used is evicted
+        """
+        self.secret_key = secret_key
+        self.algorithm = algorithm
+        self.max_tokens = max_tokens
+        self._tokens: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._sessions: Dict[int, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "rejected": 0, "evicted": 0}
+
+    def verify(self, token: str) -> Dict[str, Any]:
+        """Return the claims of a valid token.
+
+        Args:
+            token: Encoded JWT from the Authorization header
+
+        Returns:
+            The token's claims
+
+        Raises:
+            jwt.InvalidTokenError: If the token is malformed, forged or expired
+        """
+        now = time.time()
+        with self._lock:
+            claims = self._tokens.get(token)
+            if claims is not None:
+                if claims.get("exp", 0) > now:
+                    self._tokens.move_to_end(token)
+                    self._counters["hits"] += 1
+                    self._touch(claims, now)
+                    return claims
+                del self._tokens[token]
+
+        try:
+            claims = jwt.decode(token, self.secret_key, algorithms=[self.algorithm])
+        except jwt.InvalidTokenError:
+            with self._lock:
+                self._counters["rejected"] += 1
+            raise
+
+        with self._lock:
+            self._counters["misses"] += 1
+            self._tokens[token] = claims
+            while len(self._tokens) > self.max_tokens:
+                self._tokens.popitem(last=False)
+                self._counters["evicted"] += 1
+            self._touch(claims, now)
+        return claims
+
+    def register(self, store_id: int, store_name: Optional[str] = None) -> None:
+        """Start a session for a store that has just connected."""
+        now = time.time()
+        with self._lock:
+            session = self._sessions.setdefault(store_id, {"store_id": store_id, "requests": 0})
+            session.update(store_name=store_name, connected_at=now, last_seen=now)
+
+    def _touch(self, claims: Dict[str, Any], now: float) -> None:
+        store_id = claims.get("store_id")
+        session = self._sessions.get(store_id)
+        if session is None:
+            # Token issued before this process started
+            session = self._sessions[store_id] = {
+                "store_id": store_id, "store_name": claims.get("store_name"),
+                "connected_at": None, "requests": 0
+            }
+        session["last_seen"] = now
+        session["requests"] += 1
+
+    def sessions(self, active_within: Optional[float] = None) -> List[Dict[str, Any]]:
+        """List store sessions, most recently seen first.
+
+        Args:
+            active_within: Only list stores seen in the last this many seconds
+
+        Returns:
+            Sessions with store_id, store_name, connected_at, last_seen,
+            idle_seconds and requests
+        """
+        now = time.time()
+        with self._lock:
+            sessions = [dict(s) for s in self._sessions.values()]
+        if active_within is not None:
+            sessions = [s for s in sessions if now - s["last_seen"] <= active_within]
+        for session in sessions:
+            session["idle_seconds"] = now - session["last_seen"]
+        return sorted(sessions, key=lambda s: s["last_seen"], reverse=True)
+
+    def stats(self) -> Dict[str, Any]:
+        """Report cache hits, misses, rejections and the number of sessions."""
+        with self._lock:
+            lookups = self._counters["hits"] + self._counters["misses"]
+            return {
+                **self._counters,
+                "hit_ratio": self._counters["hits"] / lookups if lookups else None,
+                "cached_tokens": len(self._tokens),
+                "sessions": len(self._sessions),
+            }
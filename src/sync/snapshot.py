@@ -0,0 +1,131 @@
+"""Compressed per-store database snapshots for bootstrapping stores with large histories."""
+
+
+import gzip
+import hashlib
+import os
+import shutil
+import sqlite3
+import tempfile
+from typing import Any, Dict, Optional
+
+from ..database.database_sqlite import SQLiteDatabase
+
+# Store-side tables that survive installing a snapshot
+PRESERVED_TABLES = ("SyncOutbox", "SyncDeadLetter", "SyncState")
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def _sha256_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def build_snapshot(db: SQLiteDatabase, store_id: int, work_dir: Optional[str] = None) -> Dict[str, Any]:
+    """Create a gzip-compressed snapshot of one store's rows.
+
+    Args:
+        db: Main server database.
+        store_id: Store to snapshot.
+        work_dir: Directory for the temporary files (default: system temp dir).
+
+    Returns:
+        Dictionary with the path of the .db.gz file (owned by the caller),
+        its SHA-256, its size and the store's ChangeLog cursor in the snapshot.
+    """
+    fd, db_path = tempfile.mkstemp(dir=work_dir, prefix=f"store_{store_id}_", suffix=".db")
+    os.close(fd)
+    gz_path = db_path + ".gz"
+    try:
+        info = db.create_store_snapshot(store_id, db_path)
+        with open(db_path, "rb") as src, gzip.open(gz_path, "wb", compresslevel=6) as dest:
+            shutil.copyfileobj(src, dest, CHUNK_SIZE)
+    except BaseException:
+        if os.path.exists(gz_path):
+            os.remove(gz_path)
+        raise
+    finally:
+        os.remove(db_path)
+
+    return {
+        "path": gz_path,
+        "sha256": _sha256_file(gz_path),
+        "size_bytes": os.path.getsize(gz_path),
+        "cursor": info["cursor"],
+        "tables": info["tables"],
+    }
+
+
+def install_snapshot(gz_path: str, target_path: str, sha256: str) -> None:
+    """Atomically replace a store database with a downloaded snapshot.
+
+    The snapshot is verified and decompressed next to the target, the
+    store's pending outbox and sync state are copied into it from the
+    current database, and it is then renamed over the target. A crash at
+    any point leaves either the old or the new database in place.
+
+    Args:
+        gz_path: Downloaded .db.gz file.
+        target_path: Store database to replace, e.g. results/store_{id}.db.
+        sha256: Checksum announced by the server.
+
+    Raises:
+        ValueError: If the checksum does not match.
+    """
+    actual = _sha256_file(gz_path)
+    if actual != sha256:
+        raise ValueError(f"Snapshot checksum mismatch: expected {sha256}, got {actual}")
+
+    directory = os.path.dirname(os.path.abspath(target_path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".snapshot_", suffix=".db")
+    try:
+        with os.fdopen(fd, "wb") as dest, gzip.open(gz_path, "rb") as src:
+            shutil.copyfileobj(src, dest, CHUNK_SIZE)
+            dest.flush()
+            os.fsync(dest.fileno())
+
+        if os.path.exists(target_path):
+            old = sqlite3.connect(target_path, timeout=30)
+            try:
+                # Fold the WAL into the old file so nothing is left to replay over the new one
+                old.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            finally:
+                old.close()
+
+            conn = sqlite3.connect(tmp_path)
+            try:
+                conn.execute("ATTACH DATABASE ? AS old", (target_path,))
+                for table in PRESERVED_TABLES:
+                    row = conn.execute(
+                        "SELECT sql FROM old.sqlite_master WHERE type = 'table' AND name = ?", (table,)
+                    ).fetchone()
+                    if row is None:
+                        continue
+                    conn.execute(f"DROP TABLE IF EXISTS main.{table}")
+                    conn.execute(row[0])
+                    conn.execute(f"INSERT INTO main.{table} SELECT * FROM old.{table}")
+                # Keep AUTOINCREMENT counters so outbox sequence numbers never go backwards
+                names = ", ".join("?" for _ in PRESERVED_TABLES)
+                conn.execute(f"DELETE FROM main.sqlite_sequence WHERE name IN ({names})", PRESERVED_TABLES)
+                conn.execute(
+                    f"INSERT INTO main.sqlite_sequence SELECT * FROM old.sqlite_sequence WHERE name IN ({names})",
+                    PRESERVED_TABLES
+                )
+                conn.commit()
+                conn.execute("DETACH DATABASE old")
+            finally:
+                conn.close()
+
+        os.replace(tmp_path, target_path)
+        for suffix in ("-wal", "-shm"):
+            if os.path.exists(target_path + suffix):
+                os.remove(target_path + suffix)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
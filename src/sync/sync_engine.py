@@ -0,0 +1,323 @@
+import asyncio
+import os
+import random
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+import httpx
+
+from .sync_manager import SyncManager
+from .transport import backoff_delay
+
+# Environment variables run_store_mode uses to configure the engine in the API process
+ENV_STORE_ID = "PHARMAHUB_STORE_ID"
+ENV_SERVER_URL = "PHARMAHUB_SERVER_URL"
+ENV_STORE_NAME = "PHARMAHUB_STORE_NAME"
+ENV_LICENSE_NUMBER = "PHARMAHUB_LICENSE_NUMBER"
+ENV_LOCAL_DB = "PHARMAHUB_LOCAL_DB"
+ENV_SYNC_INTERVAL = "PHARMAHUB_SYNC_INTERVAL"
+
+
+class AsyncSyncEngine:
+    """Store-to-server sync running as a task on the API's event loop.
+
+    Each sync pulls, then pushes, through SyncManager's own pull_changes and
+    push_outbox in a worker thread so the event loop never blocks on disk,
+    with their requests sent over one pooled httpx.AsyncClient on the loop.
+    The push waits for the pull because merging pulled rows rewrites pending
+    outbox entries, which must not be in flight at the time. Between syncs
+    the engine long-polls /sync/subscribe, so server changes arrive within
+    seconds, and notify() triggers a sync for local changes. If the server
+    has no subscribe endpoint, the engine polls instead, more often while
+    syncs move data and backing off to the full interval while the store is
+    idle.
+    """
+
+    def __init__(self, manager: SyncManager, interval: float = 300, connect_timeout: float = 5.0,
+                 read_timeout: float = 30.0, max_connections: int = 4, subscribe_timeout: float = 25.0,
+                 min_interval: float = 15.0):
+        """Initialize the engine.
+
+        Args:
+            manager: Sync manager holding the store's outbox and sync state
+            interval: Seconds between syncs when nothing calls notify()
+            connect_timeout: Seconds to wait for a TCP connection
+            read_timeout: Seconds to wait for the server to respond
+            max_connections: Connections kept open to the server
+            subscribe_timeout: Seconds each /sync/subscribe long-poll waits on the server
+            min_interval: Shortest polling interval when subscribing is not possible
+        """
+        self.manager = manager
+        self.logger = manager.logger
+        self.interval = interval
+        self.subscribe_timeout = subscribe_timeout
+        self.min_interval = min_interval
+        self._timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self._subscribe_http_timeout = httpx.Timeout(read_timeout + subscribe_timeout, connect=connect_timeout)
+        self._limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self._client: Optional[httpx.AsyncClient] = None
+        self._task: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+        self.state = "stopped"
+        self.syncs = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.last_error: Optional[str] = None
+        self.last_pulled = 0
+        self.last_pushed = 0
+        self.last_sync_bytes = {"sent": 0, "received": 0}
+        self._bytes = {"sent": 0, "received": 0}
+        self.subscribe_supported = True
+        self.wakeups = {"subscribe": 0, "notify": 0, "timer": 0}
+        self._poll_delay = interval
+
+    @classmethod
+    def from_env(cls) -> Optional["AsyncSyncEngine"]:
+        """Build an engine from the environment set by run_store_mode.
+
+        Returns:
+            The engine, or None when the process is not running in store mode
+        """
+        store_id = os.environ.get(ENV_STORE_ID)
+        server_url = os.environ.get(ENV_SERVER_URL)
+        if not store_id or not server_url:
+            return None
+
+        base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+        local_db_path = os.environ.get(ENV_LOCAL_DB) or os.path.join(base_dir, "results", f"store_{store_id}.db")
+        manager = SyncManager(
+            store_id, server_url, local_db_path,
+            store_name=os.environ.get(ENV_STORE_NAME),
+            license_number=os.environ.get(ENV_LICENSE_NUMBER)
+        )
+        return cls(manager, interval=float(os.environ.get(ENV_SYNC_INTERVAL, 300)))
+
+    async def start(self) -> None:
+        """Open the HTTP client and start the background sync task."""
+        self._client = httpx.AsyncClient(
+            base_url=self.manager.server_url, timeout=self._timeout, limits=self._limits
+        )
+        self._wake = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        self._task = asyncio.create_task(self._run())
+        self.logger.info(f"Sync engine started, interval {self.interval}s")
+
+    async def stop(self) -> None:
+        """Cancel the sync task and close the HTTP client."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        self.state = "stopped"
+        self.logger.info("Sync engine stopped")
+
+    def notify(self) -> None:
+        """Ask for a sync as soon as the current one, if any, finishes."""
+        if self._wake is not None:
+            self._wake.set()
+
+    def status(self) -> Dict[str, Any]:
+        """Return the engine state for the API."""
+        return {
+            "state": self.state,
+            "store_id": self.manager.store_id,
+            "server_url": self.manager.server_url,
+            "interval": self.interval,
+            "syncs": self.syncs,
+            "failures": self.failures,
+            "consecutive_failures": self.consecutive_failures,
+            "last_error": self.last_error,
+            "last_sync_time": self.manager.last_sync_time,
+            "change_cursor": self.manager.change_cursor,
+            "last_pulled": self.last_pulled,
+            "last_pushed": self.last_pushed,
+            "last_sync_bytes": self.last_sync_bytes,
+            "push_media_type": self.manager.push_media_type,
+            "conflicts": self.manager.conflict_stats,
+            "subscribed": self.subscribe_supported,
+            "poll_delay": self._poll_delay,
+            "wakeups": self.wakeups,
+        }
+
+    async def _run(self) -> None:
+        while True:
+            self._wake.clear()
+            self.state = "syncing"
+            ok = await self.sync_once()
+
+            self.consecutive_failures = 0 if ok else self.consecutive_failures + 1
+            if ok:
+                self.state = "idle"
+                delay = self._next_poll_delay() * random.uniform(0.9, 1.1)
+            else:
+                self.state = "backoff"
+                delay = min(self.interval, 5 + backoff_delay(self.consecutive_failures, base=10, cap=self.interval))
+            self.wakeups[await self._idle(delay, subscribe=ok and self.subscribe_supported)] += 1
+
+    def _next_poll_delay(self) -> float:
+        """Interval until the next sync when no push notification arrives first."""
+        if self.subscribe_supported:
+            # Long-polls deliver changes; the timer is only a safety net
+            self._poll_delay = self.interval
+        elif self.last_pulled or self.last_pushed:
+            self._poll_delay = max(self.min_interval, self._poll_delay / 2)
+        else:
+            self._poll_delay = min(self.interval, self._poll_delay * 2)
+        return self._poll_delay
+
+    async def _idle(self, delay: float, subscribe: bool) -> str:
+        """Wait for the timer, notify() or a server change, whichever comes first.
+
+        Returns:
+            What ended the wait: "timer", "notify" or "subscribe"
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + delay
+        wake = asyncio.create_task(self._wake.wait())
+        pending = {wake}
+        if subscribe:
+            pending.add(asyncio.create_task(self._subscribe()))
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, timeout=max(0, deadline - loop.time()), return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    return "timer"
+                if wake in done:
+                    return "notify"
+                task = done.pop()
+                if not task.cancelled() and task.exception() is None and task.result():
+                    return "subscribe"
+            return "timer"
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    async def _subscribe(self) -> bool:
+        """Long-poll the server until the store's ChangeLog moves past our cursor.
+
+        Returns:
+            True when the server reports changes, False if subscribing failed
+        """
+        manager = self.manager
+        failures = 0
+        while True:
+            try:
+                response = await self._client.get(
+                    "/sync/subscribe",
+                    headers={"Authorization": f"Bearer {manager.sync_token}"},
+                    params={"cursor": manager.change_cursor, "timeout": self.subscribe_timeout},
+                    timeout=self._subscribe_http_timeout
+                )
+            except httpx.HTTPError as e:
+                # Server restarting or unreachable: retry the long-poll with backoff
+                failures += 1
+                self.logger.warning(f"Subscribe failed: {e}")
+                await asyncio.sleep(backoff_delay(failures, base=2, cap=self.interval))
+                continue
+
+            if response.status_code == 404:
+                self.logger.info("Server has no /sync/subscribe, polling instead")
+                self.subscribe_supported = False
+                return False
+            if response.status_code == 401:
+                # Sync now so the token is renewed
+                manager.sync_token = None
+                return True
+            if response.status_code != 200:
+                self.logger.warning(f"Subscribe failed: {response.text}")
+                return False
+            failures = 0
+            if response.json().get("changed"):
+                return True
+
+    async def sync_once(self) -> bool:
+        """Run one sync: bootstrap if needed, then pull, then push.
+
+        Returns:
+            True if both directions completed
+        """
+        manager = self.manager
+        self._bytes = {"sent": 0, "received": 0}
+        try:
+            if not manager.sync_token and not await self._connect():
+                return self._failed("could not connect to server")
+
+            if not manager.change_cursor and not manager.state.get("bootstrap", {}).get("complete"):
+                if not await asyncio.to_thread(manager.bootstrap):
+                    return self._failed("bootstrap did not complete")
+
+            # Pulled rows are merged into pending outbox entries before those are pushed
+            pulled = await self._pull()
+            if pulled is None:
+                return self._failed("pull was rejected by the server")
+            pushed = await self._push()
+            if pushed is None:
+                return self._failed("push was rejected by the server")
+        except (httpx.HTTPError, OSError) as e:
+            return self._failed(f"{type(e).__name__}: {e}")
+        except Exception as e:
+            self.logger.error(f"Error during sync: {e}")
+            return self._failed(str(e))
+
+        self.syncs += 1
+        self.last_error = None
+        self.last_pulled, self.last_pushed = pulled, pushed
+        self.last_sync_bytes = self._bytes
+        manager.last_sync_time = datetime.now().isoformat()
+        await asyncio.to_thread(manager.state.set, "last_sync_time", manager.last_sync_time)
+        self.logger.info(
+            f"Synced: pulled {pulled}, pushed {pushed}, bytes sent {self._bytes['sent']}, "
+            f"received {self._bytes['received']}"
+        )
+        return True
+
+    def _failed(self, reason: str) -> bool:
+        self.failures += 1
+        self.last_error = reason
+        self.logger.warning(f"Sync failed: {reason}")
+        return False
+
+    async def _send(self, method: str, path: str, **kwargs) -> httpx.Response:
+        response = await self._client.request(method, path, **kwargs)
+        self._bytes["sent"] += len(kwargs.get("content") or b"")
+        self._bytes["received"] += getattr(response, "num_bytes_downloaded", None) or len(response.content)
+        if response.status_code == 401:
+            # Token expired, reconnect on the next sync
+            self.manager.sync_token = None
+        return response
+
+    async def _connect(self) -> bool:
+        manager = self.manager
+        response = await self._send("POST", "/sync/connect", data={
+            "store_id": manager.store_id,
+            "store_name": manager.store_name,
+            "license_number": manager.license_number
+        })
+        if response.status_code != 200:
+            self.logger.error(f"Failed to connect to server: {response.text}")
+            return False
+        manager.sync_token = response.json().get("access_token")
+        return True
+
+    def _blocking_send(self, method: str, path: str, **kwargs) -> httpx.Response:
+        """Send a request on the event loop's client from a worker thread and wait for it."""
+        return asyncio.run_coroutine_threadsafe(self._send(method, path, **kwargs), self._loop).result()
+
+    async def _pull(self) -> Optional[int]:
+        """Pull server changes page by page; returns the number applied, None on rejection."""
+        return await asyncio.to_thread(self.manager.pull_changes, self._blocking_send)
+
+    async def _push(self) -> Optional[int]:
+        """Push the outbox in batches; returns the number acknowledged, None on rejection."""
+        return await asyncio.to_thread(self.manager.push_outbox, self._blocking_send)
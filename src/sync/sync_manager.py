@@ -1,46 +1,91 @@
 import os
 import json
-import time
+import sqlite3
+import tempfile
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Dict, List, Optional
-import requests
+from typing import Any, Callable, Dict, List, Optional
+from ..database.batch_apply import STOCK_DELTA, apply_stock_movements, validate_stock_movement
+from ..database.database_sqlite import SQLiteDatabase
 from ..utils.loggers import LoggerFactory
+from . import codec
+from .conflicts import ConflictResolver
+from .outbox import SyncOutbox
+from .snapshot import install_snapshot
+from .sync_state import SyncState
+from .transport import CircuitOpenError, SyncTransport
 
 class SyncManager:
-    def __init__(self, store_id: str, server_url: str, local_db_path: str):
+    def __init__(self, store_id: str, server_url: str, local_db_path: str, push_batch_size: int = 500,
+                 store_name: Optional[str] = None, license_number: Optional[str] = None,
+                 transport: Optional[SyncTransport] = None, bootstrap_chunk_size: int = 1000,
+                 bootstrap_workers: int = 3, snapshot_threshold_rows: int = 50000):
         """Initialize the sync manager.
         
         Args:
             store_id: Unique identifier for the store
             server_url: URL of the main server
             local_db_path: Path to local SQLite database
+            push_batch_size: Maximum number of queued changes sent per request
+            store_name: Store name registered on the main server
+            license_number: Store license number registered on the main server
+            transport: HTTP transport to the main server (default: SyncTransport with default settings)
+            bootstrap_chunk_size: Rows per request when downloading the full dataset
+            bootstrap_workers: Tables downloaded in parallel during bootstrap
+            snapshot_threshold_rows: Datasets at least this large are bootstrapped
+                from a database snapshot instead of row by row
         """
         self.store_id = store_id
+        self.store_name = store_name
+        self.license_number = license_number
         self.server_url = server_url.rstrip('/')
         self.local_db_path = local_db_path
+        self.push_batch_size = push_batch_size
+        self.bootstrap_chunk_size = bootstrap_chunk_size
+        self.bootstrap_workers = bootstrap_workers
+        self.snapshot_threshold_rows = snapshot_threshold_rows
+        self._bootstrap_lock = threading.Lock()
         
         # Set up logger
         base_dir = os.path.abspath(os.path.dirname(__file__))
         log_dir = os.path.join(base_dir, "..", "..", "results", "logs")
         self.logger = LoggerFactory("SyncLogger", log_dir, "sync").get_logger()
         
-        # Initialize sync queue
-        self.sync_queue = []
-        self.last_sync_time = None
+        # Queued changes live in the local database so they survive restarts
+        self.outbox = SyncOutbox(local_db_path)
+        self.state = SyncState(local_db_path)
+        self.change_cursor = self.state.get("change_cursor", 0)
+        self.last_sync_time = self.state.get("last_sync_time")
         self.sync_token = None
 
+        # Pooled keep-alive session with timeouts, retries and a circuit breaker
+        self.transport = transport or SyncTransport(self.server_url)
+
+        self._local_db: Optional[SQLiteDatabase] = None
+        self._resolver: Optional[ConflictResolver] = None
+        self.local_db()
+        self.conflict_stats = {"applied": 0, "skipped": 0, "conflicts": 0, "resolutions": {}}
+
+        # Pushes stay plain JSON until the server answers a pull with a compact encoding
+        self.push_media_type = codec.JSON
+        self.last_sync_bytes = {"sent": 0, "received": 0}
+
     def connect_to_server(self) -> bool:
         """Establish connection with the main server and get sync token."""
         try:
-            response = requests.post(
-                f"{self.server_url}/api/sync/connect",
-                json={"store_id": self.store_id}
+            response = self.transport.post(
+                "/sync/connect",
+                data={
+                    "store_id": self.store_id,
+                    "store_name": self.store_name,
+                    "license_number": self.license_number
+                }
             )
             if response.status_code == 200:
-                data = response.json()
-                self.sync_token = data.get("token")
-                self.last_sync_time = data.get("last_sync")
-                self.logger.info(f"Connected to server. Last sync: {self.last_sync_time}")
+                self.sync_token = response.json().get("access_token")
+                self.logger.info(f"Connected to server. Change cursor: {self.change_cursor}")
                 return True
             else:
                 self.logger.error(f"Failed to connect to server: {response.text}")
@@ -57,14 +102,131 @@ class SyncManager:
             operation: Type of operation (insert/update/delete)
             data: The data being changed
         """
-        change = {
-            "timestamp": datetime.now().isoformat(),
-            "table": table,
-            "operation": operation,
-            "data": data
-        }
-        self.sync_queue.append(change)
-        self.logger.info(f"Queued change: {operation} on {table}")
+        seq = self.outbox.append(table, operation, data)
+        self.logger.info(f"Queued change {seq}: {operation} on {table}")
+
+    def record_stock_movement(self, medicine_id: int, delta: int, reason: str,
+                              reference: Optional[str] = None) -> Optional[str]:
+        """Change a medicine's local stock and queue the change as a delta.
+
+        The movement is written to the local StockMovement ledger, added to
+        the local stock and queued in the outbox in one transaction. The
+        server adds the delta to its own stock instead of overwriting it, so
+        sales here and receipts elsewhere are never lost.
+
+        Args:
+            medicine_id: The ID of the medicine
+            delta: Quantity added (positive) or removed (negative)
+            reason: One of STOCK_MOVEMENT_REASONS, e.g. 'sale' or 'receipt'
+            reference: Optional source document, e.g. a purchase or invoice number
+
+        Returns:
+            The movement's unique ID, or None if it could not be recorded
+        """
+        try:
+            movement = validate_stock_movement({
+                "MovementUID": uuid.uuid4().hex, "MedicineID": medicine_id,
+                "Delta": delta, "Reason": reason, "Reference": reference
+            })
+        except ValueError as e:
+            self.logger.error(f"Invalid stock movement: {e}")
+            return None
+
+        self.local_db()
+        conn = sqlite3.connect(self.local_db_path, timeout=30, isolation_level=None)
+        try:
+            # A committed sale must still be queued after a power loss
+            conn.execute("PRAGMA synchronous = FULL")
+            conn.execute("BEGIN IMMEDIATE")
+            error = apply_stock_movements(conn, int(self.store_id), [movement])[0]
+            if error:
+                conn.execute("ROLLBACK")
+                self.logger.error(f"Error recording stock movement: {error}")
+                return None
+            seq = self.outbox.append("StockMovement", STOCK_DELTA, movement, conn=conn)
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            self.logger.error(f"Error recording stock movement: {e}")
+            return None
+        finally:
+            conn.close()
+
+        self.logger.info(f"Queued change {seq}: {delta:+d} stock of medicine {medicine_id} ({reason})")
+        return movement["MovementUID"]
+
+    def get_queue_stats(self) -> Dict:
+        """Return depth, oldest-entry age and on-disk size of the outbox."""
+        return self.outbox.stats()
+
+    def _send(self, method: str, path: str, **kwargs) -> Any:
+        """Send a request through the transport; the body is passed as content."""
+        if "content" in kwargs:
+            kwargs["data"] = kwargs.pop("content")
+        response = self.transport.request(method, path, **kwargs)
+        if response.status_code == 401:
+            # Token expired, reconnect on the next sync
+            self.sync_token = None
+        return response
+
+    def push_outbox(self, send: Optional[Callable[..., Any]] = None) -> Optional[int]:
+        """Push queued changes in sequence order, deleting each batch once accepted.
+
+        Args:
+            send: Called as send(method, path, **kwargs) with the body as
+                content; returns a requests- or httpx-style response. Defaults
+                to the manager's own transport.
+
+        Returns:
+            The number of queued changes acknowledged, or None if the server
+            rejected a push
+        """
+        send = send or self._send
+        pushed = sent = 0
+        while True:
+            # Redundant edits to the same row are merged before they are sent
+            batch, last_seq = self.outbox.dequeue_coalesced(limit=self.push_batch_size)
+            if not last_seq:
+                break
+            if not batch:
+                # Every entry cancelled out, nothing to send
+                pushed += self.outbox.ack(last_seq)
+                continue
+
+            media_type = self.push_media_type
+            body, encoding = codec.encode_body({"changes": batch}, media_type, compress=True)
+            headers = {
+                "Authorization": f"Bearer {self.sync_token}",
+                "Content-Type": media_type,
+                "X-Outbox-Depth": str(self.outbox.depth())
+            }
+            if encoding:
+                headers["Content-Encoding"] = encoding
+            response = send("POST", "/sync/push", headers=headers, content=body)
+            if response.status_code == 415 and media_type != codec.JSON:
+                self.logger.warning(f"Server rejected {media_type}, falling back to JSON")
+                self.push_media_type = codec.JSON
+                continue
+            if response.status_code != 200:
+                self.logger.error(f"Failed to push changes: {response.text}")
+                return None
+
+            # Rejected rows would be rejected again: keep them aside rather than retry forever
+            rejected = [
+                (batch[result["index"]], result) for result in response.json().get("results", [])
+                if result.get("status") in ("error", "conflict") and result.get("index") is not None
+            ]
+            for change, result in rejected:
+                self.logger.error(f"Server rejected change {change['seq']}: {result.get('error')}")
+
+            pushed += self.outbox.ack(last_seq, rejected)
+            sent += len(batch)
+
+        if pushed:
+            self.outbox.compact()
+            self.logger.info(f"Pushed {pushed} queued changes as {sent}")
+        return pushed
 
     def sync_changes(self) -> bool:
         """Synchronize queued changes with the main server."""
@@ -72,66 +234,271 @@ class SyncManager:
             if not self.connect_to_server():
                 return False
 
+        before = self.transport.stats.summary()
         try:
-            # Get changes since last sync
-            response = requests.get(
-                f"{self.server_url}/api/sync/changes",
-                headers={"Authorization": f"Bearer {self.sync_token}"},
-                params={"since": self.last_sync_time}
-            )
-            
-            if response.status_code == 200:
-                server_changes = response.json().get("changes", [])
-                self._resolve_conflicts(server_changes)
-                
-                # Send local changes
-                if self.sync_queue:
-                    response = requests.post(
-                        f"{self.server_url}/api/sync/push",
-                        headers={"Authorization": f"Bearer {self.sync_token}"},
-                        json={"changes": self.sync_queue}
-                    )
-                    
-                    if response.status_code == 200:
-                        self.sync_queue = []
-                        self.last_sync_time = datetime.now().isoformat()
-                        self.logger.info("Successfully synced changes")
-                        return True
-                    else:
-                        self.logger.error(f"Failed to push changes: {response.text}")
-                        return False
-                return True
-            else:
-                self.logger.error(f"Failed to get server changes: {response.text}")
+            # A new or rebuilt store downloads its full dataset first
+            if not self.change_cursor and not self.state.get("bootstrap", {}).get("complete"):
+                if not self.bootstrap():
+                    return False
+
+            # Pull server changes after our ChangeLog cursor
+            if self.pull_changes() is None:
                 return False
-                
+
+            # Send local changes
+            if self.push_outbox() is None:
+                return False
+
+            self.last_sync_time = datetime.now().isoformat()
+            self.state.set("last_sync_time", self.last_sync_time)
+            after = self.transport.stats.summary()
+            self.last_sync_bytes = {
+                "sent": after["bytes_sent"] - before["bytes_sent"],
+                "received": after["bytes_received"] - before["bytes_received"]
+            }
+            self.logger.info(
+                f"Successfully synced changes. Bytes sent: {self.last_sync_bytes['sent']}, "
+                f"received: {self.last_sync_bytes['received']}. Transport: {after}"
+            )
+            return True
+
+        except CircuitOpenError as e:
+            self.logger.warning(f"Skipping sync: {e}")
+            return False
         except Exception as e:
             self.logger.error(f"Error during sync: {e}")
             return False
 
-    def _resolve_conflicts(self, server_changes: List[Dict]) -> None:
-        """Resolve conflicts between local and server changes.
-        
+    def pull_changes(self, send: Optional[Callable[..., Any]] = None) -> Optional[int]:
+        """Fetch and apply server changes page by page, advancing the stored cursor.
+
         Args:
-            server_changes: List of changes from the server
+            send: Request function as for push_outbox (default: the manager's transport)
+
+        Returns:
+            The number of server changes received, or None if a page was refused
         """
-        # TODO: Implement conflict resolution logic
-        # For now, server changes take precedence
-        for change in server_changes:
-            self.logger.info(f"Applying server change: {change['operation']} on {change['table']}")
-            # Apply server change to local database
-            # This will be implemented when we modify the database schema
-
-    def start_sync_loop(self, interval: int = 300) -> None:
-        """Start continuous synchronization loop.
-        
+        send = send or self._send
+        pulled = 0
+        while True:
+            response = send("GET", "/sync/changes", headers=self.pull_headers(),
+                            params={"cursor": self.change_cursor})
+            if response.status_code != 200:
+                self.logger.error(f"Failed to get server changes: {response.text}")
+                return None
+
+            payload = self.decode_response(response)
+            self._resolve_conflicts(payload.get("changes", []))
+            self.change_cursor = payload.get("cursor", self.change_cursor)
+            self.state.set("change_cursor", self.change_cursor)
+            pulled += len(payload.get("changes", []))
+
+            if not payload.get("has_more"):
+                return pulled
+
+    def pull_headers(self) -> Dict[str, str]:
+        return {
+            "Authorization": f"Bearer {self.sync_token}",
+            "Accept": codec.accept_header(),
+            "Accept-Encoding": "gzip"
+        }
+
+    def decode_response(self, response) -> Dict:
+        """Decode a negotiated response body, remembering the encoding for pushes."""
+        # requests has already undone any gzip Content-Encoding
+        media_type = response.headers.get("Content-Type", codec.JSON).split(";")[0].strip()
+        payload = codec.decode_body(response.content, media_type)
+        if media_type != codec.JSON:
+            self.push_media_type = media_type
+        return payload
+
+    def bootstrap(self, force: bool = False) -> bool:
+        """Download the store's full dataset from the main server.
+
+        Each table is paged by primary key, several tables at a time, and
+        every chunk is checked against its checksum before it is written to
+        the local database. Progress is saved in SyncState after each chunk,
+        so an interrupted bootstrap resumes from the last written chunk. Once
+        all tables are done the change cursor moves to the high-water mark
+        taken when the bootstrap started.
+
         Args:
-            interval: Sync interval in seconds (default: 5 minutes)
+            force: Download everything again even if a bootstrap completed before
+
+        Returns:
+            True if every table was downloaded
         """
+        progress = self.state.get("bootstrap")
+        if progress and progress.get("complete") and not force:
+            return True
+        if not self.sync_token and not self.connect_to_server():
+            return False
+
+        try:
+            if not progress or progress.get("complete"):
+                response = self.transport.get("/sync/bootstrap", headers=self.pull_headers())
+                if response.status_code != 200:
+                    self.logger.error(f"Failed to get bootstrap manifest: {response.text}")
+                    return False
+                manifest = response.json()
+                total_rows = sum(info["rows"] for info in manifest["tables"].values())
+                if total_rows >= self.snapshot_threshold_rows:
+                    self.logger.info(f"Bootstrapping {total_rows} rows from a snapshot")
+                    return self.restore_snapshot()
+                progress = {
+                    "cursor": manifest["cursor"],
+                    "complete": False,
+                    "tables": {
+                        table: {"after": 0, "done": info["rows"] == 0}
+                        for table, info in manifest["tables"].items()
+                    }
+                }
+                self.state.set("bootstrap", progress)
+                self.logger.info(f"Starting bootstrap at cursor {progress['cursor']}: {manifest['tables']}")
+
+            local_db = self.local_db()
+            pending = [table for table, table_progress in progress["tables"].items() if not table_progress["done"]]
+            with ThreadPoolExecutor(max_workers=max(1, self.bootstrap_workers)) as pool:
+                done = list(pool.map(lambda table: self._bootstrap_table(local_db, table, progress), pending))
+            if not all(done):
+                return False
+
+            progress["complete"] = True
+            self.state.set("bootstrap", progress)
+            self.change_cursor = progress["cursor"]
+            self.state.set("change_cursor", self.change_cursor)
+            self.logger.info(f"Bootstrap complete, change cursor {self.change_cursor}")
+            return True
+        except CircuitOpenError as e:
+            self.logger.warning(f"Pausing bootstrap: {e}")
+            return False
+        except Exception as e:
+            self.logger.error(f"Error during bootstrap: {e}")
+            return False
+
+    def restore_snapshot(self) -> bool:
+        """Replace the local database with a compressed snapshot from the server.
+
+        The snapshot is streamed to a temporary file, verified against its
+        checksum and installed atomically, keeping the pending outbox and
+        sync state. Syncing then continues from the snapshot's change cursor.
+
+        Returns:
+            True if the snapshot was installed
+        """
+        if not self.sync_token and not self.connect_to_server():
+            return False
+
+        directory = os.path.dirname(os.path.abspath(self.local_db_path))
+        fd, download_path = tempfile.mkstemp(dir=directory, prefix=".download_", suffix=".db.gz")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                response = self.transport.get(
+                    "/sync/snapshot",
+                    headers={"Authorization": f"Bearer {self.sync_token}"},
+                    timeout=(self.transport.timeout[0], 600),
+                    stream=True
+                )
+                if response.status_code != 200:
+                    self.logger.error(f"Failed to get snapshot: {response.text}")
+                    return False
+                for chunk in response.iter_content(chunk_size=1024 * 1024):
+                    f.write(chunk)
+
+            install_snapshot(download_path, self.local_db_path, response.headers["X-Snapshot-SHA256"])
+            cursor = int(response.headers["X-Snapshot-Cursor"])
+            self._local_db = None
+            self._resolver = None
+
+            self.change_cursor = cursor
+            self.state.set("change_cursor", cursor)
+            self.state.set("bootstrap", {"cursor": cursor, "complete": True, "tables": {}, "source": "snapshot"})
+            self.logger.info(f"Installed snapshot at cursor {cursor}")
+            return True
+        except CircuitOpenError as e:
+            self.logger.warning(f"Skipping snapshot download: {e}")
+            return False
+        except Exception as e:
+            self.logger.error(f"Error installing snapshot: {e}")
+            return False
+        finally:
+            if os.path.exists(download_path):
+                os.remove(download_path)
+
+    def _bootstrap_table(self, local_db: SQLiteDatabase, table: str, progress: Dict) -> bool:
+        """Download one table chunk by chunk, saving progress after each chunk."""
+        after = progress["tables"][table]["after"]
         while True:
-            try:
-                self.sync_changes()
-                time.sleep(interval)
-            except Exception as e:
-                self.logger.error(f"Error in sync loop: {e}")
-                time.sleep(60)  # Wait a minute before retrying 
\ No newline at end of file
+            chunk = self._fetch_chunk(table, after)
+            if chunk is None:
+                return False
+            if chunk["rows"]:
+                local_db.upsert_rows(table, chunk["columns"], chunk["rows"])
+
+            after = chunk["next_after"]
+            with self._bootstrap_lock:
+                progress["tables"][table] = {"after": after, "done": not chunk["has_more"]}
+                self.state.set("bootstrap", progress)
+            if not chunk["has_more"]:
+                self.logger.info(f"Bootstrapped {table} up to key {after}")
+                return True
+
+    def _fetch_chunk(self, table: str, after: int, attempts: int = 3) -> Optional[Dict]:
+        """Fetch one bootstrap chunk, retrying when its checksum does not match."""
+        for _ in range(attempts):
+            response = self.transport.get(
+                f"/sync/bootstrap/{table}",
+                headers=self.pull_headers(),
+                params={"after": after, "limit": self.bootstrap_chunk_size}
+            )
+            if response.status_code != 200:
+                self.logger.error(f"Failed to get {table} after {after}: {response.text}")
+                return None
+            chunk = self.decode_response(response)
+            if codec.rows_checksum(chunk["columns"], chunk["rows"]) == chunk["checksum"]:
+                return chunk
+            self.logger.warning(f"Checksum mismatch on {table} after {after}, retrying")
+        self.logger.error(f"Giving up on {table} after {after}: checksum kept failing")
+        return None
+
+    def local_db(self) -> SQLiteDatabase:
+        """Return the store's local database, creating its schema on first use."""
+        if self._local_db is None:
+            self._local_db = SQLiteDatabase(self.local_db_path)
+            # Rows created here must never take an ID the server or another store uses
+            self._local_db.set_id_block(int(self.store_id))
+        return self._local_db
+
+    def _resolve_conflicts(self, server_changes: List[Dict]) -> Dict:
+        """Apply server changes locally, merging rows that also have pending local edits.
+
+        Args:
+            server_changes: List of changes from the server
+
+        Returns:
+            Counts of applied, skipped and conflicting changes for this page
+        """
+        if not server_changes:
+            return {"applied": 0, "skipped": 0, "conflicts": 0, "resolutions": {}}
+        if self._resolver is None:
+            self.local_db()
+            self._resolver = ConflictResolver(self.local_db_path)
+
+        result = self._resolver.apply(server_changes)
+        for name in ("applied", "skipped", "conflicts"):
+            self.conflict_stats[name] += result[name]
+        for resolution, count in result["resolutions"].items():
+            self.conflict_stats["resolutions"][resolution] = self.conflict_stats["resolutions"].get(resolution, 0) + count
+        if result["conflicts"]:
+            self.logger.warning(f"Resolved {result['conflicts']} conflicts: {result['resolutions']}")
+        self.logger.info(f"Applied {result['applied']} server changes, {result['skipped']} already applied")
+        return result
+
+    def get_transport_stats(self) -> Dict:
+        """Return request latency percentiles, counters and circuit state of the transport."""
+        return {
+            **self.transport.stats.summary(),
+            "circuit": self.transport.circuit_state,
+            "push_media_type": self.push_media_type,
+            "last_sync_bytes": self.last_sync_bytes
+        }
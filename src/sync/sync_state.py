@@ -0,0 +1,50 @@
+import json
+import os
+import sqlite3
+from typing import Any
+
+
+class SyncState:
+    """Key/value sync bookkeeping (cursors, timestamps) kept in the store's local database."""
+
+    def __init__(self, db_path: str):
+        """Initialize the state store.
+
+        Args:
+            db_path: Path to the store's local SQLite database
+        """
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS SyncState (
+                    Key TEXT PRIMARY KEY,
+                    Value TEXT NOT NULL
+                )
+            ''')
+            conn.commit()
+        finally:
+            conn.close()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Return the stored value for a key, or default if it is not set."""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            row = conn.execute("SELECT Value FROM SyncState WHERE Key = ?", (key,)).fetchone()
+        finally:
+            conn.close()
+        return json.loads(row[0]) if row else default
+
+    def set(self, key: str, value: Any) -> None:
+        """Store a JSON-serializable value for a key."""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            conn.execute(
+                "INSERT INTO SyncState (Key, Value) VALUES (?, ?) "
+                "ON CONFLICT(Key) DO UPDATE SET Value = excluded.Value",
+                (key, json.dumps(value))
+            )
+            conn.commit()
+        finally:
+            conn.close()
@@ -0,0 +1,243 @@
+import random
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Responses worth retrying: rate limiting and gateway/server overload
+RETRY_STATUSES = {429, 502, 503, 504}
+
+
+def _is_failure(status_code: int) -> bool:
+    """Whether a response counts against the circuit breaker: any 5xx, or rate limiting."""
+    return status_code >= 500 or status_code == 429
+
+
+class CircuitOpenError(Exception):
+    """Raised when the circuit breaker is open and calls are not attempted."""
+
+
+def backoff_delay(attempt: int, base: float = 0.5, cap: float = 30.0) -> float:
+    """Exponential backoff with full jitter.
+
+    Args:
+        attempt: Number of failures so far (1 for the first retry)
+        base: Delay ceiling of the first retry in seconds
+        cap: Largest delay ceiling in seconds
+
+    Returns:
+        Random delay between 0 and min(cap, base * 2 ** (attempt - 1))
+    """
+    return random.uniform(0, min(cap, base * (2 ** max(attempt - 1, 0))))
+
+
+def _wire_bytes(response: requests.Response) -> int:
+    """Size of a response body as received, before gzip decoding."""
+    content = response.content
+    try:
+        return int(response.raw.tell()) or len(content)
+    except (AttributeError, TypeError, ValueError):
+        return len(content)
+
+
+class LatencyStats:
+    """Rolling request latency and outcome counters for one transport."""
+
+    def __init__(self, window: int = 1000):
+        self._lock = threading.Lock()
+        self._durations = deque(maxlen=window)
+        self.requests = 0
+        self.failures = 0
+        self.retries = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    def record(self, seconds: float, ok: bool, sent: int = 0, received: int = 0) -> None:
+        with self._lock:
+            self._durations.append(seconds)
+            self.requests += 1
+            self.failures += 0 if ok else 1
+            self.bytes_sent += sent
+            self.bytes_received += received
+
+    def record_retry(self) -> None:
+        with self._lock:
+            self.retries += 1
+
+    def summary(self) -> Dict[str, Optional[float]]:
+        """Return counters and p50/p95/max latency in milliseconds over the window."""
+        with self._lock:
+            durations = sorted(self._durations)
+            counters = {
+                "requests": self.requests,
+                "failures": self.failures,
+                "retries": self.retries,
+                "bytes_sent": self.bytes_sent,
+                "bytes_received": self.bytes_received,
+            }
+
+        def percentile(p: float) -> Optional[float]:
+            if not durations:
+                return None
+            return durations[min(len(durations) - 1, int(p * len(durations)))] * 1000
+
+        return {
+            **counters,
+            "p50_ms": percentile(0.50),
+            "p95_ms": percentile(0.95),
+            "max_ms": durations[-1] * 1000 if durations else None,
+        }
+
+
+class SyncTransport:
+    """HTTP transport used by SyncManager to talk to the main server.
+
+    Requests go through one pooled keep-alive session with connect and read
+    timeouts. Connection errors, timeouts and overload responses are retried
+    with exponential backoff and full jitter. After failure_threshold
+    consecutive failed calls (including any 5xx response) the circuit opens
+    and calls fail fast until reset_timeout has passed. Then exactly one
+    trial call is let through, without retries, while concurrent calls keep
+    failing fast; its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, base_url: str, connect_timeout: float = 5.0, read_timeout: float = 30.0,
+                 max_retries: int = 3, backoff_base: float = 0.5, backoff_cap: float = 30.0,
+                 failure_threshold: int = 5, reset_timeout: float = 60.0, pool_size: int = 4):
+        """Initialize the transport.
+
+        Args:
+            base_url: URL of the main server
+            connect_timeout: Seconds to wait for a TCP connection
+            read_timeout: Seconds to wait for the server to respond
+            max_retries: Retries per call after the first attempt
+            backoff_base: Delay ceiling of the first retry in seconds
+            backoff_cap: Largest delay between retries in seconds
+            failure_threshold: Consecutive failed calls that open the circuit
+            reset_timeout: Seconds the circuit stays open before a trial call
+            pool_size: Keep-alive connections kept to the server
+        """
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self.stats = LatencyStats()
+        self._lock = threading.Lock()
+        self._consecutive_failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+
+    @property
+    def circuit_state(self) -> str:
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def _admit(self) -> bool:
+        """Let a call through or raise CircuitOpenError; returns whether it is the half-open trial."""
+        with self._lock:
+            state = self._state()
+            if state == "open" or (state == "half_open" and self._trial_in_flight):
+                raise CircuitOpenError(f"Circuit open after {self._consecutive_failures} consecutive failures")
+            self._trial_in_flight = state == "half_open"
+            return self._trial_in_flight
+
+    def _record_outcome(self, ok: bool) -> None:
+        with self._lock:
+            self._trial_in_flight = False
+            if ok:
+                self._consecutive_failures = 0
+                self._opened_at = None
+                return
+            self._consecutive_failures += 1
+            if self._consecutive_failures >= self.failure_threshold or self._opened_at is not None:
+                # Open the circuit, or re-open it after a failed trial call
+                self._opened_at = time.monotonic()
+
+    def request(self, method: str, path: str, **kwargs) -> requests.Response:
+        """Send a request, retrying transient failures.
+
+        Args:
+            method: HTTP method
+            path: Path relative to the server URL, e.g. "/sync/changes"
+            **kwargs: Passed on to requests.Session.request
+
+        Returns:
+            The server response. Responses other than the retried overload
+            statuses are returned as-is, including 4xx and other 5xx errors.
+
+        Raises:
+            CircuitOpenError: If the circuit is open
+            requests.RequestException: If every attempt failed to connect
+        """
+        trial = self._admit()
+        try:
+            return self._send(method, path, 0 if trial else self.max_retries, **kwargs)
+        finally:
+            if trial:
+                with self._lock:
+                    # Released here too in case the trial raised something unexpected
+                    self._trial_in_flight = False
+
+    def _send(self, method: str, path: str, max_retries: int, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        url = f"{self.base_url}{path}"
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self.stats.record(time.perf_counter() - start, ok=False)
+                error, response = e, None
+            else:
+                sent = len(response.request.body or b"") if response.request is not None else 0
+                ok = not _is_failure(response.status_code)
+                # Streamed bodies are left for the caller to read
+                received = int(response.headers.get("Content-Length", 0)) if kwargs.get("stream") else _wire_bytes(response)
+                self.stats.record(time.perf_counter() - start, ok=ok, sent=sent, received=received)
+                if response.status_code not in RETRY_STATUSES:
+                    self._record_outcome(ok)
+                    return response
+                error = None
+
+            attempt += 1
+            if attempt > max_retries:
+                self._record_outcome(False)
+                if response is not None:
+                    return response
+                raise error
+
+            self.stats.record_retry()
+            delay = backoff_delay(attempt, self.backoff_base, self.backoff_cap)
+            retry_after = response.headers.get("Retry-After") if response is not None else None
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, min(float(retry_after), self.backoff_cap))
+            time.sleep(delay)
+
+    def get(self, path: str, **kwargs) -> requests.Response:
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path: str, **kwargs) -> requests.Response:
+        return self.request("POST", path, **kwargs)
+
+    def close(self) -> None:
+        self.session.close()
@@ -0,0 +1,48 @@
+"""Phone number normalization used for indexed customer lookup."""
+
+
+import re
+from typing import Optional
+
+# Longest contact information, in characters, whose digits phone_key_sql reads
+PHONE_KEY_MAX_LENGTH = 48
+
+
+def phone_key(value: Optional[str]) -> Optional[str]:
+    """Build the lookup key for a phone number stored in any format.
+
+    The key holds only the digits, in reverse order. Formatting characters and
+    country prefixes then stop mattering: "+1-555-0123", "(555) 0123" and
+    "5550123" all start with the same digits, so searching by the trailing
+    digits a customer reads out is an index prefix scan. Only the first
+    PHONE_KEY_MAX_LENGTH characters are read, like phone_key_sql does.
+
+    Args:
+        value (Optional[str]): Contact information as entered.
+
+    Returns:
+        Optional[str]: Reversed digits, or None if the value has no digits.
+    """
+    if not value:
+        return None
+    digits = re.sub(r"[^0-9]", "", value[:PHONE_KEY_MAX_LENGTH])
+    return digits[::-1] or None
+
+
+def phone_key_sql(column: str) -> str:
+    """Build an SQL expression computing phone_key of a column.
+
+    SQLite has no regular expressions or string reversal, so the expression
+    reads the first PHONE_KEY_MAX_LENGTH characters one by one, last first,
+    and keeps the digits. It lets triggers keep the key in step with the
+    phone number on every write, whichever connection makes it.
+
+    Args:
+        column (str): Column or trigger reference holding the phone number, e.g. new.ContactInfo.
+
+    Returns:
+        str: Expression that is NULL when the value has no digits.
+    """
+    characters = [f"substr({column}, {position}, 1)" for position in range(PHONE_KEY_MAX_LENGTH, 0, -1)]
+    digits = " || ".join(f"(CASE WHEN {c} GLOB '[0-9]' THEN {c} ELSE '' END)" for c in characters)
+    return f"NULLIF({digits}, '')"
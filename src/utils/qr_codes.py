@@ -0,0 +1,167 @@
+"""QR code rendering for store links, served from memory or exported as PNG files."""
+
+
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+import hashlib
+import io
+import json
+import os
+import tempfile
+import time
+from typing import Dict, Optional, Tuple
+
+import qrcode
+
+# Rendering settings shared by every QR code the application produces
+QR_VERSION = 1
+QR_ERROR_CORRECTION = qrcode.constants.ERROR_CORRECT_L
+QR_BOX_SIZE = 10
+QR_BORDER = 4
+
+MANIFEST_NAME = "manifest.json"
+
+# Number of rendered PNGs kept in memory by store_qr_png
+QR_CACHE_SIZE = 512
+
+
+def make_qr_image(url: str, box_size: int = QR_BOX_SIZE):
+    """Build the QR code image for a URL.
+
+    Args:
+        url (str): URL to encode.
+        box_size (int): Size in pixels of each QR module.
+
+    Returns:
+        The rendered image.
+    """
+    qr = qrcode.QRCode(
+        version=QR_VERSION,
+        error_correction=QR_ERROR_CORRECTION,
+        box_size=box_size,
+        border=QR_BORDER,
+    )
+    qr.add_data(url)
+    qr.make(fit=True)
+    return qr.make_image(fill_color="black", back_color="white")
+
+
+def qr_digest(url: str, box_size: int = QR_BOX_SIZE) -> str:
+    """Hash a URL together with the settings that affect its rendered image."""
+    key = f"{url}|{QR_VERSION}|{QR_ERROR_CORRECTION}|{box_size}|{QR_BORDER}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def render_qr_png(url: str, box_size: int = QR_BOX_SIZE) -> bytes:
+    """Render the QR code for a URL as PNG bytes in memory."""
+    buffer = io.BytesIO()
+    make_qr_image(url, box_size).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+@lru_cache(maxsize=QR_CACHE_SIZE)
+def store_qr_png(store_id: int, base_url: str, box_size: int = QR_BOX_SIZE) -> Tuple[bytes, str]:
+    """Render the QR code linking to a store's dashboard, cached in memory.
+
+    Args:
+        store_id (int): Store the code links to.
+        base_url (str): Public base URL of the server, e.g. "http://10.0.0.5:8000".
+        box_size (int): Size in pixels of each QR module.
+
+    Returns:
+        Tuple[bytes, str]: PNG bytes and a quoted ETag derived from them.
+    """
+    png = render_qr_png(f"{base_url.rstrip('/')}/stores/{store_id}", box_size)
+    etag = '"' + hashlib.sha256(png).hexdigest()[:32] + '"'
+    return png, etag
+
+
+def _write_atomic(filename: str, write) -> None:
+    """Write a file through a temporary file in the same directory.
+
+    Readers never see a partially written file, and a crash leaves the
+    previous version in place.
+    """
+    directory = os.path.dirname(os.path.abspath(filename))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp_", suffix=os.path.basename(filename))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.replace(tmp_path, filename)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def write_qr_code(url: str, filename: str) -> str:
+    """Render a QR code PNG for a URL and atomically save it.
+
+    Args:
+        url (str): URL to encode.
+        filename (str): Destination PNG path.
+
+    Returns:
+        str: Digest of the rendered URL and settings.
+    """
+    image = make_qr_image(url)
+    _write_atomic(filename, lambda f: image.save(f, format="PNG"))
+    return qr_digest(url)
+
+
+def _load_manifest(path: str) -> Dict[str, str]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def generate_qr_codes(targets: Dict[str, str], qr_dir: str, max_workers: Optional[int] = None) -> Dict[str, float]:
+    """Bring a directory of QR code PNGs up to date.
+
+    A manifest in the directory records the digest each file was rendered
+    from. Files whose digest is unchanged are skipped; the rest are rendered
+    in a process pool and written atomically.
+
+    Args:
+        targets (Dict[str, str]): Mapping of PNG file name (inside qr_dir) to URL.
+        qr_dir (str): Directory holding the PNGs and the manifest.
+        max_workers (Optional[int]): Process pool size (defaults to CPU count).
+
+    Returns:
+        Dict[str, float]: Counts of total, generated and skipped files, and seconds taken.
+    """
+    start = time.perf_counter()
+    os.makedirs(qr_dir, exist_ok=True)
+    manifest_path = os.path.join(qr_dir, MANIFEST_NAME)
+    manifest = _load_manifest(manifest_path)
+
+    pending = {
+        name: url for name, url in targets.items()
+        if manifest.get(name) != qr_digest(url) or not os.path.exists(os.path.join(qr_dir, name))
+    }
+
+    if len(pending) > 1:
+        workers = min(len(pending), max_workers or os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                name: pool.submit(write_qr_code, url, os.path.join(qr_dir, name))
+                for name, url in pending.items()
+            }
+            for name, future in futures.items():
+                manifest[name] = future.result()
+    else:
+        for name, url in pending.items():
+            manifest[name] = write_qr_code(url, os.path.join(qr_dir, name))
+
+    if pending:
+        data = json.dumps(manifest, indent=2, sort_keys=True).encode("utf-8")
+        _write_atomic(manifest_path, lambda f: f.write(data))
+
+    return {
+        "total": len(targets),
+        "generated": len(pending),
+        "skipped": len(targets) - len(pending),
+        "seconds": time.perf_counter() - start,
+    }
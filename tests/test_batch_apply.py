@@ -0,0 +1,123 @@
+import pytest
+from src.database.database_sqlite import SQLiteDatabase
+from src.database.batch_apply import normalize_changes
+
+@pytest.fixture
+def db(tmp_path):
+    """Create a database with one medicine in store 1."""
+    db = SQLiteDatabase(str(tmp_path / "push.db"))
+    db.insert_medicine({"StoreID": 1, "Name": "Paracetamol", "Price": 1.0, "StockQuantity": 10})
+    return db
+
+def test_apply_sync_changes_groups_and_orders(db):
+    """Test that a mixed push is applied with parents before children."""
+    changes = [
+        {"seq": 1, "table": "PurchaseItem", "operation": "insert",
+         "data": {"PurchaseItemID": 50, "PurchaseID": 40, "MedicineID": 1, "Quantity": 2, "PricePerUnit": 1.0}},
+        {"seq": 2, "table": "Purchase", "operation": "insert",
+         "data": {"PurchaseID": 40, "DateOfPurchase": "2024-01-01", "TotalAmount": 2.0}},
+        {"seq": 3, "table": "Medicine", "operation": "update", "data": {"MedicineID": 1, "StockQuantity": 8}},
+        {"seq": 4, "table": "Medicine", "operation": "update", "data": {"MedicineID": 1, "StockQuantity": 7}},
+    ]
+    result = db.apply_sync_changes(1, changes)
+    assert result["applied"] == 4 and result["failed"] == 0
+    assert db.get_purchase({"PurchaseID": 40})[0]["StoreID"] == 1
+    assert db.get_medicine(condition={"MedicineID": 1})[0]["StockQuantity"] == 7
+
+    # Replaying the same push after a lost acknowledgement is harmless
+    assert db.apply_sync_changes(1, changes)["failed"] == 0
+    assert len(db.get_purchase_item({"PurchaseID": 40})) == 1
+
+def test_apply_sync_changes_reports_bad_rows(db):
+    """Test that invalid rows are reported without rolling back valid ones."""
+    changes = [
+        {"table": "Customer", "operation": "insert", "data": {"Name": "John"}},
+        {"table": "Customer", "operation": "insert", "data": {"Age": 30}},
+        {"table": "Store", "operation": "delete", "data": {"StoreID": 1}},
+        {"table": "Medicine", "operation": "update", "data": {"MedicineID": 1, "Colour": "red"}},
+    ]
+    result = db.apply_sync_changes(1, changes)
+    assert [r["status"] for r in result["results"]] == ["applied", "error", "error", "error"]
+    assert len(db.get_customer({"Name": "John"})) == 1
+
+def test_apply_sync_changes_is_store_scoped(db):
+    """Test that a store cannot change another store's rows."""
+    db.apply_sync_changes(2, [{"table": "Medicine", "operation": "delete", "data": {"MedicineID": 1}}])
+    assert len(db.get_medicine(condition={"MedicineID": 1})) == 1
+
+def test_insert_push_cannot_take_over_another_stores_row(db):
+    """Test that an insert whose ID belongs to another store is a conflict and changes nothing."""
+    db.apply_sync_changes(1, [{"table": "Purchase", "operation": "insert",
+                               "data": {"PurchaseID": 40, "DateOfPurchase": "2024-01-01", "TotalAmount": 2.0}}])
+    changes = [
+        {"seq": 1, "table": "Medicine", "operation": "insert",
+         "data": {"MedicineID": 1, "Name": "Hijacked", "Price": 0.01, "StockQuantity": 0}},
+        {"seq": 2, "table": "PurchaseItem", "operation": "insert",
+         "data": {"PurchaseItemID": 60, "PurchaseID": 40, "MedicineID": 1, "Quantity": 1, "PricePerUnit": 1.0}},
+        {"seq": 3, "table": "Customer", "operation": "insert", "data": {"CustomerID": 7, "Name": "Own"}},
+    ]
+    result = db.apply_sync_changes(2, changes)
+    assert [r["status"] for r in result["results"]] == ["conflict", "conflict", "applied"]
+    assert result["conflicts"] == 2 and result["failed"] == 2
+
+    medicine = db.get_medicine(condition={"MedicineID": 1})[0]
+    assert (medicine["StoreID"], medicine["Name"], medicine["Price"]) == (1, "Paracetamol", 1.0)
+    assert db.get_purchase_item({"PurchaseItemID": 60}) == []
+
+def test_push_cannot_point_rows_at_another_stores_rows(db):
+    """Test that inserted or updated foreign keys must name the pushing store's own rows."""
+    db.apply_sync_changes(1, [
+        {"table": "Customer", "operation": "insert", "data": {"CustomerID": 5, "Name": "Theirs"}},
+        {"table": "Purchase", "operation": "insert",
+         "data": {"PurchaseID": 40, "DateOfPurchase": "2024-01-01", "TotalAmount": 2.0}},
+    ])
+    db.apply_sync_changes(2, [
+        {"table": "Medicine", "operation": "insert",
+         "data": {"MedicineID": 2, "Name": "Ibuprofen", "Price": 1.0, "StockQuantity": 5}},
+        {"table": "Purchase", "operation": "insert",
+         "data": {"PurchaseID": 41, "DateOfPurchase": "2024-01-01", "TotalAmount": 1.0}},
+        {"table": "PurchaseItem", "operation": "insert",
+         "data": {"PurchaseItemID": 61, "PurchaseID": 41, "MedicineID": 2, "Quantity": 1, "PricePerUnit": 1.0}},
+    ])
+    changes = [
+        {"table": "PurchaseItem", "operation": "update", "data": {"PurchaseItemID": 61, "PurchaseID": 40}},
+        {"table": "PurchaseItem", "operation": "update", "data": {"PurchaseItemID": 61, "MedicineID": 1}},
+        {"table": "Purchase", "operation": "update", "data": {"PurchaseID": 41, "CustomerID": 5}},
+        {"table": "Purchase", "operation": "insert",
+         "data": {"PurchaseID": 42, "CustomerID": 5, "DateOfPurchase": "2024-01-02", "TotalAmount": 1.0}},
+        {"table": "PurchaseItem", "operation": "update", "data": {"PurchaseItemID": 61, "Quantity": 2}},
+    ]
+    result = db.apply_sync_changes(2, changes)
+    assert [r["status"] for r in result["results"]] == ["conflict", "conflict", "conflict", "conflict", "applied"]
+
+    item = db.get_purchase_item({"PurchaseItemID": 61})[0]
+    assert (item["PurchaseID"], item["MedicineID"], item["Quantity"]) == (41, 2, 2)
+    assert db.get_purchase({"PurchaseID": 41})[0]["CustomerID"] is None
+    assert db.get_purchase({"PurchaseID": 42}) == []
+
+def test_normalize_legacy_payload():
+    """Test conversion of per-table push payloads."""
+    changes = normalize_changes({"customers": [{"Name": "A"}, {"CustomerID": 3, "Name": "B"}]})
+    assert [c["operation"] for c in changes] == ["insert", "update"]
+
+def test_normalize_rejects_malformed_changes(db):
+    """Test that pushes which are not lists of table changes are refused before applying anything."""
+    for payload in ({"changes": "Customer"}, {"changes": {"table": "Customer"}}, {"changes": [1, 2]},
+                    {"changes": [{"operation": "insert"}]}, {"customers": [["Name", "A"]]}):
+        with pytest.raises(ValueError):
+            normalize_changes(payload)
+    result = db.apply_sync_changes(1, [{"table": "Customer", "operation": "insert", "data": [["Name", "A"]]}])
+    assert result["results"][0]["status"] == "error"
+
+def test_apply_stock_deltas_commute_and_dedupe(db):
+    """Test that stock movements add up and a replayed movement counts once."""
+    def movement(uid, delta, medicine_id=1):
+        return {"table": "StockMovement", "operation": "stock_delta",
+                "data": {"MovementUID": uid, "MedicineID": medicine_id, "Delta": delta, "Reason": "sale"}}
+
+    assert db.record_stock_movement(1, 1, 5, "receipt", reference="INV-7")
+    result = db.apply_sync_changes(1, [movement("a", -2), movement("b", -3), movement("c", -1, medicine_id=99)])
+    assert [r["status"] for r in result["results"]] == ["applied", "applied", "error"]
+    assert db.apply_sync_changes(1, [movement("b", -3)])["failed"] == 0
+    assert db.get_medicine(condition={"MedicineID": 1})[0]["StockQuantity"] == 10
+    assert db.apply_sync_changes(2, [movement("d", -1)])["failed"] == 1
@@ -0,0 +1,84 @@
+import importlib.util
+import io
+import json
+import os
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from src.database.catalog_import import import_catalog
+from src.database.database_sqlite import SQLiteDatabase
+
+CATALOG = b"""Barcode,Name,Price,Stock Quantity,requires_prescription,expiry_date
+8901,Paracetamol 500mg,2.5,40,no,2031-01-31
+8902,Amoxicillin 250mg,4.0,10,yes,2031-06-30
+8903,Broken,-3,1,no,
+,No barcode,1.0,1,no,
+8904,Cetirizine 10mg,1.2,0,no,
+"""
+
+def test_import_upserts_by_barcode_in_chunks(tmp_path):
+    """Test that a catalog is imported chunk by chunk with per-row errors and re-imports update in place."""
+    db = SQLiteDatabase(str(tmp_path / "catalog.db"))
+    progress = list(import_catalog(db.db_path, io.BytesIO(CATALOG), 1, "csv", chunk_size=2))
+
+    assert [p["chunk"] for p in progress] == [1, 2, 3]
+    assert {k: progress[-1][k] for k in ("rows", "inserted", "updated", "failed")} == \
+        {"rows": 5, "inserted": 3, "updated": 0, "failed": 2}
+    assert [(e["row"], e["barcode"]) for e in progress[1]["errors"]] == [(4, "8903"), (5, None)]
+    medicines = {m["Barcode"]: m for m in db.get_medicine(store_id=1)}
+    assert medicines["8901"]["StockQuantity"] == 40 and medicines["8902"]["RequiresPrescription"] == 1
+    # Opening stock is received through the ledger
+    assert db.get_stock_at(1, medicine_id=medicines["8901"]["MedicineID"])[0]["Quantity"] == 40
+
+    update = b"barcode,name,price,stock_quantity\n8901,Paracetamol 500mg tabs,2.75,999\n"
+    last = list(import_catalog(db.db_path, io.BytesIO(update), 1, "csv"))[-1]
+    assert (last["inserted"], last["updated"]) == (0, 1)
+    paracetamol = db.get_medicine(condition={"Barcode": "8901"})[0]
+    assert (paracetamol["Name"], paracetamol["Price"], paracetamol["StockQuantity"]) == \
+        ("Paracetamol 500mg tabs", 2.75, 40)
+
+    # Another store cannot take over the barcode
+    last = list(import_catalog(db.db_path, io.BytesIO(update), 2, "csv"))[-1]
+    assert last["failed"] == 1 and "store 1" in last["errors"][0]["error"]
+
+def _load_routes(name):
+    """Load one api/routes module without the package __init__, which imports every router."""
+    path = os.path.join(os.path.dirname(__file__), "..", "api", "routes", f"{name}.py")
+    spec = importlib.util.spec_from_file_location(f"routes_{name}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+@pytest.fixture
+def client(tmp_path):
+    """Serve the medicines routes over a temporary database."""
+    medicines = _load_routes("medicines")
+    db = SQLiteDatabase(str(tmp_path / "routes.db"))
+    app = FastAPI()
+    app.include_router(medicines.router)
+    app.dependency_overrides[medicines.get_db] = lambda: db
+    return TestClient(app)
+
+def test_import_endpoint_streams_progress(client):
+    """Test that /medicines/import streams one line per chunk, then a final summary line."""
+    response = client.post("/medicines/import", data={"store_id": 1, "chunk_size": 2},
+                           files={"file": ("catalog.csv", CATALOG, "text/csv")})
+    assert response.status_code == 200 and response.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line.get("chunk") for line in lines[:-1]] == [1, 2, 3]
+    assert lines[-1] == {"done": True, "rows": 5, "inserted": 3, "updated": 0, "failed": 2}
+
+def test_import_endpoint_rejects_unknown_and_corrupt_files(client):
+    """Test that an unknown extension is a 400 and a corrupt workbook ends with an error line."""
+    response = client.post("/medicines/import", data={"store_id": 1},
+                           files={"file": ("catalog.pdf", b"%PDF", "application/pdf")})
+    assert response.status_code == 400
+
+    pytest.importorskip("openpyxl")
+    response = client.post("/medicines/import", data={"store_id": 1},
+                           files={"file": ("catalog.xlsx", b"not a zip", "application/octet-stream")})
+    assert response.status_code == 200
+    last = json.loads(response.text.splitlines()[-1])
+    assert last["done"] is False and "xlsx" in last["error"]
@@ -0,0 +1,61 @@
+import pytest
+from src.database.database_sqlite import SQLiteDatabase
+
+@pytest.fixture
+def db(tmp_path):
+    """Create an empty database."""
+    return SQLiteDatabase(str(tmp_path / "changes.db"))
+
+def test_changes_after_cursor(db):
+    """Test that only changes of the store after the cursor are returned."""
+    db.insert_medicine({"StoreID": 1, "Name": "Paracetamol", "Price": 1.0, "StockQuantity": 5})
+    first = db.get_changes(1)
+    assert [c["operation"] for c in first["changes"]] == ["insert"]
+    assert first["changes"][0]["data"]["Name"] == "Paracetamol"
+
+    db.insert_customer({"StoreID": 1, "Name": "John"})
+    db.insert_customer({"StoreID": 2, "Name": "Jane"})
+    later = db.get_changes(1, cursor=first["cursor"])
+    assert [(c["table"], c["data"]["Name"]) for c in later["changes"]] == [("Customer", "John")]
+    assert db.get_changes(1, cursor=later["cursor"])["changes"] == []
+
+def test_changes_keep_latest_per_row(db):
+    """Test that a row inserted then deleted is reported once, as a delete."""
+    db.insert_medicine({"StoreID": 1, "Name": "Ibuprofen", "Price": 1.0, "StockQuantity": 5})
+    purchase_id = db.insert_purchase({"StoreID": 1, "DateOfPurchase": "2024-01-01", "TotalAmount": 2.0})
+    db.insert_purchase_item({"PurchaseID": purchase_id, "MedicineID": 1, "Quantity": 1, "PricePerUnit": 2.0})
+    db.delete_medicine({"MedicineID": 1})
+
+    changes = db.get_changes(1)["changes"]
+    assert [(c["table"], c["operation"]) for c in changes] == [
+        ("Purchase", "insert"), ("PurchaseItem", "insert"), ("Medicine", "delete")
+    ]
+    assert changes[-1]["data"] is None
+
+def test_changes_paging(db):
+    """Test paging through the log with has_more."""
+    for i in range(3):
+        db.insert_customer({"StoreID": 1, "Name": f"Customer {i}"})
+    page = db.get_changes(1, limit=2)
+    assert page["has_more"] and len(page["changes"]) == 2
+    rest = db.get_changes(1, cursor=page["cursor"], limit=2)
+    assert not rest["has_more"] and len(rest["changes"]) == 1
+
+def test_changes_skip_the_stores_own_pushes(db):
+    """Test that rows only the store itself pushed are not sent back, while the cursor moves on."""
+    db.insert_medicine({"StoreID": 1, "Name": "Aspirin", "Price": 1.0, "StockQuantity": 5})
+    cursor = db.get_changes(1)["cursor"]
+    db.apply_sync_changes(1, [
+        {"table": "Customer", "operation": "insert", "data": {"CustomerID": 7, "Name": "Pushed"}},
+        {"table": "Medicine", "operation": "update", "data": {"MedicineID": 1, "Price": 2.0}},
+    ])
+    assert db.get_changes(1, cursor=cursor)["changes"] == []
+    db.record_stock_movement(1, 1, 4, "receipt")
+
+    result = db.get_changes(1, cursor=cursor)
+    # The medicine was also changed on the server, so its current row is sent
+    assert [(c["table"], c["data"]["Price"], c["data"]["StockQuantity"]) for c in result["changes"]] == [
+        ("Medicine", 2.0, 9)
+    ]
+    assert db.get_changes(1, cursor=result["cursor"])["changes"] == []
+    assert db.get_changes(2)["changes"] == []
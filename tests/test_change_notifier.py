@@ -0,0 +1,38 @@
+import asyncio
+
+from src.database.database_sqlite import SQLiteDatabase
+from src.sync.notifier import ChangeNotifier
+
+def test_wait_wakes_on_new_changes(tmp_path):
+    """Test that waiters return at once, on new ChangeLog entries, or on timeout."""
+    db = SQLiteDatabase(str(tmp_path / "server.db"))
+    db.insert_customer({"StoreID": 1, "Name": "John"})
+    notifier = ChangeNotifier(db.db_path, poll_interval=0.05)
+
+    async def run():
+        assert await notifier.wait(1, 0, timeout=5) == 1
+        assert await notifier.wait(2, 0, timeout=0.1) == 0
+
+        waiter = asyncio.create_task(notifier.wait(1, 1, timeout=5))
+        await asyncio.sleep(0.1)
+        assert not waiter.done()
+        # A write from another connection is found by the watcher
+        await asyncio.to_thread(db.insert_customer, {"StoreID": 1, "Name": "Jane"})
+        return await asyncio.wait_for(waiter, timeout=2)
+
+    assert asyncio.run(run()) == 2
+
+def test_own_pushes_do_not_wake_the_store(tmp_path):
+    """Test that ChangeLog entries from a store's own push leave its waiters asleep."""
+    db = SQLiteDatabase(str(tmp_path / "server.db"))
+    notifier = ChangeNotifier(db.db_path, poll_interval=0.05)
+
+    async def run():
+        waiter = asyncio.create_task(notifier.wait(1, 0, timeout=0.3))
+        await asyncio.sleep(0.1)
+        await asyncio.to_thread(db.apply_sync_changes, 1, [
+            {"table": "Customer", "operation": "insert", "data": {"CustomerID": 7, "Name": "Pushed"}}
+        ])
+        return await waiter
+
+    assert asyncio.run(run()) == 0
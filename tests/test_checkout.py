@@ -0,0 +1,43 @@
+import threading
+
+from src.database.database_sqlite import SQLiteDatabase
+
+def test_checkout_is_atomic_and_reports_short_lines(tmp_path):
+    """Test that a basket is sold completely or not at all."""
+    db = SQLiteDatabase(str(tmp_path / "checkout.db"))
+    first = db.insert_medicine({"StoreID": 1, "Name": "Paracetamol", "Price": 2.0, "StockQuantity": 5})
+    second = db.insert_medicine({"StoreID": 1, "Name": "Ibuprofen", "Price": 3.0, "StockQuantity": 1})
+
+    result = db.checkout_purchase(1, [{"medicine_id": first, "quantity": 2}, {"medicine_id": second, "quantity": 2}])
+    assert result["purchase_id"] is None
+    assert result["failed"] == [{"index": 1, "medicine_id": second, "requested": 2, "available": 1}]
+    assert db.get_medicine(condition={"MedicineID": first})[0]["StockQuantity"] == 5
+
+    result = db.checkout_purchase(1, [{"medicine_id": first, "quantity": 2}, {"medicine_id": second, "quantity": 1},
+                                      {"medicine_id": first, "quantity": 1}])
+    assert result["failed"] == [] and result["total_amount"] == 9.0
+    assert db.get_medicine(condition={"MedicineID": first})[0]["StockQuantity"] == 2
+    assert len(db.get_purchase_item({"PurchaseID": result["purchase_id"]})) == 3
+    # Another store cannot sell this store's stock
+    assert db.checkout_purchase(2, [{"medicine_id": first, "quantity": 1}])["failed"]
+
+def test_concurrent_checkouts_never_oversell(tmp_path):
+    """Test that tills racing for the last units sell exactly the stock there is."""
+    db = SQLiteDatabase(str(tmp_path / "race.db"))
+    medicine_id = db.insert_medicine({"StoreID": 1, "Name": "Insulin", "Price": 10.0, "StockQuantity": 10})
+    results = []
+
+    def till():
+        for _ in range(3):
+            results.append(db.checkout_purchase(1, [{"medicine_id": medicine_id, "quantity": 1}]))
+
+    threads = [threading.Thread(target=till) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    sold = [r for r in results if r and r["purchase_id"]]
+    assert len(sold) == 10 and len(results) == 24
+    assert db.get_medicine(condition={"MedicineID": medicine_id})[0]["StockQuantity"] == 0
+    assert len(db.get_purchase({"StoreID": 1})) == 10
@@ -0,0 +1,58 @@
+import sqlite3
+
+import pytest
+from src.database.database_sqlite import SQLiteDatabase
+from src.utils.phone import phone_key, phone_key_sql
+
+@pytest.fixture
+def db(tmp_path):
+    """Create a database with customers in mixed phone formats."""
+    db = SQLiteDatabase(str(tmp_path / "customers.db"))
+    db.insert_customer({"StoreID": 1, "Name": "John Doe", "ContactInfo": "+1-555-0123"})
+    db.insert_customer({"StoreID": 1, "Name": "joanna Smith", "ContactInfo": "(555) 0456"})
+    db.insert_customer({"StoreID": 2, "Name": "John Other", "ContactInfo": "555 0123"})
+    db.insert_purchase({"StoreID": 1, "CustomerID": 1, "DateOfPurchase": "2024-01-05 10:00:00", "TotalAmount": 5})
+    db.insert_purchase({"StoreID": 1, "CustomerID": 1, "DateOfPurchase": "2024-03-01 09:30:00", "TotalAmount": 7})
+    return db
+
+def test_phone_key_ignores_formatting():
+    """Test that phone formats normalize to the same trailing digits."""
+    assert phone_key("+1-555-0123").startswith(phone_key("555 0123"))
+    assert phone_key("n/a") is None
+
+def test_lookup_by_phone_suffix(db):
+    """Test phone lookup by the last digits, scoped to the store."""
+    customers = db.lookup_customer(1, "0123")
+    assert [c["Name"] for c in customers] == ["John Doe"]
+    assert customers[0]["LastPurchaseDate"] == "2024-03-01 09:30:00"
+
+def test_lookup_by_name_prefix(db):
+    """Test case-insensitive name prefix lookup."""
+    customers = db.lookup_customer(1, "JO")
+    assert [c["Name"] for c in customers] == ["joanna Smith", "John Doe"]
+    assert customers[0]["LastPurchaseDate"] is None
+    assert db.lookup_customer(1, "jo", limit=1)[0]["Name"] == "joanna Smith"
+
+def test_phone_key_sql_matches_phone_key():
+    """Test that the SQL expression used by the triggers computes the same key."""
+    conn = sqlite3.connect(":memory:")
+    for value in ("+1-555-0123", "(555) 0456 ext. 12", "n/a", "", None, "9" * 60):
+        assert conn.execute(f"SELECT {phone_key_sql('v')} FROM (SELECT ? AS v)", (value,)).fetchone()[0] == phone_key(value)
+    conn.close()
+
+def test_phone_key_follows_every_write(db):
+    """Test that the triggers rekey a changed number, whoever writes it, without logging the rekey."""
+    conn = sqlite3.connect(db.db_path)
+    conn.execute("UPDATE Customer SET ContactInfo = '555-0999' WHERE CustomerID = 1")
+    conn.commit()
+    assert [c["Name"] for c in db.lookup_customer(1, "0999")] == ["John Doe"]
+    assert db.lookup_customer(1, "0123") == []
+
+    db.apply_sync_changes(1, [{"table": "Customer", "operation": "update",
+                               "data": {"CustomerID": 2, "ContactInfo": "555 0777", "PhoneKey": "1"}}])
+    assert [c["Name"] for c in db.lookup_customer(1, "0777")] == ["joanna Smith"]
+
+    operations = conn.execute("SELECT RowID, Operation FROM ChangeLog WHERE TableName = 'Customer' "
+                              "ORDER BY Seq").fetchall()
+    assert operations == [(1, "insert"), (2, "insert"), (3, "insert"), (1, "update"), (2, "update")]
+    conn.close()
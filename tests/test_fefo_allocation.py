@@ -0,0 +1,63 @@
+import sqlite3
+
+from src.database.database_sqlite import SQLiteDatabase
+
+def _store(db):
+    return db.insert_store({"StoreName": "Main", "Address": "Town", "LicenseNumber": "L-1"})
+
+def test_checkout_consumes_batches_first_expiry_first_out(tmp_path):
+    """Test that a sale takes the earliest unexpired batches and records them per line."""
+    db = SQLiteDatabase(str(tmp_path / "fefo.db"))
+    store_id = _store(db)
+    medicine_id = db.insert_medicine({"StoreID": store_id, "Name": "Amoxicillin", "Price": 1.0, "StockQuantity": 0})
+    batches = {}
+    for number, expiry in (("late", "2027-06-30"), ("early", "2026-11-30"), ("expired", "2026-01-31")):
+        batch_id = db.add_batch(store_id, f"INV-{number}", "Acme", number, 4, expiry, "Shelf A")
+        batches[number] = db.add_batch_item(batch_id, medicine_id, 4)
+
+    result = db.checkout_purchase(store_id, [{"medicine_id": medicine_id, "quantity": 3},
+                                             {"medicine_id": medicine_id, "quantity": 3}],
+                                  date_of_purchase="2026-10-19 10:00:00")
+    first, second = result["allocations"]
+    assert [(b["batch_item_id"], b["quantity"]) for b in first["batches"]] == [(batches["early"], 3)]
+    assert [(b["batch_item_id"], b["quantity"]) for b in second["batches"]] == [(batches["early"], 1),
+                                                                                 (batches["late"], 2)]
+    assert first["unbatched"] == second["unbatched"] == 0
+
+    conn = sqlite3.connect(db.db_path)
+    remaining = dict(conn.execute("SELECT BatchItemID, RemainingQuantity FROM BatchItem").fetchall())
+    assert remaining == {batches["early"]: 0, batches["late"]: 2, batches["expired"]: 4}
+    assert conn.execute("SELECT COUNT(*) FROM PurchaseItemBatch").fetchone()[0] == 3
+    # 6 units are on stock, but only the 2 on the late batch may be sold
+    result = db.checkout_purchase(store_id, [{"medicine_id": medicine_id, "quantity": 5}],
+                                  date_of_purchase="2026-10-19 11:00:00")
+    assert result["purchase_id"] is None
+    assert result["failed"] == [{"index": 0, "medicine_id": medicine_id, "requested": 5, "available": 2}]
+    assert db.get_medicine(store_id, {"MedicineID": medicine_id})[0]["StockQuantity"] == 6
+    assert conn.execute("SELECT RemainingQuantity FROM BatchItem WHERE BatchItemID = ?",
+                        (batches["late"],)).fetchone()[0] == 2
+
+    plan = " ".join(row[3] for row in conn.execute(
+        "EXPLAIN QUERY PLAN SELECT bi.BatchItemID FROM BatchItem bi JOIN Batch b ON b.BatchID = bi.BatchID "
+        "WHERE bi.MedicineID = 1 AND bi.ExpiryDate >= '2026-10-19' AND bi.RemainingQuantity > 0 AND b.StoreID = 1 "
+        "ORDER BY bi.ExpiryDate, bi.BatchItemID"
+    ))
+    assert "idx_batchitem_open_expiry" in plan and "TEMP B-TREE" not in plan
+    conn.close()
+
+
+def test_checkout_sells_unbatched_stock_beside_open_batches(tmp_path):
+    """Test that stock held on no batch line is sold once the open batches run out."""
+    db = SQLiteDatabase(str(tmp_path / "fefo.db"))
+    store_id = _store(db)
+    medicine_id = db.insert_medicine({"StoreID": store_id, "Name": "Ibuprofen", "Price": 1.0, "StockQuantity": 6})
+    batch_id = db.add_batch(store_id, "INV-1", "Acme", "open", 4, "2027-06-30", "Shelf A")
+    db.add_batch_item(batch_id, medicine_id, 4)
+
+    result = db.checkout_purchase(store_id, [{"medicine_id": medicine_id, "quantity": 5},
+                                             {"medicine_id": medicine_id, "quantity": 5}],
+                                  date_of_purchase="2026-10-19 10:00:00")
+    assert [(a["unbatched"], a["short"]) for a in result["allocations"]] == [(1, 0), (5, 0)]
+    result = db.checkout_purchase(store_id, [{"medicine_id": medicine_id, "quantity": 1}],
+                                  date_of_purchase="2026-10-19 11:00:00")
+    assert result["failed"][0]["available"] == 0
@@ -0,0 +1,57 @@
+import sqlite3
+
+import pytest
+from src.database.database_sqlite import SQLiteDatabase
+
+@pytest.fixture
+def db(tmp_path):
+    """Create a database with a small catalog in two stores."""
+    db = SQLiteDatabase(str(tmp_path / "search.db"))
+    medicines = [
+        (1, "Paracetamol 500mg", "Generic", "Pain Relief"),
+        (1, "Amoxicillin 250mg", "Generic", "Antibiotic"),
+        (1, "Panadol Extra", "GSK", "Pain Relief"),
+        (2, "Paracetamol 650mg", "Calpol", "Pain Relief"),
+    ]
+    for store_id, name, brand, medicine_type in medicines:
+        db.insert_medicine({
+            "StoreID": store_id,
+            "Name": name,
+            "Brand": brand,
+            "Type": medicine_type,
+            "Price": 1.0,
+            "StockQuantity": 10
+        })
+    return db
+
+def test_search_medicine_prefix(db):
+    """Test that partial words match medicine names."""
+    results = db.search_medicine("parac")
+    assert {r["Name"] for r in results} == {"Paracetamol 500mg", "Paracetamol 650mg"}
+
+def test_search_medicine_store_scope_and_limit(db):
+    """Test store scoping and result limits."""
+    results = db.search_medicine("pa", store_id=1)
+    assert all(r["StoreID"] == 1 for r in results)
+    assert len(db.search_medicine("pain", store_id=1, limit=1)) == 1
+
+def test_search_medicine_ranks_name_first(db):
+    """Test that name matches rank above type matches."""
+    db.insert_medicine({"StoreID": 1, "Name": "Pain Balm", "Type": "Topical", "Price": 1.0, "StockQuantity": 1})
+    results = db.search_medicine("pain", store_id=1)
+    assert results[0]["Name"] == "Pain Balm"
+
+def test_search_index_follows_updates(db):
+    """Test that the triggers keep the index in sync with Medicine."""
+    db.delete_medicine({"Name": "Panadol Extra"})
+    assert db.search_medicine("panadol") == []
+    assert db.search_medicine("") == []
+
+def test_search_index_follows_renames(db):
+    """Test that renaming a medicine drops its old name from the index and adds the new one."""
+    conn = sqlite3.connect(db.db_path)
+    conn.execute("UPDATE Medicine SET Name = 'Calpol Syrup' WHERE Name = 'Panadol Extra'")
+    conn.commit()
+    conn.close()
+    assert db.search_medicine("panadol") == []
+    assert [r["Name"] for r in db.search_medicine("calpol syr", store_id=1)] == ["Calpol Syrup"]
@@ -0,0 +1,87 @@
+import csv
+import gzip
+import importlib.util
+import io
+import os
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from src.database.database_sqlite import SQLiteDatabase
+from src.database.purchase_export import EXPORT_COLUMNS, export_formats, export_purchases
+
+def _sell(db, store_id, medicine_id, day):
+    return db.checkout_purchase(store_id, [{"medicine_id": medicine_id, "quantity": 1}],
+                                date_of_purchase=f"2026-{day} 09:30:00")["purchase_id"]
+
+def test_export_streams_filtered_gzipped_csv(tmp_path):
+    """Test that the export joins line items to purchases and applies store and date filters."""
+    db = SQLiteDatabase(str(tmp_path / "export.db"))
+    first = db.insert_medicine({"StoreID": 1, "Name": "Zinc, 20mg", "Price": 2.0, "StockQuantity": 10})
+    other = db.insert_medicine({"StoreID": 2, "Name": "Iron", "Price": 3.0, "StockQuantity": 10})
+    kept = [_sell(db, 1, first, "03-01"), _sell(db, 1, first, "03-31")]
+    _sell(db, 1, first, "04-01")
+    _sell(db, 2, other, "03-15")
+
+    data = b"".join(export_purchases(db.db_path, "csv", True, store_id=1, date_from="2026-03-01",
+                                     date_to="2026-03-31", chunk_size=1))
+    rows = list(csv.DictReader(io.StringIO(gzip.decompress(data).decode())))
+    assert [int(row["PurchaseID"]) for row in rows] == kept
+    assert rows[0]["MedicineName"] == "Zinc, 20mg" and float(rows[0]["LineTotal"]) == 2.0
+
+    # An empty export still has its header
+    data = b"".join(export_purchases(db.db_path, "csv", False, date_from="2030-01-01"))
+    assert data.decode().splitlines() == [",".join(name for name, _ in EXPORT_COLUMNS)]
+
+def test_export_parquet_row_groups(tmp_path):
+    """Test that a Parquet export written chunk by chunk reads back whole."""
+    pq = pytest.importorskip("pyarrow.parquet")
+    db = SQLiteDatabase(str(tmp_path / "parquet.db"))
+    medicine_id = db.insert_medicine({"StoreID": 1, "Name": "Folic acid", "Price": 1.0, "StockQuantity": 10})
+    for day in ("05-01", "05-02", "05-03"):
+        _sell(db, 1, medicine_id, day)
+
+    data = b"".join(export_purchases(db.db_path, "parquet", chunk_size=2))
+    table = pq.read_table(io.BytesIO(data))
+    assert table.num_rows == 3 and table.column("CustomerID").null_count == 3
+
+def _load_routes(name):
+    """Load one api/routes module without the package __init__, which imports every router."""
+    path = os.path.join(os.path.dirname(__file__), "..", "api", "routes", f"{name}.py")
+    spec = importlib.util.spec_from_file_location(f"routes_{name}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def test_export_endpoint_headers_and_formats(tmp_path):
+    """Test that /purchases/export names the file after its filters and serves each format."""
+    purchases = _load_routes("purchases")
+    db = SQLiteDatabase(str(tmp_path / "routes.db"))
+    medicine_id = db.insert_medicine({"StoreID": 3, "Name": "Zinc", "Price": 2.0, "StockQuantity": 5})
+    _sell(db, 3, medicine_id, "06-15")
+    app = FastAPI()
+    app.include_router(purchases.router)
+    app.dependency_overrides[purchases.get_db] = lambda: db
+    client = TestClient(app)
+
+    response = client.get("/purchases/export", params={"store_id": 3, "date_from": "2026-06-01",
+                                                       "date_to": "2026-06-30"})
+    assert response.status_code == 200 and response.headers["content-type"] == "application/gzip"
+    assert response.headers["content-disposition"] == \
+        'attachment; filename="purchases_store3_2026-06-01_2026-06-30.csv.gz"'
+    assert len(list(csv.DictReader(io.StringIO(gzip.decompress(response.content).decode())))) == 1
+
+    response = client.get("/purchases/export", params={"compress": "false"})
+    assert response.headers["content-type"].startswith("text/csv")
+    assert response.headers["content-disposition"] == 'attachment; filename="purchases.csv"'
+    assert response.text.splitlines()[0].startswith("PurchaseID,StoreID")
+
+    assert client.get("/purchases/export", params={"format": "xml"}).status_code == 422
+    assert client.get("/purchases/export", params={"date_from": "June"}).status_code == 422
+    response = client.get("/purchases/export", params={"format": "parquet"})
+    if "parquet" in export_formats():
+        assert response.headers["content-type"] == "application/vnd.apache.parquet"
+        assert response.headers["content-disposition"] == 'attachment; filename="purchases.parquet"'
+    else:
+        assert response.status_code == 400 and "pyarrow" in response.json()["detail"]
@@ -28,4 +28,31 @@ def test_generate_qr_code(tmp_path):
 def test_generate_qr_code_invalid_path():
     """Test QR code generation with invalid path."""
     with pytest.raises(Exception):
-        generate_qr_code("http://test.example.com", "/invalid/path/test.png") 
\ No newline at end of file
+        generate_qr_code("http://test.example.com", "/invalid/path/test.png")
+
+def test_generate_qr_codes_skips_unchanged(tmp_path):
+    """Test that only QR codes whose URL changed are regenerated."""
+    from src.utils.qr_codes import generate_qr_codes
+
+    targets = {
+        "store_1_qr.png": "http://test.example.com/stores/1",
+        "store_2_qr.png": "http://test.example.com/stores/2",
+    }
+    summary = generate_qr_codes(targets, str(tmp_path), max_workers=2)
+    assert summary["generated"] == 2
+    assert (tmp_path / "store_1_qr.png").stat().st_size > 0
+
+    targets["store_2_qr.png"] = "http://other.example.com/stores/2"
+    summary = generate_qr_codes(targets, str(tmp_path))
+    assert summary["generated"] == 1
+    assert summary["skipped"] == 1
+    assert not [p for p in tmp_path.iterdir() if p.name.startswith(".tmp_")]
+
+def test_store_qr_png_is_cached():
+    """Test in-memory QR rendering and its LRU cache."""
+    from src.utils.qr_codes import store_qr_png
+
+    png, etag = store_qr_png(1, "http://test.example.com/", 4)
+    assert png.startswith(b"\x89PNG")
+    assert store_qr_png(1, "http://test.example.com/", 4) == (png, etag)
+    assert store_qr_png(2, "http://test.example.com/", 4)[1] != etag
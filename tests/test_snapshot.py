@@ -0,0 +1,28 @@
+from src.database.database_sqlite import SQLiteDatabase
+from src.sync.outbox import SyncOutbox
+from src.sync.snapshot import build_snapshot, install_snapshot
+from src.sync.sync_state import SyncState
+
+def test_snapshot_installs_store_rows(tmp_path):
+    """Test that a snapshot only holds one store and keeps the local outbox on install."""
+    server = SQLiteDatabase(str(tmp_path / "server.db"))
+    server.insert_medicine({"StoreID": 1, "Name": "Paracetamol", "Price": 1.0, "StockQuantity": 5})
+    server.insert_medicine({"StoreID": 2, "Name": "Ibuprofen", "Price": 1.0, "StockQuantity": 5})
+    purchase_id = server.insert_purchase({"StoreID": 2, "DateOfPurchase": "2024-01-01", "TotalAmount": 1.0})
+    server.insert_purchase_item({"PurchaseID": purchase_id, "MedicineID": 2, "Quantity": 1, "PricePerUnit": 1.0})
+
+    snapshot = build_snapshot(server, 1, work_dir=str(tmp_path))
+    assert snapshot["cursor"] == 1
+    assert snapshot["tables"]["Medicine"] == 1 and snapshot["tables"]["PurchaseItem"] == 0
+
+    local_path = str(tmp_path / "store_1.db")
+    outbox = SyncOutbox(local_path)
+    outbox.append("Customer", "insert", {"Name": "Pending"})
+    SyncState(local_path).set("change_cursor", 0)
+
+    install_snapshot(snapshot["path"], local_path, snapshot["sha256"])
+    local = SQLiteDatabase(local_path)
+    assert [m["Name"] for m in local.get_medicine()] == ["Paracetamol"]
+    assert local.search_medicine("ibuprofen") == []
+    assert [c["data"]["Name"] for c in outbox.dequeue()] == ["Pending"]
+    assert outbox.append("Customer", "insert", {"Name": "Next"}) == 2
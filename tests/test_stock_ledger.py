@@ -0,0 +1,80 @@
+import sqlite3
+
+import pytest
+
+from src.database.database_sqlite import SQLiteDatabase
+from src.database.ledger import snapshot_if_due, stock_at
+
+def test_receipts_and_sales_build_per_batch_balances(tmp_path):
+    """Test that receipts and sales land in the ledger and the ledger cannot be rewritten."""
+    db = SQLiteDatabase(str(tmp_path / "ledger.db"))
+    store_id = db.insert_store({"StoreName": "Main", "Address": "Town", "LicenseNumber": "L-1"})
+    medicine_id = db.insert_medicine({"StoreID": store_id, "Name": "Cetirizine", "Price": 1.5, "StockQuantity": 0})
+    batch_id = db.add_batch(store_id, "INV-1", "Acme", "B1", 10, "2027-03-31", "Shelf B")
+    batch_item_id = db.add_batch_item(batch_id, medicine_id, 10)
+    assert db.get_medicine(condition={"MedicineID": medicine_id})[0]["StockQuantity"] == 10
+
+    db.checkout_purchase(store_id, [{"medicine_id": medicine_id, "quantity": 4}])
+    assert db.get_stock_at(store_id) == [{"MedicineID": medicine_id, "Quantity": 6}]
+    assert db.get_stock_at(store_id, by_batch=True) == [
+        {"MedicineID": medicine_id, "BatchItemID": batch_item_id, "Quantity": 6}
+    ]
+    assert db.get_stock_at(store_id, as_of="2000-01-01 00:00:00") == []
+
+    conn = sqlite3.connect(db.db_path)
+    with pytest.raises(sqlite3.IntegrityError, match="append-only"):
+        conn.execute("UPDATE StockMovement SET Delta = 0")
+    with pytest.raises(sqlite3.IntegrityError, match="append-only"):
+        conn.execute("DELETE FROM StockMovement")
+    conn.close()
+
+def test_point_in_time_reads_nearest_snapshot_and_tail(tmp_path):
+    """Test that balances from snapshots plus the ledger tail match a full replay."""
+    db = SQLiteDatabase(str(tmp_path / "history.db"))
+    medicine_id = db.insert_medicine({"StoreID": 1, "Name": "Omeprazole", "Price": 4.0, "StockQuantity": 0})
+    conn = sqlite3.connect(db.db_path, isolation_level=None)
+    for day in range(1, 31):
+        conn.execute(
+            "INSERT INTO StockMovement (MovementUID, StoreID, MedicineID, Delta, Reason, CreatedAt) "
+            "VALUES (?, 1, ?, ?, ?, ?)",
+            (f"m{day}", medicine_id, 10 if day % 3 else -7, "receipt" if day % 3 else "sale",
+             f"2026-09-{day:02d} 12:00:00")
+        )
+        conn.execute("BEGIN")
+        snapshot_if_due(conn, interval=7)
+        conn.execute("COMMIT")
+    # Snapshots were taken now, after every movement, so date them back for the test
+    conn.execute("UPDATE StockSnapshot SET TakenAt = "
+                 "(SELECT CreatedAt FROM StockMovement WHERE MovementID = AsOfMovementID)")
+    assert conn.execute("SELECT COUNT(*) FROM StockSnapshot").fetchone()[0] == 4
+
+    for day in (1, 6, 7, 15, 29, 30):
+        as_of = f"2026-09-{day:02d} 23:59:59"
+        replay = conn.execute("SELECT SUM(Delta) FROM StockMovement WHERE CreatedAt <= ?", (as_of,)).fetchone()[0]
+        assert stock_at(conn, 1, as_of) == [{"MedicineID": medicine_id, "Quantity": replay}]
+    conn.close()
+
+def test_direct_stock_writes_are_recorded_as_adjustments(tmp_path):
+    """Test that opening stock and pushed stock updates keep the ledger equal to StockQuantity."""
+    db = SQLiteDatabase(str(tmp_path / "adjust.db"))
+    medicine_id = db.insert_medicine({"StoreID": 1, "Name": "Ibuprofen", "Price": 2.0, "StockQuantity": 12})
+
+    def ledger_matches():
+        stock = db.get_medicine(condition={"MedicineID": medicine_id})[0]["StockQuantity"]
+        return db.get_stock_at(1, medicine_id=medicine_id) == [{"MedicineID": medicine_id, "Quantity": stock}]
+
+    assert ledger_matches()
+    db.checkout_purchase(1, [{"medicine_id": medicine_id, "quantity": 2}])
+    db.apply_sync_changes(1, [
+        {"seq": 1, "table": "Medicine", "operation": "update", "data": {"MedicineID": medicine_id, "StockQuantity": 25}},
+        {"seq": 2, "table": "StockMovement", "operation": "stock_delta",
+         "data": {"MovementUID": "s1", "MedicineID": medicine_id, "Delta": -5, "Reason": "sale"}},
+    ])
+    assert db.get_medicine(condition={"MedicineID": medicine_id})[0]["StockQuantity"] == 20
+    assert ledger_matches()
+
+    conn = sqlite3.connect(db.db_path)
+    reasons = conn.execute("SELECT Reason, Reference, Delta FROM StockMovement ORDER BY MovementID").fetchall()
+    conn.close()
+    assert reasons == [("adjustment", "opening", 12), ("sale", "purchase:1", -2),
+                       ("adjustment", "sync:store1", 15), ("sale", None, -5)]
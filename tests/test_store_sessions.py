@@ -0,0 +1,37 @@
+import time
+
+import jwt
+import pytest
+from src.sync.sessions import StoreSessionRegistry
+
+SECRET = "test-secret"
+
+def make_token(store_id, expires_in=60):
+    return jwt.encode({"store_id": store_id, "exp": int(time.time()) + expires_in}, SECRET, algorithm="HS256")
+
+def test_registry_caches_claims_and_tracks_sessions():
+    """Test that repeated tokens hit the cache and refresh the store's session."""
+    registry = StoreSessionRegistry(SECRET, "HS256", max_tokens=2)
+    registry.register(1, "Main Street")
+    token = make_token(1)
+    for _ in range(3):
+        assert registry.verify(token)["store_id"] == 1
+    stats = registry.stats()
+    assert stats["misses"] == 1 and stats["hits"] == 2
+
+    registry.verify(make_token(2))
+    registry.verify(make_token(3))
+    assert registry.stats()["evicted"] == 1 and registry.stats()["cached_tokens"] == 2
+    sessions = registry.sessions()
+    assert [s["store_id"] for s in sessions] == [3, 2, 1]
+    assert sessions[-1]["requests"] == 3 and sessions[-1]["store_name"] == "Main Street"
+
+def test_registry_rejects_bad_and_expired_tokens():
+    """Test that forged and expired tokens are never cached."""
+    registry = StoreSessionRegistry(SECRET, "HS256")
+    forged = jwt.encode({"store_id": 1, "exp": int(time.time()) + 60}, "other", algorithm="HS256")
+    with pytest.raises(jwt.InvalidTokenError):
+        registry.verify(forged)
+    with pytest.raises(jwt.ExpiredSignatureError):
+        registry.verify(make_token(1, expires_in=-1))
+    assert registry.stats()["cached_tokens"] == 0 and registry.stats()["rejected"] == 2
@@ -0,0 +1,16 @@
+from src.sync.benchmark import percentile, summarize
+
+def test_benchmark_summary():
+    """Test nearest-rank percentiles and per-endpoint error accounting."""
+    values = [float(n) for n in range(1, 101)]
+    assert (percentile(values, 50), percentile(values, 95), percentile(values, 99)) == (50.0, 95.0, 99.0)
+    assert percentile([], 50) is None
+
+    samples = [{"seconds": 0.01, "status": 200, "locked": False}] * 8 + [
+        {"seconds": 0.2, "status": 500, "locked": True},
+        {"seconds": 0.3, "status": 503, "locked": False},
+    ]
+    summary = summarize(samples, duration=2.0)
+    assert summary["count"] == 10 and summary["throughput_rps"] == 5.0
+    assert (summary["errors"], summary["lock_errors"], summary["busy"]) == (2, 1, 1)
+    assert summary["p50_ms"] == 10.0 and summary["max_ms"] == 300.0
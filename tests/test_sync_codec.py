@@ -0,0 +1,44 @@
+import gzip
+
+import pytest
+from src.sync import codec
+
+def _changes():
+    changes = []
+    for i in range(200):
+        changes.append({"seq": i, "table": "Medicine", "operation": "update",
+                        "data": {"MedicineID": i, "Name": f"Paracetamol {i}", "Stock": None}})
+        changes.append({"seq": i, "table": "Customer", "operation": "delete", "data": None})
+    # Partial update: a missing column must not come back as NULL
+    changes.append({"seq": 999, "table": "Medicine", "operation": "update", "data": {"MedicineID": 1, "Name": "X"}})
+    return changes
+
+def test_columnar_gzip_round_trip():
+    """Test that columnar gzip bodies decode to the original changes in order."""
+    payload = {"changes": _changes(), "cursor": 999, "has_more": False}
+    plain, _ = codec.encode_body(payload, codec.JSON)
+    body, encoding = codec.encode_body(payload, codec.COLUMNAR_JSON, compress=True)
+    assert encoding == "gzip"
+    assert len(body) < len(plain) / 5
+    assert codec.decode_body(body, codec.COLUMNAR_JSON, encoding) == payload
+
+def test_negotiate_falls_back_to_json():
+    """Test content negotiation with unknown and compact media types."""
+    assert codec.negotiate(None) == codec.JSON
+    assert codec.negotiate("text/html, */*") == codec.JSON
+    assert codec.negotiate(f"{codec.COLUMNAR_JSON}, application/json;q=0.5") == codec.COLUMNAR_JSON
+    assert codec.accepts_gzip("deflate, gzip;q=0.8")
+    with pytest.raises(codec.UnsupportedEncodingError):
+        codec.decode_body(b"{}", "text/csv")
+
+def test_decode_body_rejects_bombs_and_non_objects():
+    """Test that gzip bodies are inflated only up to the limit and non-object payloads are rejected."""
+    bomb = gzip.compress(b" " * 100000)
+    with pytest.raises(codec.BodyTooLargeError):
+        codec.decode_body(bomb, codec.JSON, "gzip", max_size=1000)
+    assert codec.decode_body(gzip.compress(b'{"changes": []}'), codec.JSON, "gzip", max_size=1000) == {"changes": []}
+    with pytest.raises(ValueError, match="truncated"):
+        codec.decode_body(gzip.compress(b'{"changes": []}')[:-8], codec.JSON, "gzip")
+    for body in (b"[1, 2]", b'"changes"', b'{"columnar": true}'):
+        with pytest.raises(ValueError):
+            codec.decode_body(body, codec.JSON)
@@ -0,0 +1,54 @@
+import sqlite3
+
+import pytest
+from src.database.database_sqlite import SQLiteDatabase
+from src.sync.conflicts import ConflictResolver
+from src.sync.outbox import SyncOutbox
+
+def _medicine(**values):
+    row = {"MedicineID": 1, "StoreID": 1, "Name": "Paracetamol", "Price": 2.0, "StockQuantity": 10}
+    row.update(values)
+    return row
+
+@pytest.fixture
+def store(tmp_path):
+    """Create a store database holding one medicine pulled from the server."""
+    path = str(tmp_path / "store.db")
+    db = SQLiteDatabase(path)
+    outbox = SyncOutbox(path)
+    resolver = ConflictResolver(path)
+    resolver.apply([{"seq": 1, "table": "Medicine", "row_id": 1, "operation": "insert",
+                     "changed_at": "2024-01-01 00:00:00", "data": _medicine()}])
+    return db, outbox, resolver
+
+def test_server_changes_applied_once(store):
+    """Test that a change without local edits is applied and replays are skipped."""
+    db, _, resolver = store
+    change = {"seq": 2, "table": "Medicine", "row_id": 1, "operation": "update",
+              "changed_at": "2024-01-02 00:00:00", "data": _medicine(Name="Paracetamol 500")}
+    assert resolver.apply([change])["applied"] == 1
+    assert resolver.apply([change])["skipped"] == 1
+    assert db.get_medicine(condition={"MedicineID": 1})[0]["Name"] == "Paracetamol 500"
+
+def test_conflicting_edits_merged_per_policy(store):
+    """Test additive stock, server-wins price and last-writer-wins name."""
+    db, outbox, resolver = store
+    # Locally: sold 3, changed price and renamed, all still waiting to be pushed
+    local = _medicine(Name="Local name", Price=2.5, StockQuantity=7)
+    conn = sqlite3.connect(db.db_path)
+    conn.execute("UPDATE Medicine SET Name = ?, Price = ?, StockQuantity = ? WHERE MedicineID = 1",
+                 (local["Name"], local["Price"], local["StockQuantity"]))
+    conn.commit()
+    conn.close()
+    outbox.append("Medicine", "update", local)
+
+    # Server: received 5 units and changed the price, earlier than the local edit
+    result = resolver.apply([{"seq": 3, "table": "Medicine", "row_id": 1, "operation": "update",
+                              "changed_at": "2024-01-01 00:00:01",
+                              "data": _medicine(Price=3.0, StockQuantity=15)}])
+    assert result["conflicts"] == 1 and result["resolutions"] == {"merged": 1}
+
+    row = db.get_medicine(condition={"MedicineID": 1})[0]
+    assert (row["Name"], row["Price"], row["StockQuantity"]) == ("Local name", 3.0, 12)
+    pending = outbox.dequeue()[0]["data"]
+    assert "Price" not in pending and pending["StockQuantity"] == 12
@@ -0,0 +1,69 @@
+import asyncio
+import json
+
+import httpx
+
+from src.sync import sync_engine
+from src.sync.sync_engine import AsyncSyncEngine
+
+def test_engine_from_env(monkeypatch, tmp_path):
+    """Test that the engine is only built when store mode settings are present."""
+    monkeypatch.delenv(sync_engine.ENV_STORE_ID, raising=False)
+    monkeypatch.delenv(sync_engine.ENV_SERVER_URL, raising=False)
+    assert AsyncSyncEngine.from_env() is None
+
+    monkeypatch.setenv(sync_engine.ENV_STORE_ID, "7")
+    monkeypatch.setenv(sync_engine.ENV_SERVER_URL, "http://127.0.0.1:9")
+    monkeypatch.setenv(sync_engine.ENV_LOCAL_DB, str(tmp_path / "store_7.db"))
+    monkeypatch.setenv(sync_engine.ENV_SYNC_INTERVAL, "60")
+    engine = AsyncSyncEngine.from_env()
+    assert engine.manager.store_id == "7" and engine.interval == 60
+    assert engine.status()["state"] == "stopped"
+
+def test_engine_stops_cleanly(tmp_path):
+    """Test that a failing engine backs off and cancels promptly on shutdown."""
+    db_path = str(tmp_path / "store.db")
+    engine = AsyncSyncEngine(
+        sync_engine.SyncManager("1", "http://127.0.0.1:9", db_path), interval=60, connect_timeout=0.2
+    )
+
+    async def run():
+        await engine.start()
+        await asyncio.sleep(0.5)
+        status = engine.status()
+        await engine.stop()
+        return status
+
+    status = asyncio.run(run())
+    assert status["state"] == "backoff" and status["failures"] >= 1
+    assert engine.status()["state"] == "stopped"
+
+def test_engine_pushes_and_pulls_through_the_manager(tmp_path):
+    """Test that the engine runs SyncManager's pull, then push, over its async client."""
+    manager = sync_engine.SyncManager("1", "http://server", str(tmp_path / "store.db"))
+    manager.sync_token, manager.change_cursor = "token", 1
+    manager.queue_change("Customer", "insert", {"CustomerID": 5, "Name": "Asha"})
+    pushed, paths = [], []
+
+    def handler(request):
+        paths.append(request.url.path)
+        if request.url.path == "/sync/push":
+            pushed.extend(json.loads(request.content)["changes"])
+            return httpx.Response(200, json={"results": [{"seq": 1, "status": "applied"}]})
+        return httpx.Response(200, json={"changes": [], "cursor": 9, "has_more": False})
+
+    engine = AsyncSyncEngine(manager)
+
+    async def run():
+        engine._loop = asyncio.get_running_loop()
+        engine._client = httpx.AsyncClient(base_url="http://server", transport=httpx.MockTransport(handler))
+        try:
+            return await engine.sync_once()
+        finally:
+            await engine._client.aclose()
+
+    assert asyncio.run(run())
+    assert paths == ["/sync/changes", "/sync/push"]
+    assert [c["data"]["Name"] for c in pushed] == ["Asha"]
+    assert manager.outbox.depth() == 0 and manager.change_cursor == 9
+    assert engine.status()["last_pushed"] == 1
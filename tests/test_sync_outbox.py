@@ -0,0 +1,113 @@
+import pytest
+from src.database.database_sqlite import ID_BLOCK_BITS, SQLiteDatabase
+from src.sync.outbox import SyncOutbox
+from src.sync.sync_manager import SyncManager
+
+@pytest.fixture
+def outbox(tmp_path):
+    """Create an outbox in a temporary store database."""
+    return SyncOutbox(str(tmp_path / "store_1.db"))
+
+def test_outbox_survives_reopen(outbox):
+    """Test that queued changes persist across instances."""
+    outbox.append("Medicine", "update", {"MedicineID": 1, "StockQuantity": 9})
+    reopened = SyncOutbox(outbox.db_path)
+    changes = reopened.dequeue()
+    assert len(changes) == 1
+    assert changes[0]["data"] == {"MedicineID": 1, "StockQuantity": 9}
+
+def test_outbox_batches_in_order_and_acks(outbox):
+    """Test batch dequeue by sequence number and ack-based deletion."""
+    seqs = [outbox.append("Purchase", "insert", {"n": i}) for i in range(5)]
+    batch = outbox.dequeue(limit=2)
+    assert [c["seq"] for c in batch] == seqs[:2]
+    assert outbox.ack(batch[-1]["seq"]) == 2
+    assert [c["data"]["n"] for c in outbox.dequeue()] == [2, 3, 4]
+
+    # Sequence numbers keep increasing after deletes
+    assert outbox.append("Purchase", "insert", {"n": 5}) > seqs[-1]
+
+def test_outbox_stats(outbox):
+    """Test the observable queue depth, age and size."""
+    assert outbox.stats()["depth"] == 0
+    assert outbox.stats()["oldest_age_seconds"] is None
+    outbox.append("Customer", "insert", {"Name": "John"})
+    stats = outbox.stats()
+    assert stats["depth"] == 1
+    assert stats["oldest_age_seconds"] >= 0
+    assert stats["size_bytes"] > 0
+    outbox.ack(stats["oldest_seq"])
+    outbox.compact()
+    assert outbox.stats()["depth"] == 0
+
+def test_outbox_coalesces_redundant_edits(outbox):
+    """Test that edits to one row merge and insert+delete pairs cancel out."""
+    outbox.append("Purchase", "insert", {"PurchaseID": 1, "Total": 10})
+    for qty in (9, 8, 7):
+        outbox.append("Medicine", "update", {"MedicineID": 5, "StockQuantity": qty})
+    outbox.append("PurchaseItem", "insert", {"PurchaseItemID": 3, "PurchaseID": 1})
+    outbox.append("Purchase", "update", {"PurchaseID": 1, "Total": 12})
+    outbox.append("Customer", "insert", {"CustomerID": 2, "Name": "John"})
+    outbox.append("Customer", "update", {"CustomerID": 2, "Phone": "555"})
+    last = outbox.append("Customer", "delete", {"CustomerID": 2})
+
+    changes, last_seq = outbox.dequeue_coalesced()
+    assert last_seq == last
+    assert [(c["table"], c["operation"]) for c in changes] == [
+        ("Purchase", "insert"), ("Medicine", "update"), ("PurchaseItem", "insert")
+    ]
+    assert changes[0]["data"] == {"PurchaseID": 1, "Total": 12}
+    assert changes[1]["data"] == {"MedicineID": 5, "StockQuantity": 7}
+
+    assert outbox.ack(last_seq) == 9
+    assert outbox.dequeue_coalesced() == ([], 0)
+
+def test_coalesced_batch_applies_with_interleaved_parents(outbox, tmp_path):
+    """Test that a child merged ahead of the parent it was moved to still applies on the server."""
+    purchase = {"DateOfPurchase": "2026-01-01", "TotalAmount": 1.0}
+    outbox.append("Purchase", "insert", {"PurchaseID": 40, **purchase})
+    outbox.append("PurchaseItem", "insert",
+                  {"PurchaseItemID": 50, "PurchaseID": 40, "MedicineID": 1, "Quantity": 1, "PricePerUnit": 1.0})
+    outbox.append("Purchase", "insert", {"PurchaseID": 41, **purchase})
+    outbox.append("PurchaseItem", "update", {"PurchaseItemID": 50, "PurchaseID": 41})
+    outbox.append("Purchase", "update", {"PurchaseID": 40, "TotalAmount": 0.0})
+
+    changes, _ = outbox.dequeue_coalesced()
+    assert [(c["table"], c["data"].get("PurchaseID")) for c in changes] == [
+        ("Purchase", 40), ("PurchaseItem", 41), ("Purchase", 41)
+    ]
+
+    server = SQLiteDatabase(str(tmp_path / "server.db"))
+    server.insert_medicine({"StoreID": 1, "Name": "Paracetamol", "Price": 1.0, "StockQuantity": 10})
+    result = server.apply_sync_changes(1, changes)
+    assert result["applied"] == 3, result["results"]
+    assert server.get_purchase_item({"PurchaseItemID": 50})[0]["PurchaseID"] == 41
+
+def test_store_ids_never_collide_and_rejections_are_kept(tmp_path):
+    """Test that store rows take IDs from the store's block and rejected pushes land in the dead-letter table."""
+    server = SQLiteDatabase(str(tmp_path / "server.db"))
+    manager = SyncManager("3", "http://server", str(tmp_path / "store_3.db"))
+    store = manager.local_db()
+    medicine_id = store.insert_medicine({"StoreID": 3, "Name": "Zinc", "Price": 1.0, "StockQuantity": 5})
+    purchase_id = store.checkout_purchase(3, [{"medicine_id": medicine_id, "quantity": 1}])["purchase_id"]
+    assert medicine_id == (3 << ID_BLOCK_BITS) + 1 and purchase_id == (3 << ID_BLOCK_BITS) + 1
+
+    # The server's own rows stay in block 0 after taking the store's rows
+    assert server.apply_sync_changes(3, [{"table": "Medicine", "operation": "insert", "data":
+                                          store.get_medicine(condition={"MedicineID": medicine_id})[0]}])["applied"] == 1
+    assert server.insert_medicine({"StoreID": 1, "Name": "Iron", "Price": 1.0, "StockQuantity": 0}) == 1
+
+    manager.queue_change("Customer", "insert", {"CustomerID": 7, "Name": "Asha"})
+    manager.queue_change("Customer", "insert", {"CustomerID": 8, "Name": "Ravi"})
+
+    class Response:
+        status_code = 200
+
+        def json(self):
+            return {"results": [{"index": 0, "status": "applied"},
+                                {"index": 1, "status": "conflict", "error": "owned by store 1"}]}
+
+    assert manager.push_outbox(lambda method, path, **kwargs: Response()) == 2
+    assert manager.outbox.depth() == 0
+    assert [(d["data"]["CustomerID"], d["status"]) for d in manager.outbox.dead_letters()] == [(8, "conflict")]
+    assert manager.get_queue_stats()["dead_letters"] == 1
@@ -0,0 +1,29 @@
+import pytest
+from src.database.database_sqlite import SQLiteDatabase
+
+def test_store_sync_status_from_counters(tmp_path):
+    """Test trigger-maintained row counts, recorded activity and the fleet ordering."""
+    db = SQLiteDatabase(str(tmp_path / "status.db"))
+    first = db.insert_store({"StoreName": "North", "Address": "1 Road", "LicenseNumber": "L1"})
+    second = db.insert_store({"StoreName": "South", "Address": "2 Road", "LicenseNumber": "L2"})
+    for name in ("A", "B", "C"):
+        db.insert_medicine({"StoreID": first, "Name": name, "Price": 1.0, "StockQuantity": 1})
+    db.insert_customer({"StoreID": first, "Name": "John"})
+    db.delete_medicine({"Name": "B"})
+
+    status = db.get_store_sync_status(first)
+    assert status["RowCounts"] == {"Medicine": 2, "Customer": 1, "Operator": 0, "Purchase": 0}
+    assert status["ChangeLag"] == status["LatestSeq"] > 0 and status.get("LastPullAt") is None
+
+    assert db.record_sync_activity(first, "pull", changes=3, bytes_out=120, cursor=status["LatestSeq"])
+    assert db.record_sync_activity(first, "push", changes=2, bytes_in=80, outbox_depth=5)
+    assert db.record_sync_activity(second, "push", error="boom")
+    status = db.get_store_sync_status(first)
+    assert status["ChangeLag"] == 0 and status["OutboxDepth"] == 5
+    assert (status["Pulls"], status["Pushes"], status["BytesIn"], status["BytesOut"]) == (1, 1, 80, 120)
+
+    assert [s["StoreID"] for s in db.get_fleet_sync_status("errors")] == [second, first]
+    assert db.get_fleet_sync_status("last_pull")[0]["StoreID"] == first
+    assert db.get_store_sync_status(999) is None
+    with pytest.raises(ValueError):
+        db.get_fleet_sync_status("name; DROP TABLE Store")
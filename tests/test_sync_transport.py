@@ -0,0 +1,67 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from src.sync.transport import CircuitOpenError, SyncTransport
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    """Answer 503 to the first request on each path, then 200; /broken always fails with 500."""
+    seen = set()
+
+    def do_GET(self):
+        status = 200 if self.path in self.seen else 503
+        if self.path == "/broken":
+            status = 500
+        self.seen.add(self.path)
+        body = b'{"ok": true}'
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def server_url():
+    """Start a local flaky HTTP server."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FlakyHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+def test_transport_retries_overload(server_url):
+    """Test that 503 responses are retried and latency is recorded."""
+    transport = SyncTransport(server_url, backoff_base=0.01)
+    response = transport.get("/sync/changes")
+    assert response.status_code == 200
+    stats = transport.stats.summary()
+    assert stats["requests"] == 2 and stats["retries"] == 1
+    assert stats["p50_ms"] is not None
+
+def test_circuit_opens_after_failures():
+    """Test that the circuit fails fast after consecutive connection failures."""
+    transport = SyncTransport("http://127.0.0.1:9", connect_timeout=0.2, max_retries=0,
+                              failure_threshold=2, reset_timeout=60)
+    for _ in range(2):
+        with pytest.raises(Exception):
+            transport.get("/sync/changes")
+    assert transport.circuit_state == "open"
+    with pytest.raises(CircuitOpenError):
+        transport.get("/sync/changes")
+
+def test_server_errors_open_circuit_and_half_open_admits_one_trial(server_url):
+    """Test that any 5xx counts as a failure and a half-open circuit lets one call through."""
+    transport = SyncTransport(server_url, failure_threshold=2, reset_timeout=60)
+    for _ in range(2):
+        assert transport.get("/broken").status_code == 500
+    assert transport.circuit_state == "open" and transport.stats.summary()["retries"] == 0
+
+    transport.reset_timeout = 0
+    assert transport.circuit_state == "half_open"
+    assert transport._admit() is True
+    with pytest.raises(CircuitOpenError):
+        transport.get("/sync/changes")
+    transport._record_outcome(True)
+    assert transport.circuit_state == "closed"
@@ -0,0 +1,40 @@
+import asyncio
+
+import pytest
+from src.database.database_sqlite import SQLiteDatabase
+from src.database.sync_writer import SyncWriter, WriterBusyError
+
+def test_concurrent_pushes_group_commit(tmp_path):
+    """Test that concurrent pushes are all applied through few commits."""
+    db = SQLiteDatabase(str(tmp_path / "server.db"))
+    writer = SyncWriter(db.db_path)
+
+    async def run():
+        pushes = [
+            writer.submit(store_id, [{"table": "Customer", "operation": "insert", "data": {"Name": f"C{store_id}-{i}"}}
+                                     for i in range(50)])
+            for store_id in range(1, 21)
+        ]
+        return await asyncio.gather(*pushes)
+
+    results = asyncio.run(run())
+    writer.stop()
+    assert all(r["applied"] == 50 for r in results)
+    assert len(db.get_customer({"StoreID": 7})) == 50
+    stats = writer.stats()
+    assert stats["pushes"] == 20 and stats["groups"] < 20
+
+def test_full_queue_is_refused(tmp_path):
+    """Test backpressure when the queue is full."""
+    writer = SyncWriter(str(tmp_path / "server.db"), max_queue=1)
+    writer.start = lambda: None  # keep the writer thread from draining the queue
+
+    async def run():
+        first = asyncio.ensure_future(writer.submit(1, []))
+        await asyncio.sleep(0)
+        with pytest.raises(WriterBusyError):
+            await writer.submit(1, [])
+        first.cancel()
+
+    asyncio.run(run())
+    assert writer.stats()["rejected"] == 1